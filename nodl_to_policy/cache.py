@@ -0,0 +1,120 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pathlib
+import secrets
+import stat
+from typing import Optional
+
+
+# not to translate line endings on Windows
+_O_BINARY = getattr(os, 'O_BINARY', 0)
+
+
+def get_cache_directory() -> pathlib.Path:
+    """
+    Return the directory under which `nodl_to_policy` keeps its on-disk caches.
+
+    This follows the XDG base directory specification, i.e. `$XDG_CACHE_HOME/nodl_to_policy`,
+    falling back to `~/.cache/nodl_to_policy`.
+
+    :return: Path of the cache directory, which may not exist yet.
+    :rtype: pathlib.Path
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache'
+    return pathlib.Path(cache_home) / 'nodl_to_policy'
+
+
+def write_atomically(path: pathlib.Path, data: bytes) -> None:
+    """
+    Write `data` to `path` so that readers only ever see the old or the complete new content.
+
+    Replaced files keep their mode, and new files are created with the mode `open` would give
+    them, i.e. readable by others unless the umask says otherwise.
+
+    :param path: Path of the file to (over)write, parent directories are created if needed.
+    :type path: pathlib.Path
+    :param data: Content of the file.
+    :type data: bytes
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        mode: Optional[int] = stat.S_IMODE(path.stat().st_mode)
+    except FileNotFoundError:
+        mode = None
+    while True:
+        temporary_path = str(path.parent / f'.{path.name}.{secrets.token_hex(8)}.tmp')
+        try:
+            # unlike `tempfile.mkstemp`, which creates files only readable by their owner, this
+            # lets the umask apply to new files
+            file_descriptor = os.open(
+                temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _O_BINARY, 0o666)
+        except FileExistsError:
+            continue
+        break
+    try:
+        with os.fdopen(file_descriptor, 'wb') as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(temporary_path, mode)
+        os.replace(temporary_path, str(path))
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def evict_least_recently_used(directory: pathlib.Path, pattern: str, max_size: int) -> int:
+    """
+    Remove the least recently used entries of a cache until it fits in its maximum size.
+
+    Entries are files whose modification time is touched whenever they are used. Entries which
+    cannot be removed, e.g. with a read-only cache directory, are skipped.
+
+    :param directory: Directory of the cache.
+    :type directory: pathlib.Path
+    :param pattern: Glob pattern of the entries under `directory`, e.g. "*/*.nodes.pickle".
+    :type pattern: str
+    :param max_size: Size in bytes above which least recently used entries are removed.
+    :type max_size: int
+    :return: The number of entries removed.
+    :rtype: int
+    """
+    entries = []
+    try:
+        entry_paths = list(directory.glob(pattern))
+    except OSError:
+        return 0
+    for entry_path in entry_paths:
+        try:
+            status = entry_path.stat()
+        except OSError:
+            continue
+        entries.append((status.st_mtime_ns, status.st_size, entry_path))
+
+    size = sum(entry_size for _, entry_size, _ in entries)
+    removed_count = 0
+    for _, entry_size, entry_path in sorted(entries):
+        if size <= max_size:
+            break
+        try:
+            entry_path.unlink()
+        except FileNotFoundError:
+            # removed concurrently by another conversion
+            pass
+        except OSError:
+            continue
+        size -= entry_size
+        removed_count += 1
+    return removed_count
@@ -0,0 +1,120 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Client of the `nodl_to_policy` daemon, see `nodl_to_policy.daemon`.
+
+Requests and responses are single lines of JSON exchanged over a local Unix socket. This module
+only depends on the standard library, so that asking a running daemon for a policy does not pay
+for importing `nodl`, `sros2` or `lxml`.
+"""
+
+import json
+import os
+import pathlib
+import socket
+from typing import Any, Dict, Iterable, Optional
+
+from nodl_to_policy.cache import get_cache_directory
+
+
+# bumped on incompatible changes of the request/response format
+PROTOCOL_VERSION = 1
+
+# seconds to wait for the daemon at each step of a request, after which the caller converts in
+# process, e.g. while the daemon serves another client
+DEFAULT_TIMEOUT = 60.0
+
+_SOCKET_FILE_NAME = 'nodl_to_policy.sock'
+
+
+class DaemonError(Exception):
+    """Error reported by the daemon while handling a request."""
+
+
+def get_socket_path() -> pathlib.Path:
+    """
+    Return the default path of the daemon's Unix socket.
+
+    The socket lives in `$XDG_RUNTIME_DIR` if set, and in the cache directory otherwise.
+
+    :return: Path of the socket, which may not exist.
+    :rtype: pathlib.Path
+    """
+    runtime_directory = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_directory:
+        return pathlib.Path(runtime_directory) / _SOCKET_FILE_NAME
+    return get_cache_directory() / _SOCKET_FILE_NAME
+
+
+def request_policy(
+    nodl_file_paths: Iterable[pathlib.Path], validate: str = 'full', *,
+    socket_path: Optional[pathlib.Path] = None, timeout: float = DEFAULT_TIMEOUT
+) -> Optional[str]:
+    """
+    Ask a running daemon to convert NoDL files into a policy.
+
+    :param nodl_file_paths: Paths of the NoDL files to convert.
+    :type nodl_file_paths: Iterable[pathlib.Path]
+    :param validate: One of `nodl_to_policy.policy.VALIDATION_MODES`.
+    :type validate: str
+    :param socket_path: Path of the daemon's socket, `get_socket_path()` by default.
+    :type socket_path: Optional[pathlib.Path]
+    :param timeout: Seconds to wait for the daemon to accept the request, and to respond.
+    :type timeout: float
+    :return: The policy, as written by `nodl_to_policy.policy.write_policy`, or `None` if no
+        compatible daemon is listening, or it does not respond in time.
+    :rtype: Optional[str]
+    :raises DaemonError: If the daemon failed to convert the files.
+    """
+    response = _send_request({
+        'command': 'convert',
+        'nodl_files': [str(path.resolve()) for path in nodl_file_paths],
+        'validate': validate,
+    }, socket_path, timeout)
+    if response is None:
+        return None
+    return response['policy']
+
+
+def _send_request(
+    request: Dict[str, Any], socket_path: Optional[pathlib.Path],
+    timeout: float = DEFAULT_TIMEOUT
+) -> Optional[Dict[str, Any]]:
+    """
+    Send a request to the daemon.
+
+    Return `None` if there is no compatible daemon, or it cannot be reached in time, e.g. a stale
+    socket or a daemon stuck on another client.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    with connection:
+        try:
+            connection.connect(str(socket_path or get_socket_path()))
+            connection.sendall(
+                json.dumps({'version': PROTOCOL_VERSION, **request}).encode() + b'\n')
+            with connection.makefile('rb') as stream:
+                line = stream.readline()
+        except OSError:  # `socket.timeout` included
+            return None
+    if not line:
+        raise DaemonError('The daemon closed the connection without responding')
+    response = json.loads(line)
+    if response.get('version') != PROTOCOL_VERSION:
+        # a daemon of another version of this package, which the caller can do without
+        return None
+    if 'error' in response:
+        raise DaemonError(response['error'])
+    return response
@@ -12,7 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import List
+from types import MappingProxyType
+from typing import List, Mapping, Optional, Tuple
 
 from lxml import etree
 try:
@@ -21,6 +22,17 @@ except ModuleNotFoundError:
     import importlib_resources  # type: ignore
 
 
+# `(item_type, role)` buckets granted by the common profile, in the order they are applied
+COMMON_ROLES = (
+    ('topics', 'subscribe'),
+    ('topics', 'publish'),
+    ('services', 'reply'),
+    ('services', 'request'),
+)
+
+_common_items: Optional[Mapping[Tuple[str, str], Tuple[str, ...]]] = None
+
+
 # TODO(aprotyas): For now, only use `node.xml`, since NoDL does not describe Lifecycle nodes
 def common_profile() -> etree._ElementTree:
     return _get_profile('node.xml')
@@ -42,6 +54,36 @@ def common_request_services() -> List:
     return _get_items_by_role('services', 'request')
 
 
+def common_items() -> Mapping[Tuple[str, str], Tuple[str, ...]]:
+    """Return the common item names keyed by `(item_type, role)`, parsing the profile once."""
+    if _common_items is None:
+        return reload_common_profile()
+    return _common_items
+
+
+def common_item_names(item_type: str, role: str) -> Tuple[str, ...]:
+    """Return the cached common `item_type` names allowed for `role`, if any."""
+    return common_items().get((item_type, role), ())
+
+
+def reload_common_profile() -> Mapping[Tuple[str, str], Tuple[str, ...]]:
+    """Parse the common profile from disk again and replace the cached item names."""
+    global _common_items
+    profile = common_profile()
+    _common_items = MappingProxyType({
+        (item_type, role): tuple(
+            item.text for item in _get_items_by_role(item_type, role, profile=profile))
+        for item_type, role in COMMON_ROLES
+    })
+    return _common_items
+
+
+def invalidate_common_profile() -> None:
+    """Drop the cached common profile, so that the next lookup parses it again."""
+    global _common_items
+    _common_items = None
+
+
 def _get_profile(filename: str) -> etree._ElementTree:
     with importlib_resources.path('nodl_to_policy.common', filename) as path:
         profile = etree.parse(str(path))
@@ -49,13 +91,17 @@ def _get_profile(filename: str) -> etree._ElementTree:
     return profile
 
 
-def _get_items_by_role(item_type: str, role: str) -> List[etree._ElementTree]:
+def _get_items_by_role(
+    item_type: str, role: str, profile: Optional[etree._ElementTree] = None
+) -> List[etree._ElementTree]:
     items_list: List[etree._ElementTree] = []
     # Terminate the function for empty queries, prevents predicate errors in the find operation
     if not item_type or not role:
         return items_list
+    if profile is None:
+        profile = common_profile()
     # Find `item_type` (topic/service) tags with an allowed `role` (pub/sub/reply/req) attribute
-    for items in common_profile().findall(f'{item_type}[@{role}="ALLOW"]'):
+    for items in profile.findall(f'{item_type}[@{role}="ALLOW"]'):
         # Child tags are: topics -> topic, services -> service
         for item in items.iter(item_type[:-1]):
             items_list.append(item)
@@ -0,0 +1,175 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Compaction of policy expressions into wildcard patterns.
+
+Each name of a permissions tag is a rule of the DDS permissions documents generated from the
+policy, which the security plugins match one by one when participants discover each other. Names
+sharing a prefix, e.g. "~/sensors/imu" and "~/sensors/lidar", can be folded into a single
+fnmatch-style pattern, e.g. "~/sensors/*", as `sros2` policies allow.
+
+A pattern allows any name it matches, including names the node was not granted. The only names
+known to exist are those of the policy itself, so a pattern is only used if it matches at most
+`budget` names of the policy that its permissions tag did not allow, i.e. exact covers only by
+default.
+"""
+
+import bisect
+from typing import Dict, List, Set
+
+from lxml import etree
+
+from nodl_to_policy.stats import add_to_counter, measure_phase
+
+
+_PERMISSION_TYPES = {'topics': 'topic', 'services': 'service', 'actions': 'action'}
+
+# names of the topics and services `sros2` grants for each action, e.g. "<action>/_action/status"
+_ACTION_NAME_SUFFIXES = {
+    'topic': ('/_action/feedback', '/_action/status'),
+    'service': ('/_action/cancel_goal', '/_action/get_result', '/_action/send_goal'),
+}
+
+# characters making an expression an fnmatch pattern rather than a name
+_WILDCARD_CHARACTERS = frozenset('*?[')
+
+
+def compact_policy(policy: etree._Element, budget: int = 0) -> int:
+    """
+    Fold the names of each "ALLOW" permissions tag of a policy into wildcard patterns.
+
+    Names are folded into the shortest pattern "<prefix>/*" matching at least two of them, such
+    that the pattern matches at most `budget` names of the policy not allowed by the tag.
+    Permissions tags denying names are left untouched, as are existing patterns and XIncludes,
+    e.g. of the common profile.
+
+    :param policy: LXML Element representing a "policy" tag, modified in place.
+    :type policy: etree._Element
+    :param budget: How many names of the policy a pattern may allow beyond those it replaces.
+    :type budget: int
+    :return: How many expression tags were removed from the policy.
+    :rtype: int
+    :raises ValueError: If `budget` is negative.
+    """
+    if budget < 0:
+        raise ValueError(f'Invalid over-permission budget {budget}')
+
+    with measure_phase('compact'):
+        profiles = policy.findall('enclaves/enclave/profiles/profile')
+        # permission type -> sorted fully qualified names of the policy
+        known_names = {
+            permission_type: sorted(names)
+            for permission_type, names in _get_qualified_names(profiles).items()
+        }
+
+        removed_count = 0
+        for profile in profiles:
+            for permissions in profile:
+                permission_type = _PERMISSION_TYPES.get(permissions.tag)
+                if permission_type is None or 'DENY' in permissions.attrib.values():
+                    continue
+                removed_count += _compact_permissions(
+                    permissions, profile.get('ns', '/'), profile.get('node', ''),
+                    known_names[permission_type], budget)
+        add_to_counter('expressions_removed', removed_count)
+    return removed_count
+
+
+def _compact_permissions(
+    permissions: etree._Element, ns: str, node_name: str, known_names: List[str], budget: int
+) -> int:
+    """Fold the names of a permissions tag into patterns, returning how many tags were removed."""
+    # fully qualified name -> expression tag, for the names (not patterns) of the tag
+    elements = {
+        _qualify(element.text, ns, node_name): element
+        for element in permissions if not _is_pattern(element.text)
+    }
+    existing_patterns = {element.text for element in permissions if _is_pattern(element.text)}
+
+    # candidate prefixes, e.g. "~/sensors/" and "~/" for "~/sensors/imu", shortest first
+    prefixes: Set[str] = set()
+    for element in elements.values():
+        expression = element.text
+        separator = expression.rfind('/')
+        while separator >= 0:
+            prefixes.add(expression[:separator + 1])
+            separator = expression.rfind('/', 0, separator)
+        if not expression.startswith(('~', '/')):
+            prefixes.add('')  # names relative to the node's namespace
+
+    removed_count = 0
+    folded: Set[str] = set()
+    for prefix in sorted(prefixes, key=len):
+        qualified_prefix = _qualify(prefix, ns, node_name).rstrip('/') + '/'
+        matched = [name for name in elements if name.startswith(qualified_prefix)]
+        remaining = [name for name in matched if name not in folded]
+        if len(remaining) < 2:
+            continue
+        # the names of the policy under the prefix are a contiguous slice of the sorted names,
+        # "0" being the character following "/"
+        known_count = bisect.bisect_left(known_names, qualified_prefix[:-1] + '0') - \
+            bisect.bisect_left(known_names, qualified_prefix)
+        if known_count - len(matched) > budget:
+            continue
+
+        pattern = prefix + '*'
+        first_element = elements[remaining[0]]
+        if pattern in existing_patterns:
+            permissions.remove(first_element)
+            removed_count += 1
+        else:
+            first_element.text = pattern
+            existing_patterns.add(pattern)
+        for name in remaining[1:]:
+            permissions.remove(elements[name])
+        removed_count += len(remaining) - 1
+        folded.update(remaining)
+    return removed_count
+
+
+def _get_qualified_names(profiles: List[etree._Element]) -> Dict[str, Set[str]]:
+    """Return the fully qualified names of the profiles, by permission type, actions included."""
+    names: Dict[str, Set[str]] = {
+        permission_type: set() for permission_type in _PERMISSION_TYPES.values()}
+    for profile in profiles:
+        ns = profile.get('ns', '/')
+        node_name = profile.get('node', '')
+        for permissions in profile:
+            permission_type = _PERMISSION_TYPES.get(permissions.tag)
+            if permission_type is None:
+                continue
+            names[permission_type].update(
+                _qualify(element.text, ns, node_name)
+                for element in permissions if not _is_pattern(element.text))
+    # actions are topics and services in the DDS permissions, which patterns must not match either
+    for permission_type, suffixes in _ACTION_NAME_SUFFIXES.items():
+        names[permission_type].update(
+            action_name + suffix for action_name in names['action'] for suffix in suffixes)
+    return names
+
+
+def _qualify(expression: str, ns: str, node_name: str) -> str:
+    """Return the fully qualified name of a policy expression, e.g. "/ns/node/foo" for "~/foo"."""
+    if expression.startswith('~'):
+        return f'{ns.rstrip("/")}/{node_name}{expression[1:]}'
+    if expression.startswith('/'):
+        return expression
+    return f'{ns.rstrip("/")}/{expression}'
+
+
+def _is_pattern(expression: str) -> bool:
+    """Return whether a policy expression is an fnmatch pattern."""
+    return not _WILDCARD_CHARACTERS.isdisjoint(expression)
@@ -0,0 +1,185 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Long-running server answering the convert requests of `nodl_to_policy.client`.
+
+The server keeps the common profile, the compiled policy stylesheet and schema, and the parsed
+NoDL files warm between requests, so that repeated conversions only pay for the work that
+changed. It listens on a Unix socket only accessible to the user running it.
+"""
+
+import io
+import json
+import os
+import pathlib
+import signal
+import socket
+import socketserver
+from typing import Any, Dict, List, Tuple
+
+from nodl.types import Node
+from nodl_to_policy.client import PROTOCOL_VERSION
+from nodl_to_policy.common.profile import common_items
+from nodl_to_policy.description import parse_nodl_files
+from nodl_to_policy.policy import (
+    _get_policy_schema,
+    _get_policy_transform,
+    convert_to_policy,
+    write_policy,
+)
+
+
+class PolicyServer(socketserver.UnixStreamServer):
+    """Unix socket server converting NoDL files into policies, one request at a time."""
+
+    def __init__(self, socket_path: pathlib.Path) -> None:
+        """
+        Bind the server to a socket, replacing the socket of a daemon that is no longer running.
+
+        :param socket_path: Path of the Unix socket to listen on.
+        :type socket_path: pathlib.Path
+        :raises RuntimeError: If another daemon is already listening on `socket_path`.
+        """
+        self.socket_path = socket_path
+        # resolved path -> (modification time, size, parsed nodes)
+        self._nodl_cache: Dict[str, Tuple[int, int, List[Node]]] = {}
+        _remove_stale_socket(socket_path)
+        socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        super().__init__(str(socket_path), _RequestHandler)
+
+    def server_bind(self) -> None:
+        """Bind the socket so that only its owner may connect to it."""
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def server_close(self) -> None:
+        """Close the socket, and remove it from the file system."""
+        super().server_close()
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def warm_up(self) -> None:
+        """Load the common profile, and compile the policy stylesheet and schema."""
+        common_items()
+        _get_policy_transform()
+        _get_policy_schema()
+
+    def respond(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Handle a request, returning the response to send back.
+
+        :param request: The decoded request.
+        :type request: Dict[str, Any]
+        :return: The response, with either a 'policy' or an 'error' entry.
+        :rtype: Dict[str, Any]
+        """
+        if request.get('version') != PROTOCOL_VERSION:
+            return {'error': f'Unsupported protocol version {request.get("version")}'}
+        if request.get('command') != 'convert':
+            return {'error': f'Unknown command {request.get("command")}'}
+        try:
+            return {'policy': self.convert(
+                [pathlib.Path(path) for path in request['nodl_files']],
+                request.get('validate', 'full'))}
+        except Exception as e:  # noqa: B902
+            # report any failure to the client, rather than dropping the connection
+            return {'error': str(e) or type(e).__name__}
+
+    def convert(self, nodl_file_paths: List[pathlib.Path], validate: str) -> str:
+        """
+        Convert NoDL files into a policy, reusing the nodes of files unchanged since last parsed.
+
+        :param nodl_file_paths: Paths of the NoDL files to convert.
+        :type nodl_file_paths: List[pathlib.Path]
+        :param validate: One of `nodl_to_policy.policy.VALIDATION_MODES`.
+        :type validate: str
+        :return: The policy, as written by `write_policy`.
+        :rtype: str
+        """
+        nodl_description = []
+        for path in nodl_file_paths:
+            nodl_description.extend(self._parse(path))
+        stream = io.StringIO()
+        write_policy(convert_to_policy(nodl_description), stream, validate=validate)
+        return stream.getvalue()
+
+    def _parse(self, path: pathlib.Path) -> List[Node]:
+        """Parse a NoDL file, unless it is unchanged since it was last parsed."""
+        stat = path.stat()
+        key = str(path.resolve())
+        cached = self._nodl_cache.get(key)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        nodes = parse_nodl_files([path])
+        self._nodl_cache[key] = (stat.st_mtime_ns, stat.st_size, nodes)
+        return nodes
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Read a single JSON request line, and write back a single JSON response line."""
+
+    server: PolicyServer
+    # requests are handled one at a time, so a client not sending its request is dropped
+    timeout = 10.0
+
+    def handle(self) -> None:
+        response: Dict[str, Any]
+        try:
+            request = json.loads(self.rfile.readline())
+        except OSError:  # `socket.timeout` included
+            return
+        except ValueError as e:
+            response = {'error': f'Malformed request: {e}'}
+        else:
+            response = self.server.respond(request)
+        response['version'] = PROTOCOL_VERSION
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+def serve(socket_path: pathlib.Path) -> None:
+    """
+    Serve convert requests on a Unix socket until interrupted or terminated.
+
+    :param socket_path: Path of the Unix socket to listen on.
+    :type socket_path: pathlib.Path
+    :raises RuntimeError: If another daemon is already listening on `socket_path`.
+    """
+    # terminate as on an interrupt, so that the socket is removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with PolicyServer(socket_path) as server:
+        server.warm_up()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def _remove_stale_socket(socket_path: pathlib.Path) -> None:
+    """Remove a socket left behind by a daemon that exited without cleaning up."""
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with connection:
+        try:
+            connection.connect(str(socket_path))
+        except FileNotFoundError:
+            return
+        except ConnectionRefusedError:
+            socket_path.unlink()
+            return
+    raise RuntimeError(f'A daemon is already listening on {socket_path}')
@@ -0,0 +1,189 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import pathlib
+from typing import Dict, List, Optional, Sequence, Set, TYPE_CHECKING
+
+from nodl_to_policy.stats import add_to_counter, measure_phase
+
+if TYPE_CHECKING:
+    from nodl.types import Node
+    from nodl_to_policy.nodl_cache import NoDLCache
+
+
+_GLOB_CHARACTERS = '*?['
+# same as `nodl._index._FILE_EXTENSION`
+_NODL_FILE_EXTENSION = '.nodl.xml'
+
+
+def find_nodl_files(nodl_inputs: Sequence[str]) -> List[pathlib.Path]:
+    """
+    Expand NoDL file paths, directories and glob patterns into a list of NoDL files.
+
+    Directories are searched recursively for `.nodl.xml` files. Files are returned in input
+    order (sorted within a directory or pattern), without duplicates.
+
+    :param nodl_inputs: File paths, directory paths or glob patterns.
+    :type nodl_inputs: Sequence[str]
+    :return: Paths of the NoDL files to convert.
+    :rtype: List[pathlib.Path]
+    :raises FileNotFoundError: If an input does not match any NoDL file.
+    """
+    nodl_files: List[pathlib.Path] = []
+    seen_files: Set[pathlib.Path] = set()
+    for nodl_input in nodl_inputs:
+        if any(char in nodl_input for char in _GLOB_CHARACTERS):
+            candidates = sorted(
+                pathlib.Path(match) for match in glob.glob(nodl_input, recursive=True))
+        else:
+            candidates = [pathlib.Path(nodl_input)] if nodl_input else []
+
+        matches = []
+        for candidate in candidates:
+            if candidate.is_dir():
+                matches.extend(sorted(
+                    path for path in candidate.rglob('*' + _NODL_FILE_EXTENSION)
+                    if path.is_file()))
+            elif candidate.is_file():
+                matches.append(candidate)
+        if not matches:
+            raise FileNotFoundError(f'{nodl_input} is not a file or does not contain NoDL files')
+
+        for match in matches:
+            resolved_match = match.resolve()
+            if resolved_match not in seen_files:
+                seen_files.add(resolved_match)
+                nodl_files.append(match)
+    return nodl_files
+
+
+def parse_nodl_files(
+    nodl_file_paths: Sequence[pathlib.Path], jobs: int = 1, *,
+    nodl_cache: Optional['NoDLCache'] = None
+) -> List['Node']:
+    """
+    Parse NoDL files and merge their nodes, in input order, into a single description.
+
+    With more than one job, files are parsed and validated in a pool of worker processes.
+    The result does not depend on the number of jobs.
+
+    :param nodl_file_paths: Paths of the NoDL files to parse.
+    :type nodl_file_paths: Sequence[pathlib.Path]
+    :param jobs: Maximum number of worker processes to parse files with.
+    :type jobs: int
+    :param nodl_cache: Cache of parsed files to reuse, and to add newly parsed files to.
+    :type nodl_cache: Optional[nodl_to_policy.nodl_cache.NoDLCache]
+    :return: The list of `nodl.Node` objects described by all files.
+    :rtype: List[nodl.Node]
+    :raises nodl.errors.NoDLError: If any of the files is not a valid NoDL description.
+    """
+    return [
+        node
+        for nodes in parse_each_nodl_file(nodl_file_paths, jobs, nodl_cache=nodl_cache)
+        for node in nodes
+    ]
+
+
+def parse_each_nodl_file(
+    nodl_file_paths: Sequence[pathlib.Path], jobs: int = 1, *,
+    nodl_cache: Optional['NoDLCache'] = None
+) -> List[List['Node']]:
+    """
+    Parse NoDL files, keeping the nodes of each file apart, see `parse_nodl_files`.
+
+    :param nodl_file_paths: Paths of the NoDL files to parse.
+    :type nodl_file_paths: Sequence[pathlib.Path]
+    :param jobs: Maximum number of worker processes to parse files with.
+    :type jobs: int
+    :param nodl_cache: Cache of parsed files to reuse, and to add newly parsed files to.
+    :type nodl_cache: Optional[nodl_to_policy.nodl_cache.NoDLCache]
+    :return: For each file, in input order, the list of `nodl.Node` objects it describes.
+    :rtype: List[List[nodl.Node]]
+    :raises nodl.errors.NoDLError: If any of the files is not a valid NoDL description.
+    """
+    with measure_phase('parse'):
+        if nodl_cache is None:
+            parsed_files = _parse_each_nodl_file(nodl_file_paths, jobs)
+        else:
+            parsed_files = _parse_each_nodl_file_cached(nodl_file_paths, jobs, nodl_cache)
+        add_to_counter('files', len(parsed_files))
+        add_to_counter('nodes', sum(map(len, parsed_files)))
+    return parsed_files
+
+
+def _parse_each_nodl_file(
+    nodl_file_paths: Sequence[pathlib.Path], jobs: int
+) -> List[List['Node']]:
+    """Parse NoDL files, in a pool of worker processes if there is more than one job."""
+    jobs = min(jobs, len(nodl_file_paths))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            # `map` yields results in input order, regardless of completion order
+            return list(executor.map(_parse_nodl_file, nodl_file_paths))
+    return [_parse_nodl_file(path) for path in nodl_file_paths]
+
+
+def _parse_each_nodl_file_cached(
+    nodl_file_paths: Sequence[pathlib.Path], jobs: int, nodl_cache: 'NoDLCache'
+) -> List[List['Node']]:
+    """Parse the NoDL files missing from a cache, and add them to it."""
+    digests = []
+    for path in nodl_file_paths:
+        digest = nodl_cache.get_digest(path)
+        if digest is None:
+            # parsing reports which file cannot be read
+            return _parse_each_nodl_file(nodl_file_paths, jobs)
+        digests.append(digest)
+    cached_files: Dict[str, List['Node']] = {}
+    # digest -> path of a file to parse, for files with the same content to be parsed once
+    stale_paths: Dict[str, pathlib.Path] = {}
+    for path, digest in zip(nodl_file_paths, digests):
+        if digest in cached_files or digest in stale_paths:
+            continue
+        nodes = nodl_cache.load(digest)
+        if nodes is None:
+            stale_paths[digest] = path
+        else:
+            cached_files[digest] = nodes
+    add_to_counter('cache_hits', len(cached_files))
+
+    if stale_paths:
+        parsed_files = _parse_each_nodl_file(list(stale_paths.values()), jobs)
+        for digest, nodes in zip(stale_paths, parsed_files):
+            nodl_cache.store(digest, nodes)
+            cached_files[digest] = nodes
+        nodl_cache.evict()
+    return [cached_files[digest] for digest in digests]
+
+
+def _parse_nodl_file(nodl_file_path: pathlib.Path) -> List['Node']:
+    """
+    Parse a single NoDL file, in a form that can be sent back from a worker process.
+
+    :param nodl_file_path: Path of the NoDL file to parse.
+    :type nodl_file_path: pathlib.Path
+    :return: The list of `nodl.Node` objects described by the file.
+    :rtype: List[nodl.Node]
+    :raises nodl.errors.NoDLError: If the file is not a valid NoDL description.
+    """
+    # imported here, so that finding NoDL files for a daemon does not import `nodl` and `lxml`
+    import nodl
+
+    try:
+        return nodl.parse(path=nodl_file_path)
+    except nodl.errors.NoDLError as e:
+        # the original exception may hold unpicklable lxml objects
+        raise nodl.errors.NoDLError(f'Failed to parse {nodl_file_path}\n{e}') from None
@@ -0,0 +1,137 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import pathlib
+from typing import Dict, Optional, Sequence
+
+from lxml import etree
+
+from nodl_to_policy import model
+from nodl_to_policy.cache import evict_least_recently_used, write_atomically
+from nodl_to_policy.common.profile import common_items
+from nodl_to_policy.description import parse_each_nodl_file
+from nodl_to_policy.policy import convert_to_policy
+
+from sros2.policy import POLICY_VERSION
+
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# Bump whenever the enclaves generated from a given NoDL description change
+_FRAGMENT_FORMAT_VERSION = '1'
+_FRAGMENT_FILE_EXTENSION = '.enclaves.xml'
+
+
+def convert_nodl_files_incrementally(
+    nodl_file_paths: Sequence[pathlib.Path], cache_directory: pathlib.Path, *, jobs: int = 1,
+    max_size: int = DEFAULT_MAX_SIZE
+) -> etree._ElementTree:
+    """
+    Convert NoDL files to a policy, reusing the enclaves generated for unchanged files.
+
+    The enclaves generated from each file are cached in `cache_directory` under the hash of the
+    file's content. Only files without a cached fragment are parsed and converted; the resulting
+    policy is the same as `convert_to_policy` over the nodes of all files.
+
+    As for `nodl_to_policy.nodl_cache.NoDLCache`, fragments are touched whenever they are used,
+    the least recently used ones are removed once the cache outgrows `max_size`, and the cache
+    is skipped whenever it cannot be written.
+
+    :param nodl_file_paths: Paths of the NoDL files to convert.
+    :type nodl_file_paths: Sequence[pathlib.Path]
+    :param cache_directory: Directory where generated fragments are cached.
+    :type cache_directory: pathlib.Path
+    :param jobs: Maximum number of worker processes to parse changed files with.
+    :type jobs: int
+    :param max_size: Size in bytes above which least recently used fragments are removed.
+    :type max_size: int
+    :return: LXML ElementTree structure representing a completed "policy" tag.
+    :rtype: etree._ElementTree
+    :raises nodl.errors.NoDLError: If any of the changed files is not a valid NoDL description.
+    """
+    generator_digest = _get_generator_digest()
+    digests = [_get_file_digest(path, generator_digest) for path in nodl_file_paths]
+
+    fragments: Dict[str, etree._Element] = {}
+    stale_paths: Dict[str, pathlib.Path] = {}
+    for path, digest in zip(nodl_file_paths, digests):
+        if digest in fragments or digest in stale_paths:
+            continue
+        fragment = _load_fragment(cache_directory, digest)
+        if fragment is None:
+            stale_paths[digest] = path
+        else:
+            fragments[digest] = fragment
+
+    parsed_files = parse_each_nodl_file(list(stale_paths.values()), jobs)
+    for digest, nodes in zip(stale_paths, parsed_files):
+        fragment = convert_to_policy(nodes).find('enclaves')
+        _store_fragment(cache_directory, digest, fragment)
+        fragments[digest] = fragment
+    if stale_paths:
+        evict_least_recently_used(cache_directory, '*/*' + _FRAGMENT_FILE_EXTENSION, max_size)
+
+    policy = model.Policy()
+    added_digests = set()
+    for digest in digests:
+        # files with the same content describe the same nodes, which would add nothing new
+        if digest in added_digests:
+            continue
+        added_digests.add(digest)
+        for enclave in fragments[digest]:
+            policy.add_enclave(model.Enclave.from_etree(enclave))
+    return policy.to_etree()
+
+
+def _get_generator_digest() -> str:
+    """Return a digest of everything but the NoDL file that generated enclaves depend on."""
+    generator = hashlib.sha256()
+    generator.update(_FRAGMENT_FORMAT_VERSION.encode())
+    generator.update(POLICY_VERSION.encode())
+    generator.update(repr(sorted(common_items().items())).encode())
+    return generator.hexdigest()
+
+
+def _get_file_digest(path: pathlib.Path, generator_digest: str) -> str:
+    """Return the cache key of the fragment generated from a NoDL file."""
+    file_hash = hashlib.sha256(generator_digest.encode())
+    file_hash.update(path.read_bytes())
+    return file_hash.hexdigest()
+
+
+def _get_fragment_path(cache_directory: pathlib.Path, digest: str) -> pathlib.Path:
+    return cache_directory / digest[:2] / (digest + _FRAGMENT_FILE_EXTENSION)
+
+
+def _load_fragment(cache_directory: pathlib.Path, digest: str) -> Optional[etree._Element]:
+    """Return the cached "enclaves" tag generated from a NoDL file, if any."""
+    fragment_path = _get_fragment_path(cache_directory, digest)
+    try:
+        fragment = etree.parse(str(fragment_path)).getroot()
+        # marked as recently used
+        os.utime(str(fragment_path))
+    except (OSError, etree.XMLSyntaxError):
+        return None
+    return fragment if fragment.tag == 'enclaves' else None
+
+
+def _store_fragment(cache_directory: pathlib.Path, digest: str, fragment: etree._Element) -> None:
+    """Cache the "enclaves" tag generated from a NoDL file, unless the cache cannot be written."""
+    try:
+        write_atomically(_get_fragment_path(cache_directory, digest), etree.tostring(fragment))
+    except OSError:
+        # e.g. a read-only file system, or a file in place of the directory
+        pass
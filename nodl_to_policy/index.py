@@ -0,0 +1,125 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import pathlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import ament_index_python
+from nodl._index import _FILE_EXTENSION as _NODL_FILE_EXTENSION
+from nodl_to_policy.cache import (
+    get_cache_directory,
+    write_atomically,
+)
+
+
+_INDEX_CACHE_FILENAME = 'nodl_files.json'
+_INDEX_CACHE_VERSION = 1
+_PACKAGES_RESOURCE_PATH = pathlib.Path('share', 'ament_index', 'resource_index', 'packages')
+
+
+def find_package_nodl_files(
+    package_names: Optional[Sequence[str]] = None, *, cache_path: Optional[pathlib.Path] = None
+) -> List[pathlib.Path]:
+    """
+    Locate the NoDL files exported by packages in the ament resource index.
+
+    The list of discovered files is cached on disk, keyed by the modification times of every
+    prefix's package index and of every package's share directory, so that repeated calls do
+    not crawl the filesystem again unless packages or NoDL files were added or removed.
+
+    :param package_names: Names of the packages to search, or `None` for all packages.
+    :type package_names: Optional[Sequence[str]]
+    :param cache_path: Path of the cache file, defaults to one in `get_cache_directory()`.
+    :type cache_path: Optional[pathlib.Path]
+    :return: Paths of the NoDL files, ordered by package name and then file name.
+    :rtype: List[pathlib.Path]
+    :raises ament_index_python.PackageNotFoundError: If a requested package is not installed.
+    """
+    if cache_path is None:
+        cache_path = get_cache_directory() / _INDEX_CACHE_FILENAME
+
+    prefix_mtimes = [
+        [prefix, _get_mtime(pathlib.Path(prefix) / _PACKAGES_RESOURCE_PATH)]
+        for prefix in ament_index_python.get_search_paths()
+    ]
+    packages = _load_index_cache(cache_path, prefix_mtimes)
+    if packages is None:
+        packages = _crawl_index()
+        try:
+            write_atomically(cache_path, json.dumps({
+                'version': _INDEX_CACHE_VERSION,
+                'prefixes': prefix_mtimes,
+                'packages': packages,
+            }).encode())
+        except OSError:
+            # the cache is best-effort, e.g. with a read-only home directory
+            pass
+
+    if package_names is None:
+        package_names = sorted(packages)
+    for package_name in package_names:
+        if package_name not in packages:
+            raise ament_index_python.PackageNotFoundError(
+                f"package '{package_name}' not found")
+
+    return [
+        pathlib.Path(nodl_file)
+        for package_name in package_names
+        for nodl_file in packages[package_name]['files']
+    ]
+
+
+def _crawl_index() -> Dict[str, Dict[str, Any]]:
+    """Search the share directory of every indexed package for NoDL files."""
+    packages = {}
+    for package_name, prefix in sorted(ament_index_python.get_packages_with_prefixes().items()):
+        share_directory = pathlib.Path(prefix) / 'share' / package_name
+        # `nodl` exports descriptions at the root of the package's share directory
+        nodl_files = sorted(
+            str(path) for path in share_directory.glob('*' + _NODL_FILE_EXTENSION)
+            if path.is_file())
+        packages[package_name] = {
+            'share': str(share_directory),
+            'mtime': _get_mtime(share_directory),
+            'files': nodl_files,
+        }
+    return packages
+
+
+def _load_index_cache(
+    cache_path: pathlib.Path, prefix_mtimes: List[List[Any]]
+) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Return the cached packages, or `None` if the cache is missing or out of date."""
+    try:
+        index_cache = json.loads(cache_path.read_text())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(index_cache, dict) or \
+            index_cache.get('version') != _INDEX_CACHE_VERSION or \
+            index_cache.get('prefixes') != prefix_mtimes:
+        return None
+    packages = index_cache.get('packages', {})
+    for package in packages.values():
+        if _get_mtime(pathlib.Path(package['share'])) != package['mtime']:
+            return None
+    return packages
+
+
+def _get_mtime(path: pathlib.Path) -> Optional[int]:
+    """Return the modification time of `path` in nanoseconds, or `None` if it does not exist."""
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
@@ -0,0 +1,210 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Assignment of nodes to namespaces and enclaves.
+
+NoDL descriptions do not say which namespace a node is launched in, nor which enclave it uses,
+so by default every node is in the root namespace and in an enclave of its own. An enclave
+mapping, usually derived from a launch file, overrides this with a YAML document such as:
+
+    enclaves:
+      /robot/perception: [camera_driver, detector]
+    nodes:
+      camera_driver:
+        namespace: /robot
+      detector:
+        namespace: /robot
+        enclave: /robot/perception
+
+Nodes listed under an enclave in "enclaves" share it. Entries of "nodes" set the namespace of a
+node (the root namespace by default), and may give its enclave instead. Nodes not assigned an
+enclave keep one of their own, named after their fully qualified name. Enclave paths and
+namespaces are absolute ROS names, and enclave paths may not be the root "/", since they name
+the directories of the files generated for each enclave.
+"""
+
+import os
+import pathlib
+import re
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Union
+
+import yaml
+
+
+class NodeAssignment(NamedTuple):
+    """The enclave and namespace of a node."""
+
+    enclave: str
+    namespace: str
+
+
+# node name -> assignment, resolved once before conversion
+EnclaveMapping = Mapping[str, NodeAssignment]
+
+# a token of a ROS name, e.g. "robot" of the namespace "/robot"
+_NAME_TOKEN_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+def load_enclave_mapping(path: Union[str, pathlib.Path]) -> Dict[str, NodeAssignment]:
+    """
+    Load an enclave mapping from a YAML file, see `resolve_enclave_mapping`.
+
+    :param path: Path of the YAML file.
+    :type path: Union[str, pathlib.Path]
+    :return: The assignment of each node listed in the mapping, by node name.
+    :rtype: Dict[str, NodeAssignment]
+    :raises ValueError: If the mapping is malformed, or assigns a node twice.
+    """
+    with open(str(path)) as f:
+        try:
+            document = yaml.safe_load(f)
+        except yaml.YAMLError as e:
+            raise ValueError(f'Invalid enclave mapping {path}\n{e}') from None
+    return resolve_enclave_mapping(document or {})
+
+
+def resolve_enclave_mapping(document: Mapping[str, Any]) -> Dict[str, NodeAssignment]:
+    """
+    Resolve an enclave mapping document into a table of node assignments.
+
+    :param document: The mapping, with optional "enclaves" and "nodes" entries.
+    :type document: Mapping[str, Any]
+    :return: The assignment of each node listed in the mapping, by node name.
+    :rtype: Dict[str, NodeAssignment]
+    :raises ValueError: If the mapping is malformed, or assigns a node twice.
+    """
+    if not isinstance(document, Mapping) or set(document) - {'enclaves', 'nodes'}:
+        raise ValueError('An enclave mapping may only have "enclaves" and "nodes" entries')
+
+    enclaves: Dict[str, str] = {}
+    for enclave_path, node_names in _get_entries(document, 'enclaves').items():
+        _check_name(enclave_path, 'Enclave path')
+        if not isinstance(node_names, (list, type(None))):
+            raise ValueError(f'Enclave {enclave_path} must have a list of node names')
+        for node_name in node_names or ():
+            _check_node_name(node_name)
+            if node_name in enclaves:
+                raise ValueError(f'Node {node_name} is assigned to several enclaves')
+            enclaves[node_name] = enclave_path
+
+    namespaces: Dict[str, str] = {}
+    for node_name, node_entry in _get_entries(document, 'nodes').items():
+        _check_node_name(node_name)
+        node_entry = node_entry or {}
+        if not isinstance(node_entry, Mapping) or set(node_entry) - {'enclave', 'namespace'}:
+            raise ValueError(f'Node {node_name} may only have "enclave" and "namespace" entries')
+        if 'enclave' in node_entry:
+            _check_name(node_entry['enclave'], 'Enclave path')
+            if enclaves.get(node_name, node_entry['enclave']) != node_entry['enclave']:
+                raise ValueError(f'Node {node_name} is assigned to several enclaves')
+            enclaves[node_name] = node_entry['enclave']
+        namespaces[node_name] = _check_name(
+            node_entry.get('namespace', '/'), 'Namespace', allow_root=True)
+
+    return {
+        node_name: get_node_assignment(
+            node_name, enclave=enclaves.get(node_name), namespace=namespaces.get(node_name, '/'))
+        for node_name in {**enclaves, **namespaces}
+    }
+
+
+def get_node_assignment(
+    node_name: str, enclave: Optional[str] = None, namespace: str = '/'
+) -> NodeAssignment:
+    """
+    Return the assignment of a node, filling in the default enclave.
+
+    :param node_name: Name of the node.
+    :type node_name: str
+    :param enclave: Path of the node's enclave, by default named after the fully qualified name
+        of the node, e.g. "/robot/camera_driver".
+    :type enclave: Optional[str]
+    :param namespace: Namespace of the node.
+    :type namespace: str
+    :return: The node's assignment.
+    :rtype: NodeAssignment
+    """
+    if enclave is None:
+        enclave = f'{namespace.rstrip("/")}/{node_name}'
+    return NodeAssignment(enclave, namespace)
+
+
+def assign_node(
+    node_name: str, enclave_mapping: Optional[EnclaveMapping] = None
+) -> NodeAssignment:
+    """
+    Return the assignment of a node, from an enclave mapping if it lists the node.
+
+    :param node_name: Name of the node.
+    :type node_name: str
+    :param enclave_mapping: The enclave and namespace of nodes, e.g. from `load_enclave_mapping`.
+    :type enclave_mapping: Optional[EnclaveMapping]
+    :return: The node's assignment, by default to the root namespace and an enclave of its own,
+        e.g. "/camera_driver".
+    :rtype: NodeAssignment
+    """
+    if enclave_mapping:
+        assignment = enclave_mapping.get(node_name)
+        if assignment is not None:
+            return assignment
+    return get_node_assignment(node_name)
+
+
+def get_enclave_directory(directory: pathlib.Path, enclave_path: str) -> pathlib.Path:
+    """
+    Return the directory of the files of an enclave, as laid out in a `sros2` keystore.
+
+    :param directory: Directory the files of all enclaves are under.
+    :type directory: pathlib.Path
+    :param enclave_path: Path of the enclave, e.g. "/foo/bar" for "<directory>/foo/bar".
+    :type enclave_path: str
+    :return: Path of the enclave's directory, which may not exist yet.
+    :rtype: pathlib.Path
+    :raises ValueError: If the enclave path is not a ROS name, e.g. "/" or "/../foo".
+    """
+    _check_name(enclave_path, 'Enclave path')
+    enclave_directory = directory.joinpath(*enclave_path.split('/')[1:])
+    # whatever the names accepted, nothing is ever written outside of `directory`
+    base_directory = os.path.abspath(str(directory))
+    if os.path.commonpath([os.path.abspath(str(enclave_directory)), base_directory]) != \
+            base_directory or enclave_directory == directory:
+        raise ValueError(f'Enclave path {enclave_path} is outside of {directory}')
+    return enclave_directory
+
+
+def _get_entries(document: Mapping[str, Any], key: str) -> Mapping[Any, Any]:
+    """Return the "enclaves" or "nodes" entries of a mapping document, checking their type."""
+    entries = document.get(key) or {}
+    if not isinstance(entries, Mapping):
+        raise ValueError(f'The "{key}" of an enclave mapping must be a mapping')
+    return entries
+
+
+def _check_name(name: Any, kind: str, allow_root: bool = False) -> str:
+    """Check that a namespace or enclave path is an absolute ROS name, e.g. "/robot"."""
+    if not isinstance(name, str) or not name.startswith('/'):
+        raise ValueError(f'{kind} {name} must start with "/"')
+    if not (allow_root and name == '/') and not all(
+            _NAME_TOKEN_PATTERN.fullmatch(token) for token in name[1:].split('/')):
+        raise ValueError(
+            f'{kind} {name} must be "/"-separated names of letters, digits and underscores')
+    return name
+
+
+def _check_node_name(node_name: Any) -> str:
+    """Check that a node name is a single token of a ROS name."""
+    if not isinstance(node_name, str) or not _NAME_TOKEN_PATTERN.fullmatch(node_name):
+        raise ValueError(f'Node name {node_name} must be letters, digits and underscores')
+    return node_name
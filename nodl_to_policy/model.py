@@ -0,0 +1,295 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compact, lxml-independent representation of an access control policy.
+
+Policies are made of plain dictionaries and interned strings, which are cheaper to build, merge,
+compare and cache than an lxml tree. A policy is only turned into an lxml tree, with `to_etree`,
+once it is complete.
+"""
+
+import sys
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from lxml import etree
+
+from sros2.policy import POLICY_VERSION
+
+
+# (permission_type, rule_type, rule_expression), e.g. ('topic', 'publish', 'ALLOW')
+PermissionsKey = Tuple[str, str, str]
+# (enclave_path, ns, node, permission_type, rule_type, rule_expression, expression)
+Rule = Tuple[str, str, str, str, str, str, str]
+
+
+class Profile:
+    """The permissions of a node, i.e. a "profile" tag."""
+
+    __slots__ = ('ns', 'node', 'permissions')
+
+    def __init__(self, ns: str, node: str) -> None:
+        self.ns = ns
+        self.node = node
+        # Expressions are kept as the keys of a dictionary, i.e. an insertion ordered set
+        self.permissions: Dict[PermissionsKey, Dict[str, None]] = {}
+
+    def get_permissions(
+        self, permission_type: str, rule_type: str, rule_expression: str
+    ) -> Dict[str, None]:
+        """
+        Return (or create) the expressions of a permissions tag, e.g. <topics publish="ALLOW">.
+
+        :param permission_type: One of service/action/topic.
+        :type permission_type: str
+        :param rule_type: The type of topic (pub/sub) or service/action (req/reply).
+        :type rule_type: str
+        :param rule_expression: 'ALLOW' or 'DENY'
+        :type rule_expression: str
+        :return: Insertion ordered set of expressions, as the keys of a dictionary.
+        :rtype: Dict[str, None]
+        """
+        key = (permission_type, rule_type, rule_expression)
+        expressions = self.permissions.get(key)
+        if expressions is None:
+            expressions = self.permissions[key] = {}
+        return expressions
+
+    def add_expressions(
+        self, permission_type: str, rule_type: str, rule_expression: str,
+        expressions: Iterable[str]
+    ) -> int:
+        """
+        Add expressions to a permissions tag of the profile, skipping those already present.
+
+        :param permission_type: One of service/action/topic.
+        :type permission_type: str
+        :param rule_type: The type of topic (pub/sub) or service/action (req/reply).
+        :type rule_type: str
+        :param rule_expression: 'ALLOW' or 'DENY'
+        :type rule_expression: str
+        :param expressions: Service/action/topic expressions, e.g. "~/get_parameters".
+        :type expressions: Iterable[str]
+        :return: How many expressions were added, i.e. were not already present.
+        :rtype: int
+        """
+        permissions = self.get_permissions(permission_type, rule_type, rule_expression)
+        count = len(permissions)
+        for expression in expressions:
+            if expression not in permissions:
+                # the same expressions recur across nodes, only keep one copy of each
+                permissions[sys.intern(expression)] = None
+        return len(permissions) - count
+
+    def to_etree(self) -> etree._Element:
+        """Return the LXML Element representing this "profile" tag."""
+        profile = etree.Element('profile', ns=self.ns, node=self.node)
+        for (permission_type, rule_type, rule_expression), expressions in \
+                self.permissions.items():
+            permissions = etree.SubElement(
+                profile, permission_type + 's', {rule_type: rule_expression})
+            for expression in expressions:
+                etree.SubElement(permissions, permission_type).text = expression
+        return profile
+
+
+class Enclave:
+    """The profiles of the nodes in an enclave, i.e. an "enclave" tag."""
+
+    __slots__ = ('path', 'profiles')
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.profiles: Dict[Tuple[str, str], Profile] = {}
+
+    def get_profile(self, ns: str, node: str) -> Profile:
+        """
+        Return (or create) the profile of a node in this enclave.
+
+        :param ns: Namespace of the node, e.g. "/".
+        :type ns: str
+        :param node: Name of the node.
+        :type node: str
+        :return: The node's profile.
+        :rtype: Profile
+        """
+        profile = self.profiles.get((ns, node))
+        if profile is None:
+            profile = self.profiles[(ns, node)] = Profile(ns, node)
+        return profile
+
+    def merge(self, other: 'Enclave') -> None:
+        """
+        Add the profiles and expressions of another enclave to this one.
+
+        :param other: The enclave to merge into this one, which is left unchanged.
+        :type other: Enclave
+        """
+        for other_profile in other.profiles.values():
+            profile = self.get_profile(other_profile.ns, other_profile.node)
+            for permissions_key, expressions in other_profile.permissions.items():
+                profile.add_expressions(*permissions_key, expressions)
+
+    def to_etree(self) -> etree._Element:
+        """Return the LXML Element representing this "enclave" tag."""
+        enclave = etree.Element('enclave', path=self.path)
+        profiles = etree.SubElement(enclave, 'profiles')
+        profiles.extend(profile.to_etree() for profile in self.profiles.values())
+        return enclave
+
+    @classmethod
+    def from_etree(cls, enclave_tag: etree._Element) -> 'Enclave':
+        """
+        Build an enclave from its LXML representation, see `Policy.from_etree`.
+
+        :param enclave_tag: LXML Element representing an "enclave" tag.
+        :type enclave_tag: etree._Element
+        :return: The equivalent enclave.
+        :rtype: Enclave
+        """
+        enclave = cls(enclave_tag.attrib['path'])
+        for profile_tag in enclave_tag.iterfind('profiles/profile'):
+            profile = enclave.get_profile(profile_tag.attrib['ns'], profile_tag.attrib['node'])
+            for permissions_tag in profile_tag.iterchildren(etree.Element):
+                # e.g. <topics publish="ALLOW">, holding a single rule
+                for rule_type, rule_expression in permissions_tag.attrib.items():
+                    profile.add_expressions(
+                        permissions_tag.tag[:-1], rule_type, rule_expression,
+                        (permission.text
+                         for permission in permissions_tag.iterchildren(etree.Element)))
+        return enclave
+
+
+class Policy:
+    """An access control policy, i.e. a "policy" tag."""
+
+    __slots__ = ('enclaves',)
+
+    def __init__(self) -> None:
+        self.enclaves: Dict[str, Enclave] = {}
+
+    def get_enclave(self, path: str) -> Enclave:
+        """
+        Return (or create) the enclave with a given path.
+
+        :param path: Path of the enclave, e.g. "/node_name".
+        :type path: str
+        :return: The enclave.
+        :rtype: Enclave
+        """
+        enclave = self.enclaves.get(path)
+        if enclave is None:
+            enclave = self.enclaves[path] = Enclave(path)
+        return enclave
+
+    def get_profile(self, enclave_path: str, ns: str, node: str) -> Profile:
+        """
+        Return (or create) the profile of a node in a given enclave.
+
+        :param enclave_path: Path of the enclave, e.g. "/node_name".
+        :type enclave_path: str
+        :param ns: Namespace of the node, e.g. "/".
+        :type ns: str
+        :param node: Name of the node.
+        :type node: str
+        :return: The node's profile.
+        :rtype: Profile
+        """
+        return self.get_enclave(enclave_path).get_profile(ns, node)
+
+    def rules(self) -> Iterator[Rule]:
+        """
+        Yield every expression of the policy as a flat, hashable tuple.
+
+        :return: An iterator of `(enclave_path, ns, node, permission_type, rule_type,
+            rule_expression, expression)` tuples.
+        :rtype: Iterator[Rule]
+        """
+        for enclave in self.enclaves.values():
+            for profile in enclave.profiles.values():
+                for permissions_key, expressions in profile.permissions.items():
+                    for expression in expressions:
+                        yield (enclave.path, profile.ns, profile.node) + permissions_key + \
+                            (expression,)
+
+    def merge(self, other: 'Policy') -> None:
+        """
+        Add the enclaves, profiles and expressions of another policy to this one.
+
+        :param other: The policy to merge into this one, which is left unchanged.
+        :type other: Policy
+        """
+        for other_enclave in other.enclaves.values():
+            self.get_enclave(other_enclave.path).merge(other_enclave)
+
+    def add_enclave(self, enclave: Enclave) -> None:
+        """
+        Add an enclave to the policy, or merge it into the enclave of the same path.
+
+        :param enclave: The enclave to add, which the policy takes over rather than copies.
+        :type enclave: Enclave
+        """
+        existing_enclave = self.enclaves.get(enclave.path)
+        if existing_enclave is None:
+            self.enclaves[enclave.path] = enclave
+        else:
+            existing_enclave.merge(enclave)
+
+    def to_etree(self) -> etree._Element:
+        """Return the LXML Element representing this "policy" tag."""
+        policy = etree.Element('policy', version=POLICY_VERSION)
+        enclaves = etree.SubElement(policy, 'enclaves')
+        enclaves.extend(enclave.to_etree() for enclave in self.enclaves.values())
+        return policy
+
+    @classmethod
+    def from_etree(cls, policy: etree._Element) -> 'Policy':
+        """
+        Build a policy from its LXML representation, e.g. a policy file loaded with `sros2`.
+
+        :param policy: LXML Element representing a "policy" tag.
+        :type policy: etree._Element
+        :return: The equivalent policy.
+        :rtype: Policy
+        """
+        if isinstance(policy, etree._ElementTree):
+            policy = policy.getroot()
+        model = cls()
+        for enclave_tag in policy.iterfind('enclaves/enclave'):
+            model.add_enclave(Enclave.from_etree(enclave_tag))
+        return model
+
+
+def diff(old: Policy, new: Policy) -> Tuple[List[Rule], List[Rule]]:
+    """
+    Compare the rules of two policies.
+
+    Rules are compared as sets of hashable tuples, so the cost is linear in the number of rules
+    rather than that of walking both trees.
+
+    :param old: The policy to compare against, e.g. one checked in.
+    :type old: Policy
+    :param new: The policy to compare, e.g. one generated.
+    :type new: Policy
+    :return: The rules only in `new` (additions) and those only in `old` (removals), each in the
+        order of their policy.
+    :rtype: Tuple[List[Rule], List[Rule]]
+    """
+    old_rules = list(old.rules())
+    new_rules = list(new.rules())
+    old_rule_set = set(old_rules)
+    new_rule_set = set(new_rules)
+    return (
+        [rule for rule in new_rules if rule not in old_rule_set],
+        [rule for rule in old_rules if rule not in new_rule_set])
@@ -0,0 +1,160 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+On-disk cache of parsed NoDL files.
+
+Parsing a NoDL file validates it against the NoDL schema and builds its `nodl.Node` objects,
+which dominates the conversion of workspaces whose installed NoDL files rarely change. The
+cache stores the nodes of each file pickled, as they are sent back from worker processes,
+under the hash of the file's content, so that unchanged files are never parsed again.
+
+Entries are touched whenever they are used, and the least recently used ones are removed once
+the cache outgrows its maximum size. The cache is best-effort: files are parsed as if it were
+empty whenever it cannot be read or written, or might have been written by another user.
+"""
+
+import hashlib
+import os
+import pathlib
+import pickle
+from typing import List, Optional
+
+import nodl
+from nodl.types import Node
+from nodl_to_policy.cache import evict_least_recently_used, write_atomically
+
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# Bump whenever the pickled form of parsed files changes
+_ENTRY_FORMAT_VERSION = '1'
+_ENTRY_FILE_EXTENSION = '.nodes.pickle'
+
+
+class NoDLCache:
+    """Directory of parsed NoDL files, keyed by file content."""
+
+    def __init__(self, directory: pathlib.Path, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        """
+        Use a cache directory, which is created when first written to.
+
+        :param directory: Directory of the cache, only accessible to its owner once created.
+        :type directory: pathlib.Path
+        :param max_size: Size in bytes above which least recently used entries are removed.
+        :type max_size: int
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self._parser_digest = _get_parser_digest()
+
+    def get_digest(self, path: pathlib.Path) -> Optional[str]:
+        """
+        Return the cache key of a NoDL file.
+
+        :param path: Path of the NoDL file.
+        :type path: pathlib.Path
+        :return: Hash of the content of the file, and of the parser, or `None` if the file cannot
+            be read, for the parser to report the error.
+        :rtype: Optional[str]
+        """
+        file_hash = hashlib.sha256(self._parser_digest.encode())
+        try:
+            file_hash.update(path.read_bytes())
+        except OSError:
+            return None
+        return file_hash.hexdigest()
+
+    def load(self, digest: str) -> Optional[List[Node]]:
+        """
+        Return the cached nodes of a NoDL file, marking them as recently used.
+
+        :param digest: Cache key of the file, see `get_digest`.
+        :type digest: str
+        :return: The nodes of the file, or `None` if they are not cached.
+        :rtype: Optional[List[nodl.Node]]
+        """
+        if not self._is_private():
+            return None
+        entry_path = self._get_entry_path(digest)
+        try:
+            with open(str(entry_path), 'rb') as f:
+                nodes = pickle.load(f)
+            os.utime(str(entry_path))
+        except Exception:  # noqa: B902
+            # missing entries, or entries of an incompatible Python or nodl version
+            return None
+        return nodes if isinstance(nodes, list) else None
+
+    def store(self, digest: str, nodes: List[Node]) -> None:
+        """
+        Cache the nodes of a NoDL file, unless the cache cannot be written.
+
+        Call `evict` once done storing entries.
+
+        :param digest: Cache key of the file, see `get_digest`.
+        :type digest: str
+        :param nodes: The nodes of the file.
+        :type nodes: List[nodl.Node]
+        """
+        try:
+            # the cache is loaded with `pickle`, so no one else may write to it
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            if self._is_private():
+                write_atomically(
+                    self._get_entry_path(digest), pickle.dumps(nodes, pickle.HIGHEST_PROTOCOL))
+        except OSError:
+            # e.g. a read-only file system, or a file in place of the directory
+            pass
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used entries until the cache fits in its maximum size.
+
+        :return: The number of entries removed.
+        :rtype: int
+        """
+        return evict_least_recently_used(
+            self.directory, '*/*' + _ENTRY_FILE_EXTENSION, self.max_size)
+
+    def _get_entry_path(self, digest: str) -> pathlib.Path:
+        return self.directory / digest[:2] / (digest + _ENTRY_FILE_EXTENSION)
+
+    def _is_private(self) -> bool:
+        """Return whether the cache directory is only accessible to the current user."""
+        try:
+            stat = self.directory.stat()
+        except OSError:
+            return False
+        if hasattr(os, 'getuid') and stat.st_uid != os.getuid():
+            return False
+        # `mkdir` does not change the mode of an existing directory
+        return not stat.st_mode & 0o077
+
+
+def _get_parser_digest() -> str:
+    """
+    Return a digest of everything but the NoDL file that parsed nodes depend on.
+
+    This hashes the files of the installed `nodl` package, its schema included, as the package
+    may be installed without distribution metadata to take a version from, e.g. by colcon.
+    """
+    parser = hashlib.sha256(_ENTRY_FORMAT_VERSION.encode())
+    package_directory = pathlib.Path(nodl.__file__).parent
+    for path in sorted(package_directory.rglob('*')):
+        if '__pycache__' in path.parts or not path.is_file():
+            continue
+        parser.update(path.relative_to(package_directory).as_posix().encode() + b'\0')
+        parser.update(path.read_bytes())
+    return parser.hexdigest()
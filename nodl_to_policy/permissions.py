@@ -0,0 +1,207 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import datetime
+import functools
+import os
+import pathlib
+from typing import Iterator, List, Optional, Tuple
+
+from lxml import etree
+
+from nodl_to_policy.cache import write_atomically
+from nodl_to_policy.mapping import get_enclave_directory
+from nodl_to_policy.policy import (
+    _check_validation_mode,
+    _sample_indices,
+    init_policy,
+)
+from nodl_to_policy.stats import measure_phase
+
+from sros2.policy import (
+    get_transport_schema,
+    get_transport_template,
+)
+
+
+PERMISSIONS_FILE_NAME = 'permissions.xml'
+# the permissions signed with the keystore's permissions CA, which security plugins load
+SIGNED_PERMISSIONS_FILE_NAME = 'permissions.p7s'
+
+# same default validity as the certificates `sros2` creates for enclaves
+_DEFAULT_VALIDITY = datetime.timedelta(days=3650)
+
+# RMW implementations publishing the ROS graph on "ros_discovery_info", for older `sros2`
+# releases without `sros2.api._permission._RMW_WITH_ROS_GRAPH_INFO_TOPIC`
+_RMW_WITH_ROS_GRAPH_INFO_TOPIC = (
+    'rmw_connextdds', 'rmw_cyclonedds_cpp', 'rmw_fastrtps_cpp', 'rmw_fastrtps_dynamic_cpp')
+
+
+def create_permissions(
+    policy: etree._Element, *, domain_id: Optional[str] = None,
+    not_valid_before: Optional[datetime.datetime] = None,
+    not_valid_after: Optional[datetime.datetime] = None,
+    allow_ros_discovery_topic: Optional[bool] = None, validate: str = 'full'
+) -> Iterator[Tuple[str, etree._ElementTree]]:
+    """
+    Transform each enclave of a policy into a DDS permissions document.
+
+    This does what `ros2 security create_permission` does for every enclave, without loading the
+    policy again from a file, and with the `sros2` permissions stylesheet and schema compiled once
+    for all enclaves. The permissions documents are not signed.
+
+    :param policy: LXML Element representing a "policy" tag, e.g. from `convert_to_policy`.
+    :type policy: etree._Element
+    :param domain_id: ROS domain ID the permissions apply to, `$ROS_DOMAIN_ID` or '0' by default.
+    :type domain_id: Optional[str]
+    :param not_valid_before: Start of the permissions validity, now by default.
+    :type not_valid_before: Optional[datetime.datetime]
+    :param not_valid_after: End of the permissions validity, ten years after its start by
+        default.
+    :type not_valid_after: Optional[datetime.datetime]
+    :param allow_ros_discovery_topic: Whether to allow the "ros_discovery_info" topic, which some
+        RMW implementations rely on, by default if the RMW implementation in use does, as
+        `sros2` decides.
+    :type allow_ros_discovery_topic: Optional[bool]
+    :param validate: One of `nodl_to_policy.policy.VALIDATION_MODES`, applied to the
+        permissions documents.
+    :type validate: str
+    :return: An iterator of `(enclave_path, permissions)` tuples, in policy order.
+    :rtype: Iterator[Tuple[str, etree._ElementTree]]
+    :raises RuntimeError: If a permissions document is invalid.
+    :raises ValueError: If the validation mode is unknown.
+    """
+    _check_validation_mode(validate)
+    if domain_id is None:
+        domain_id = os.environ.get('ROS_DOMAIN_ID', '0')
+    if not_valid_before is None:
+        # naive, as the dates `sros2` takes from the certificates of enclaves
+        not_valid_before = datetime.datetime.now(datetime.timezone.utc).replace(
+            microsecond=0, tzinfo=None)
+    if not_valid_after is None:
+        not_valid_after = not_valid_before + _DEFAULT_VALIDITY
+    parameters = {
+        'not_valid_before': etree.XSLT.strparam(not_valid_before.isoformat()),
+        'not_valid_after': etree.XSLT.strparam(not_valid_after.isoformat()),
+    }
+    if allow_ros_discovery_topic is None:
+        allow_ros_discovery_topic = _uses_ros_discovery_topic()
+    if allow_ros_discovery_topic:
+        parameters['allow_ros_discovery_topic'] = etree.XSLT.strparam('1')
+
+    enclaves = policy.findall('enclaves/enclave')
+    sampled_indices = set(_sample_indices(len(enclaves), validate))
+    transform = _get_permissions_transform()
+    for index, enclave in enumerate(enclaves):
+        # `sros2` transforms policies of a single enclave
+        enclave_policy = init_policy()
+        enclave_policy.attrib.update(policy.attrib)
+        enclave_policy.find('enclaves').append(copy.deepcopy(enclave))
+
+        with measure_phase('create_permissions'):
+            permissions = transform(enclave_policy, **parameters)
+            for domain_id_element in permissions.iterfind('permissions/grant/*/domains/id'):
+                domain_id_element.text = domain_id
+        if index in sampled_indices:
+            with measure_phase('validate_permissions'):
+                _validate_permissions(permissions)
+        yield enclave.attrib['path'], permissions
+
+
+def write_permissions(
+    policy: etree._Element, directory: pathlib.Path, *, overwrite_signed: bool = False, **kwargs
+) -> List[pathlib.Path]:
+    """
+    Write the DDS permissions document of each enclave of a policy, see `create_permissions`.
+
+    Documents are laid out as in a `sros2` keystore, i.e. the permissions of enclave "/foo/bar"
+    are written to "<directory>/foo/bar/permissions.xml", so `directory` is typically the
+    "enclaves" directory of a keystore. Existing files are replaced atomically.
+
+    Documents are not signed, so the signed permissions of an enclave, "permissions.p7s", would
+    no longer match its "permissions.xml" once replaced. Enclaves with signed permissions are
+    refused unless `overwrite_signed` is given, after which they must be signed again.
+
+    :param policy: LXML Element representing a "policy" tag, e.g. from `convert_to_policy`.
+    :type policy: etree._Element
+    :param directory: Directory to write the permissions documents under.
+    :type directory: pathlib.Path
+    :param overwrite_signed: Whether to write the permissions of enclaves which have signed
+        permissions.
+    :type overwrite_signed: bool
+    :param kwargs: Keyword arguments of `create_permissions`.
+    :return: Paths of the files written, in policy order.
+    :rtype: List[pathlib.Path]
+    :raises FileExistsError: If an enclave has signed permissions, in which case no file is
+        written.
+    :raises RuntimeError: If a permissions document is invalid, in which case no file is written.
+    :raises ValueError: If an enclave path is not a ROS name, in which case no file is written.
+    """
+    # create all documents first, so that none is written if one is invalid
+    enclave_permissions = list(create_permissions(policy, **kwargs))
+    paths = [
+        get_enclave_directory(directory, enclave_path) / PERMISSIONS_FILE_NAME
+        for enclave_path, _ in enclave_permissions]
+    if not overwrite_signed:
+        for path in paths:
+            signed_path = path.with_name(SIGNED_PERMISSIONS_FILE_NAME)
+            if signed_path.exists():
+                raise FileExistsError(
+                    f'{signed_path} would no longer match the permissions written, which are not '
+                    'signed')
+    with measure_phase('write_permissions'):
+        for path, (_, permissions) in zip(paths, enclave_permissions):
+            write_atomically(path, etree.tostring(permissions, pretty_print=True))
+    return paths
+
+
+def _uses_ros_discovery_topic() -> bool:
+    """Return whether the RMW implementation in use relies on "ros_discovery_info"."""
+    try:
+        from sros2.api._permission import _RMW_WITH_ROS_GRAPH_INFO_TOPIC as rmw_implementations
+    except ImportError:
+        rmw_implementations = _RMW_WITH_ROS_GRAPH_INFO_TOPIC
+    try:
+        from rclpy.utilities import get_rmw_implementation_identifier
+    except ImportError:
+        # without `rclpy`, the RMW implementation selected, or the default of ROS 2 Galactic
+        return os.environ.get('RMW_IMPLEMENTATION', 'rmw_cyclonedds_cpp') in rmw_implementations
+    return get_rmw_implementation_identifier() in rmw_implementations
+
+
+@functools.lru_cache(maxsize=None)
+def _get_permissions_transform() -> etree.XSLT:
+    """Return the `sros2` DDS permissions stylesheet, compiled once."""
+    return etree.XSLT(etree.parse(str(get_transport_template('dds', 'permissions.xsl'))))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_permissions_schema() -> etree.XMLSchema:
+    """Return the `sros2` DDS permissions schema, compiled once."""
+    return etree.XMLSchema(etree.parse(str(get_transport_schema('dds', 'permissions.xsd'))))
+
+
+def _validate_permissions(permissions: etree._ElementTree) -> None:
+    """
+    Validate a permissions document against the `sros2` DDS permissions schema.
+
+    :param permissions: LXML ElementTree structure representing a "dds" tag.
+    :type permissions: etree._ElementTree
+    :raises RuntimeError: If the permissions document is invalid.
+    """
+    try:
+        _get_permissions_schema().assertValid(permissions)
+    except etree.DocumentInvalid as e:
+        raise RuntimeError(str(e))
@@ -12,8 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
+import copy
+from enum import Enum
+import functools
+import math
+import os
+import pathlib
 import sys
-from typing import Dict, List, Tuple, Union
+from typing import (
+    BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple, Type, Union
+)
 
 from lxml import etree
 
@@ -24,21 +33,63 @@ from nodl.types import (
     ServerClientRole,
 )
 
-from nodl_to_policy.common.profile import (
-    common_publish_topics,
-    common_reply_services,
-    common_request_services,
-    common_subscribe_topics,
-)
+from nodl_to_policy import model
+from nodl_to_policy.cache import write_atomically
+from nodl_to_policy.common.profile import common_item_names, COMMON_ROLES
+from nodl_to_policy.mapping import assign_node, EnclaveMapping, get_enclave_directory
+from nodl_to_policy.stats import collect_stats, get_active_stats, measure_phase, Stats
 
 from sros2.policy import (
-    dump_policy,
+    get_policy_schema,
+    get_policy_template,
+    load_policy,
     POLICY_VERSION,
 )
 
 
 _POLICY_FILE_EXTENSION = '.policy.xml'
 
+# (permission type, rule type) of each bucket of names returned by `_classify_interfaces`
+_NODE_PERMISSION_TYPES = (
+    ('topic', 'subscribe'),
+    ('topic', 'publish'),
+    ('service', 'reply'),
+    ('service', 'request'),
+    ('action', 'execute'),
+    ('action', 'call'),
+)
+
+# indices of the (subscribe, publish) and (reply/execute, request/call) buckets a role maps to,
+# keyed by both enum members and their values
+_PUB_SUB_ROLE_BUCKETS: Dict[Union[Enum, str], Tuple[int, ...]] = {
+    role: buckets
+    for member, buckets in (
+        (PubSubRole.SUBSCRIPTION, (0,)),
+        (PubSubRole.PUBLISHER, (1,)),
+        (PubSubRole.BOTH, (0, 1)),
+    )
+    for role in (member, member.value)
+}
+_SERVER_CLIENT_ROLE_BUCKETS: Dict[Union[Enum, str], Tuple[int, ...]] = {
+    role: buckets
+    for member, buckets in (
+        (ServerClientRole.SERVER, (0,)),
+        (ServerClientRole.CLIENT, (1,)),
+        (ServerClientRole.BOTH, (0, 1)),
+    )
+    for role in (member, member.value)
+}
+
+# 'full' validates every enclave, 'sample' only a few of them, and 'none' skips validation
+VALIDATION_MODES = ('full', 'sample', 'none')
+_VALIDATION_SAMPLE_SIZE = 10
+
+_PERMISSIONS_TAGS = ('topics', 'services', 'actions')
+
+# same namespace as the includes of the common profile, and of `sros2` policies
+_XINCLUDE_NAMESPACE = 'http://www.w3.org/2003/XInclude'
+_XINCLUDE_NSMAP = {'xi': _XINCLUDE_NAMESPACE}
+
 
 def init_policy() -> etree._ElementTree:
     """
@@ -68,10 +119,11 @@ def get_profile(policy: etree._ElementTree, node_name: str) -> etree._ElementTre
     # Every node is assumed to be in its own enclave
     # This assumption is needed since the NoDL description does not specify enclave paths
     # Moreover, this assumption is better than placing all nodes in the base "/" path
-    enclave = policy.find(path=f'enclaves/enclave[@path="/{node_name}"]')
+    enclave_path = _get_enclave_path(node_name)
+    enclave = policy.find(path=f'enclaves/enclave[@path="{enclave_path}"]')
     if enclave is None:
         enclave = etree.Element('enclave')
-        enclave.attrib['path'] = f'/{node_name}'
+        enclave.attrib['path'] = enclave_path
         profiles = etree.Element('profiles')
         enclave.append(profiles)
         enclaves = policy.find('enclaves')
@@ -117,7 +169,7 @@ def get_permissions(
 
 def add_permissions(
     profile: etree._ElementTree, node: Node, permission_type: str, rule_type: str,
-    expressions: Union[Dict, List]
+    expressions: Union[Dict, List, Tuple]
 ) -> None:
     """
     For each service/action/topic, the actual expression tag is added to the ElementTree.
@@ -131,26 +183,18 @@ def add_permissions(
     :param rule_type: The type of topic (pub/sub) or service/action (req/reply).
     :type rule_type: str
     :param expressions: A collection of specific service/action/topic names.
-    :type expressions: Union[Dict, List]
+    :type expressions: Union[Dict, List, Tuple]
     """
     # do not create a permissions tag if not required
     if not expressions:
         return
     # get permission
     permissions = get_permissions(profile, permission_type, rule_type, 'ALLOW')
-
-    # add permission
-    for expression_name in expressions:
-        permission = etree.Element(permission_type)
-        if expression_name.startswith(node.name + '/'):
-            permission.text = '~' + expression_name[len(node.name):]
-        elif expression_name.startswith('/'):
-            permission.text = expression_name[len('/'):]
-        else:
-            permission.text = expression_name
-        if permission.text in [expression.text for expression in permissions]:
-            continue
-        permissions.append(permission)
+    # collect existing expressions once, rather than once per added expression
+    existing_expressions = {expression.text for expression in permissions}
+    _add_expressions(
+        permissions, node, permission_type, expressions, existing_expressions,
+        profile.get('ns', '/'))
 
 
 def add_common_permissions(profile: etree._ElementTree, node: Node) -> None:
@@ -162,64 +206,570 @@ def add_common_permissions(profile: etree._ElementTree, node: Node) -> None:
     :param node: A Node object primarily used to extract a node's name.
     :type node: nodl.types.Node
     """
-    permission_and_rule_types = {
-        'topic': {'subscribe': common_subscribe_topics(), 'publish': common_publish_topics()},
-        'service': {'reply': common_reply_services(), 'request': common_request_services()}}
-
     # For each of the default 'topic'/'service', add that tag under the appropriate permissions tag
-    for permission_type, rules_and_items in permission_and_rule_types.items():
-        for rule_type, allowed_items in rules_and_items.items():
-            add_permissions(
-                profile,
-                node,
-                permission_type,
-                rule_type,
-                [item.text for item in allowed_items])
+    # The common profile is parsed once per process, so this is only a lookup per node
+    for permission_type, rule_type, allowed_items in _get_common_permissions():
+        add_permissions(profile, node, permission_type, rule_type, allowed_items)
+
+
+class PolicyBuilder:
+    """
+    Add to a policy tree in place, e.g. one loaded from a file.
 
+    Permissions are generated as a `nodl_to_policy.model.Policy`, and the builder only writes the
+    expressions missing from the tree. It keeps a model of the tree to tell which those are, and
+    dictionaries of its enclave/profile/permissions tags, so every lookup is O(1) rather than an
+    XPath search of all enclaves as with the module-level `get_profile` and `get_permissions`.
 
-def convert_to_policy(nodl_description: List[Node]) -> etree._ElementTree:
+    Permissions tags combining several rules (e.g. <topics publish="ALLOW" subscribe="ALLOW">)
+    are left untouched, and new expressions go to a permissions tag of their own rule.
+    """
+
+    def __init__(
+        self, policy: Union[etree._Element, etree._ElementTree, None] = None,
+        expanded_policy: Union[etree._Element, etree._ElementTree, None] = None
+    ) -> None:
+        """
+        Create a builder for a new policy, or for an existing one.
+
+        :param policy: LXML Element or ElementTree representing a "policy" tag, modified in
+            place, or `None` for a new policy.
+        :type policy: Union[etree._Element, etree._ElementTree, None]
+        :param expanded_policy: `policy` with its XIncludes expanded, if it has any, so that the
+            expressions it includes are not added again.
+        :type expanded_policy: Union[etree._Element, etree._ElementTree, None]
+        """
+        if policy is None:
+            policy = init_policy()
+        elif isinstance(policy, etree._ElementTree):
+            # e.g. as loaded by `sros2.policy.load_policy`
+            policy = policy.getroot()
+        self.policy = policy
+        # the rules already in the tree
+        self.model = model.Policy.from_etree(
+            policy if expanded_policy is None else expanded_policy)
+        enclaves_tag = self.policy.find('enclaves')
+        if enclaves_tag is None:
+            enclaves_tag = etree.SubElement(self.policy, 'enclaves')
+        self._enclaves_tag = enclaves_tag
+        # enclave path -> enclave tag
+        self._enclaves: Dict[str, etree._Element] = {}
+        # enclave path -> (ns, node) -> profile tag
+        self._profiles: Dict[str, Dict[Tuple[str, str], etree._Element]] = {}
+        # profile tag -> (permission_type, rule_type, rule_expression) -> permissions tag
+        self._permissions: Dict[etree._Element, Dict[model.PermissionsKey, etree._Element]] = {}
+        for enclave in self._enclaves_tag.iterfind('enclave'):
+            self._index_enclave(enclave)
+
+    def get_enclave(self, enclave_path: str) -> etree._Element:
+        """
+        Return (or create) the enclave tag for an enclave path.
+
+        :param enclave_path: Path of the enclave, e.g. "/node_name".
+        :type enclave_path: str
+        :return: LXML Element representing an "enclave" tag.
+        :rtype: etree._Element
+        """
+        enclave = self._enclaves.get(enclave_path)
+        if enclave is None:
+            enclave = etree.SubElement(self._enclaves_tag, 'enclave', path=enclave_path)
+            etree.SubElement(enclave, 'profiles')
+            self._enclaves[enclave_path] = enclave
+            self._profiles[enclave_path] = {}
+        return enclave
+
+    def get_profile(self, node_name: str) -> etree._Element:
+        """
+        Return (or create) a node's respective profile tag, see `get_profile`.
+
+        :param node_name: Node name for which profile is inquired.
+        :type node_name: str
+        :return: LXML Element representing a "profile" tag.
+        :rtype: etree._Element
+        """
+        # namespace information not provided in NoDL description yet
+        return self.get_enclave_profile(_get_enclave_path(node_name), '/', node_name)
+
+    def get_enclave_profile(self, enclave_path: str, ns: str, node_name: str) -> etree._Element:
+        """
+        Return (or create) the profile tag of a node in a given enclave.
+
+        :param enclave_path: Path of the enclave, e.g. "/node_name".
+        :type enclave_path: str
+        :param ns: Namespace of the node, e.g. "/".
+        :type ns: str
+        :param node_name: Name of the node.
+        :type node_name: str
+        :return: LXML Element representing a "profile" tag.
+        :rtype: etree._Element
+        """
+        enclave = self.get_enclave(enclave_path)
+        profiles = self._profiles[enclave_path]
+        profile_key = (ns, node_name)
+        profile = profiles.get(profile_key)
+        if profile is None:
+            profiles_tag = enclave.find('profiles')
+            if profiles_tag is None:
+                profiles_tag = etree.SubElement(enclave, 'profiles')
+            profile = etree.SubElement(profiles_tag, 'profile', ns=ns, node=node_name)
+            profiles[profile_key] = profile
+            self._permissions[profile] = {}
+        return profile
+
+    def get_permissions(
+        self, profile: etree._Element, permission_type: str, rule_type: str,
+        rule_expression: str
+    ) -> etree._Element:
+        """
+        Return (or create) an appropriate permission tag, see `get_permissions`.
+
+        :param profile: LXML Element representing a "profile" tag returned by `get_profile`.
+        :type profile: etree._Element
+        :param permission_type: One of service/action/topic.
+        :type permission_type: str
+        :param rule_type: The type of topic (pub/sub) or service/action (req/reply).
+        :type rule_type: str
+        :param rule_expression: 'ALLOW' or 'DENY'
+        :type rule_expression: str
+        :return: LXML Element representing a services/actions/topics tag.
+        :rtype: etree._Element
+        """
+        profile_permissions = self._permissions[profile]
+        permissions_key = (permission_type, rule_type, rule_expression)
+        permissions = profile_permissions.get(permissions_key)
+        if permissions is None:
+            permissions = etree.SubElement(profile, permission_type + 's')
+            permissions.attrib[rule_type] = rule_expression
+            profile_permissions[permissions_key] = permissions
+        return permissions
+
+    def add_model(self, policy: model.Policy) -> None:
+        """
+        Add the enclaves, profiles and expressions of a policy model to the tree.
+
+        :param policy: The policy model to add, e.g. from `convert_to_model`.
+        :type policy: nodl_to_policy.model.Policy
+        """
+        for enclave in policy.enclaves.values():
+            self.get_enclave(enclave.path)
+            for profile in enclave.profiles.values():
+                profile_tag = self.get_enclave_profile(enclave.path, profile.ns, profile.node)
+                for permissions_key, expressions in profile.permissions.items():
+                    self._add_expressions(profile_tag, permissions_key, expressions)
+
+    def add_enclave(self, enclave: etree._Element) -> None:
+        """
+        Add an enclave tag built elsewhere, e.g. from another policy, to the policy.
+
+        :param enclave: LXML Element representing an "enclave" tag.
+        :type enclave: etree._Element
+        """
+        enclave_policy = model.Policy()
+        enclave_policy.add_enclave(model.Enclave.from_etree(enclave))
+        self.add_model(enclave_policy)
+
+    def add_permissions(
+        self, profile: etree._Element, node: Node, permission_type: str, rule_type: str,
+        expressions: Union[Dict, List, Tuple]
+    ) -> None:
+        """
+        Add expression tags to a profile, see `add_permissions`.
+
+        :param profile: LXML Element representing a "profile" tag returned by `get_profile`.
+        :type profile: etree._Element
+        :param node: A Node object primarily used to extract a node's name.
+        :type node: nodl.types.Node
+        :param permission_type: One of service/action/topic.
+        :type permission_type: str
+        :param rule_type: The type of topic (pub/sub) or service/action (req/reply).
+        :type rule_type: str
+        :param expressions: A collection of specific service/action/topic names.
+        :type expressions: Union[Dict, List, Tuple]
+        """
+        # do not create a permissions tag if not required
+        if not expressions:
+            return
+        self.get_permissions(profile, permission_type, rule_type, 'ALLOW')
+        rewrite = _get_expression_rewriter(node.name, profile.get('ns', '/'))
+        self._add_expressions(
+            profile, (permission_type, rule_type, 'ALLOW'), map(rewrite, expressions))
+
+    def add_common_permissions(self, profile: etree._Element, node: Node) -> None:
+        """
+        Add the common permissions to a profile, see `add_common_permissions`.
+
+        :param profile: LXML Element representing a "profile" tag returned by `get_profile`.
+        :type profile: etree._Element
+        :param node: A Node object primarily used to extract a node's name.
+        :type node: nodl.types.Node
+        """
+        for permission_type, rule_type, allowed_items in _get_common_permissions():
+            self.add_permissions(profile, node, permission_type, rule_type, allowed_items)
+
+    def add_node(
+        self, node: Node, enclave_mapping: Optional[EnclaveMapping] = None
+    ) -> etree._Element:
+        """
+        Add the profile and all permissions of a NoDL node to the policy, see `add_node_to_model`.
+
+        :param node: The `nodl.Node` object to add to the policy.
+        :type node: nodl.types.Node
+        :param enclave_mapping: The enclave and namespace of nodes, see `nodl_to_policy.mapping`.
+            Nodes missing from it are in the root namespace and in an enclave of their own.
+        :type enclave_mapping: Optional[nodl_to_policy.mapping.EnclaveMapping]
+        :return: LXML Element representing the node's "profile" tag.
+        :rtype: etree._Element
+        """
+        node_policy = model.Policy()
+        add_node_to_model(node_policy, node, enclave_mapping)
+        self.add_model(node_policy)
+        enclave_path, namespace = assign_node(node.name, enclave_mapping)
+        return self.get_enclave_profile(enclave_path, namespace, node.name)
+
+    def _add_expressions(
+        self, profile: etree._Element, permissions_key: model.PermissionsKey,
+        expressions: Iterable[str]
+    ) -> None:
+        """Append the expressions missing from a profile to its tag of a single rule."""
+        enclave_path = profile.getparent().getparent().attrib['path']
+        existing_expressions = self.model.get_profile(
+            enclave_path, profile.attrib['ns'], profile.attrib['node']
+        ).get_permissions(*permissions_key)
+        permissions = None
+        for expression in expressions:
+            if expression in existing_expressions:
+                continue
+            existing_expressions[expression] = None
+            if permissions is None:
+                permissions = self.get_permissions(profile, *permissions_key)
+            etree.SubElement(permissions, permissions_key[0]).text = expression
+
+    def _index_enclave(self, enclave: etree._Element) -> None:
+        """Index an enclave tag already in the policy, along with its profiles and permissions."""
+        enclave_path = enclave.attrib['path']
+        self._enclaves[enclave_path] = enclave
+        profiles = self._profiles.setdefault(enclave_path, {})
+        for profile in enclave.iterfind('profiles/profile'):
+            profile_key = (profile.attrib['ns'], profile.attrib['node'])
+            if profile_key in profiles:
+                continue
+            profiles[profile_key] = profile
+            profile_permissions = self._permissions[profile] = {}
+            for permissions in profile.iterchildren(*_PERMISSIONS_TAGS):
+                if len(permissions.attrib) != 1:
+                    # adding to a tag of several rules would grant expressions for all of them
+                    continue
+                (rule_type, rule_expression), = permissions.attrib.items()
+                profile_permissions.setdefault(
+                    (permissions.tag[:-1], rule_type, rule_expression), permissions)
+
+
+def convert_to_policy(
+    nodl_description: List[Node],
+    policy: Union[etree._ElementTree, str, pathlib.Path, None] = None,
+    enclave_mapping: Optional[EnclaveMapping] = None, stats: Optional[Stats] = None
+) -> etree._ElementTree:
     """
     Handle the main logic for conversion from NoDL description to access control policy.
 
     :param nodl_description: The list of `nodl.Node` objects to add to the policy.
     :type nodl_description: List[nodl.Node]
+    :param policy: An existing policy to merge the permissions of the nodes into, reusing its
+        enclaves and profiles. Either an LXML ElementTree, which is modified in place, or the
+        path of a policy file. A new policy is created by default.
+    :type policy: Union[etree._ElementTree, str, pathlib.Path, None]
+    :param enclave_mapping: The enclave and namespace of nodes, see `nodl_to_policy.mapping`.
+        Nodes missing from it are in the root namespace and in an enclave of their own.
+    :type enclave_mapping: Optional[nodl_to_policy.mapping.EnclaveMapping]
+    :param stats: Stats to add the measurements of the conversion phases to, see
+        `nodl_to_policy.stats`. By default, phases are only measured within `collect_stats`.
+    :type stats: Optional[nodl_to_policy.stats.Stats]
     :return: LXML ElementTree structure representing a completed "policy" tag.
     :rtype: etree._ElementTree
     """
-    policy = init_policy()
+    if stats is not None:
+        with collect_stats(stats):
+            return convert_to_policy(nodl_description, policy, enclave_mapping)
 
-    for node in nodl_description:
-        # Profile: need to find enclave path and node namespace somehow
-        profile = get_profile(policy, node.name)
-        # First add all the common (default) permissions for a ROS node
-        add_common_permissions(profile, node)
+    with measure_phase('convert'):
+        if policy is None:
+            policy_model = convert_to_model(nodl_description, enclave_mapping)
+            with measure_phase('build_tree'):
+                return policy_model.to_etree()
+
+        if isinstance(policy, (str, pathlib.Path)):
+            with measure_phase('load_policy'):
+                policy = load_policy(str(policy))
+        builder = PolicyBuilder(policy)
+        builder.add_model(convert_to_model(nodl_description, enclave_mapping))
+        return builder.policy
 
-        # TODO(aprotyas): Parameters? Not specified in access control policy
-        subscribe_topics, publish_topics = _get_topics_by_role(node.topics)
-        reply_services, request_services = _get_services_by_role(node.services)
-        reply_actions, request_actions = _get_actions_by_role(node.actions)
 
-        permission_and_rule_types = {
-            'topic': {'subscribe': subscribe_topics, 'publish': publish_topics},
-            'service': {'reply': reply_services, 'request': request_services},
-            'action': {'execute': reply_actions, 'call': request_actions}}
+def convert_to_model(
+    nodl_description: Iterable[Node], enclave_mapping: Optional[EnclaveMapping] = None
+) -> model.Policy:
+    """
+    Convert a NoDL description to a policy model, see `convert_to_policy`.
+
+    :param nodl_description: The `nodl.Node` objects to add to the policy.
+    :type nodl_description: Iterable[nodl.Node]
+    :param enclave_mapping: The enclave and namespace of nodes, see `nodl_to_policy.mapping`.
+        Nodes missing from it are in the root namespace and in an enclave of their own.
+    :type enclave_mapping: Optional[nodl_to_policy.mapping.EnclaveMapping]
+    :return: The policy model, not turned into an LXML tree.
+    :rtype: nodl_to_policy.model.Policy
+    """
+    policy = model.Policy()
 
-        for permission_type, rules_and_items in permission_and_rule_types.items():
-            for rule_type, allowed_items in rules_and_items.items():
-                add_permissions(profile, node, permission_type, rule_type, allowed_items)
+    for node in nodl_description:
+        add_node_to_model(policy, node, enclave_mapping)
 
     return policy
 
 
-def print_policy(policy: etree._ElementTree) -> None:
+def add_node_to_model(
+    policy: model.Policy, node: Node, enclave_mapping: Optional[EnclaveMapping] = None
+) -> model.Profile:
+    """
+    Add the profile and all permissions of a NoDL node to a policy model.
+
+    This is where the permissions of a node are generated: every conversion fills a model with
+    it, then builds a tree from the model once, or adds the model to a tree with `PolicyBuilder`.
+
+    :param policy: The policy model to add the node to.
+    :type policy: nodl_to_policy.model.Policy
+    :param node: The `nodl.Node` object to add to the policy.
+    :type node: nodl.types.Node
+    :param enclave_mapping: The enclave and namespace of nodes, see `nodl_to_policy.mapping`.
+        Nodes missing from it are in the root namespace and in an enclave of their own.
+    :type enclave_mapping: Optional[nodl_to_policy.mapping.EnclaveMapping]
+    :return: The node's profile.
+    :rtype: nodl_to_policy.model.Profile
+    """
+    enclave_path, namespace = assign_node(node.name, enclave_mapping)
+    with measure_phase('get_profile'):
+        profile = policy.get_profile(enclave_path, namespace, node.name)
+    rewrite = _get_expression_rewriter(node.name, namespace)
+    with measure_phase('add_common_permissions'):
+        _add_permissions_to_model(profile, rewrite, _get_common_permissions())
+    with measure_phase('add_permissions'):
+        _add_permissions_to_model(profile, rewrite, _get_interface_permissions(node))
+    return profile
+
+
+def stream_policy(
+    nodl_description: Iterable[Node], stream: BinaryIO, validate: str = 'none',
+    enclave_mapping: Optional[EnclaveMapping] = None, common_profile_href: Optional[str] = None
+) -> None:
+    """
+    Convert a NoDL description and write the policy to a stream, one enclave at a time.
+
+    Unlike `convert_to_policy`, the whole policy tree is never held in memory: nodes are grouped
+    by enclave, and each enclave is serialized and released as soon as it is complete. Enclaves
+    are written in the same order and with the same content as `convert_to_policy`, but are not
+    transformed through `sros2` as `write_policy` does.
+
+    :param nodl_description: The `nodl.Node` objects to add to the policy.
+    :type nodl_description: Iterable[nodl.Node]
+    :param stream: Binary stream to write the UTF-8 encoded policy to.
+    :type stream: BinaryIO
+    :param validate: One of `VALIDATION_MODES`, how many enclaves to validate before writing.
+    :type validate: str
+    :param enclave_mapping: The enclave and namespace of nodes, see `nodl_to_policy.mapping`.
+        Nodes missing from it are in the root namespace and in an enclave of their own.
+    :type enclave_mapping: Optional[nodl_to_policy.mapping.EnclaveMapping]
+    :param common_profile_href: Path of a file written by `write_common_profile`, relative to
+        the policy. If given, profiles include it rather than listing the common permissions.
+    :type common_profile_href: Optional[str]
+    :raises RuntimeError: If a validated enclave is invalid, after writing preceding enclaves.
+    """
+    _check_validation_mode(validate)
+    nodes_by_enclave: Dict[str, List[Node]] = {}
+    for node in nodl_description:
+        enclave_path, _ = assign_node(node.name, enclave_mapping)
+        nodes_by_enclave.setdefault(enclave_path, []).append(node)
+
+    sampled_indices = set(_sample_indices(len(nodes_by_enclave), validate))
+    with etree.xmlfile(stream, encoding='utf-8') as policy_file:
+        with policy_file.element('policy', {'version': POLICY_VERSION}):
+            policy_file.write('\n  ')
+            with policy_file.element('enclaves'):
+                for index, nodes in enumerate(nodes_by_enclave.values()):
+                    with measure_phase('convert'):
+                        enclave_policy = convert_to_model(nodes, enclave_mapping).to_etree()
+                    if index in sampled_indices:
+                        with measure_phase('validate'):
+                            _validate_policy(_get_policy_transform()(enclave_policy))
+                    enclave = enclave_policy.find('enclaves/enclave')
+                    if common_profile_href is not None:
+                        _reference_common_profile(enclave, common_profile_href)
+                    # indent as if pretty printed within the whole policy
+                    with measure_phase('serialize'):
+                        etree.indent(enclave, level=2)
+                        policy_file.write('\n    ')
+                        policy_file.write(enclave)
+                policy_file.write('\n  ')
+            policy_file.write('\n')
+    stream.write(b'\n')
+
+
+def write_policy(
+    policy: etree._ElementTree, stream: TextIO, validate: str = 'full',
+    common_profile_href: Optional[str] = None
+) -> None:
+    """
+    Transform a generated policy ElementTree as `sros2` does, validate it, and write it out.
+
+    This is equivalent to `sros2.policy.dump_policy` with full validation, except that the policy
+    stylesheet and schema are only compiled once per process. Since the structure of generated
+    policies is guaranteed by construction, validation can be limited to a sample of enclaves,
+    or skipped altogether.
+
+    With `common_profile_href`, the common permissions of each profile are replaced by an
+    XInclude of the common profile, as in `sros2` policies, once the policy is validated.
+
+    :param policy: LXML ElementTree structure representing a completed "policy" tag.
+    :type policy: etree._ElementTree
+    :param stream: Text stream to write the policy to.
+    :type stream: TextIO
+    :param validate: One of `VALIDATION_MODES`.
+    :type validate: str
+    :param common_profile_href: Path of a file written by `write_common_profile`, relative to
+        the policy. If given, profiles include it rather than listing the common permissions.
+    :type common_profile_href: Optional[str]
+    :raises RuntimeError: If the policy structure is invalid.
+    :raises ValueError: If the validation mode is unknown.
+    """
+    _check_validation_mode(validate)
+    with measure_phase('transform'):
+        base_url = _get_root(policy).getroottree().docinfo.URL
+        policy = _get_policy_transform()(policy)
+    with measure_phase('validate'):
+        validated_policy = policy
+        if validate != 'none' and _has_includes(policy.getroot()):
+            # e.g. a hand-written policy merged into, validated as `sros2` loads it
+            validated_policy = copy.deepcopy(policy)
+            validated_policy.docinfo.URL = base_url
+            validated_policy.xinclude()
+        if validate == 'full':
+            _validate_policy(validated_policy)
+        elif validate == 'sample':
+            enclaves = validated_policy.getroot().find('enclaves')
+            sampled_policy = init_policy()
+            sampled_policy.attrib.update(validated_policy.getroot().attrib)
+            sampled_policy.find('enclaves').extend(
+                copy.deepcopy(enclaves[index])
+                for index in _sample_indices(len(enclaves), validate))
+            _validate_policy(sampled_policy)
+    with measure_phase('serialize'):
+        if common_profile_href is not None:
+            _reference_common_profile(policy.getroot(), common_profile_href)
+        stream.write(etree.tostring(policy, pretty_print=True).decode())
+
+
+def print_policy(
+    policy: etree._ElementTree, validate: str = 'full', common_profile_href: Optional[str] = None
+) -> None:
     """
     Print a generated policy ElementTree to the console standard output.
 
     :param policy: LXML ElementTree structure representing a completed "policy" tag.
     :type policy: etree._ElementTree
+    :param validate: One of `VALIDATION_MODES`, see `write_policy`.
+    :type validate: str
+    :param common_profile_href: See `write_policy`.
+    :type common_profile_href: Optional[str]
     :raises RuntimeError: If the policy structure is invalid.
     """
-    dump_policy(policy, stream=sys.stdout)
+    write_policy(policy, sys.stdout, validate=validate, common_profile_href=common_profile_href)
+
+
+def write_enclave_policies(
+    policy: etree._ElementTree, directory: pathlib.Path, validate: str = 'full',
+    jobs: Union[int, None] = None, common_profile: Optional[pathlib.Path] = None
+) -> List[pathlib.Path]:
+    """
+    Write the policy of each enclave of a generated policy to a file of its own.
+
+    The policy of enclave "/foo/bar" is written to "<directory>/foo/bar.policy.xml". Policies
+    are transformed and validated as by `write_policy`, then serialized concurrently, since lxml
+    releases the GIL while serializing, and each file is replaced atomically.
+
+    :param policy: LXML ElementTree structure representing a completed "policy" tag.
+    :type policy: etree._ElementTree
+    :param directory: Directory to write the policy files under.
+    :type directory: pathlib.Path
+    :param validate: One of `VALIDATION_MODES`, see `write_policy`.
+    :type validate: str
+    :param jobs: Number of threads serializing policies, see `ThreadPoolExecutor` for the default.
+    :type jobs: Union[int, None]
+    :param common_profile: Path of a file written by `write_common_profile`. If given, profiles
+        include it, relative to their policy file, rather than listing the common permissions.
+    :type common_profile: Optional[pathlib.Path]
+    :return: Paths of the files written, in policy order.
+    :rtype: List[pathlib.Path]
+    :raises RuntimeError: If the policy of an enclave is invalid, in which case no file is
+        written.
+    :raises ValueError: If the validation mode is unknown, or an enclave path is not a ROS name,
+        in which case no file is written.
+    """
+    _check_validation_mode(validate)
+    # the transformed policy is a copy, so its enclaves can be moved to policies of their own
+    with measure_phase('transform'):
+        transformed_policy = _get_policy_transform()(policy).getroot()
+    enclaves = transformed_policy.findall('enclaves/enclave')
+    sampled_indices = set(_sample_indices(len(enclaves), validate))
+    paths = []
+    enclave_policies = []
+    for index, enclave in enumerate(enclaves):
+        enclave_policy = init_policy()
+        enclave_policy.attrib.update(transformed_policy.attrib)
+        enclave_policy.find('enclaves').append(enclave)
+        if index in sampled_indices:
+            with measure_phase('validate'):
+                _validate_policy(enclave_policy)
+        path = _get_enclave_policy_path(directory, enclave.attrib['path'])
+        if common_profile is not None:
+            _reference_common_profile(
+                enclave_policy, os.path.relpath(common_profile, path.parent))
+        paths.append(path)
+        enclave_policies.append(enclave_policy)
+
+    with measure_phase('serialize'), ThreadPoolExecutor(max_workers=jobs) as executor:
+        # consume the results, so that errors are raised
+        list(executor.map(_write_policy_file, paths, enclave_policies))
+    return paths
+
+
+def remove_enclave_policies(directory: pathlib.Path, enclave_paths: Iterable[str]) -> None:
+    """
+    Remove the files written by `write_enclave_policies` for enclaves no longer in a policy.
+
+    :param directory: Directory the policy files were written under.
+    :type directory: pathlib.Path
+    :param enclave_paths: Paths of the enclaves to remove the policy files of.
+    :type enclave_paths: Iterable[str]
+    """
+    for enclave_path in enclave_paths:
+        try:
+            _get_enclave_policy_path(directory, enclave_path).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def write_common_profile(path: pathlib.Path) -> None:
+    """
+    Write the common permissions of ROS nodes to a file, for policies to include.
+
+    :param path: Path of the file to write, replaced atomically.
+    :type path: pathlib.Path
+    """
+    profile = etree.Element('profile')
+    for item_type, role in COMMON_ROLES:
+        items = etree.SubElement(profile, item_type, {role: 'ALLOW'})
+        for name in common_item_names(item_type, role):
+            etree.SubElement(items, item_type[:-1]).text = name
+    write_atomically(path, etree.tostring(profile, pretty_print=True))
 
 
 def _get_topics_by_role(topics: Dict) -> Tuple[Dict, Dict]:
@@ -231,16 +781,12 @@ def _get_topics_by_role(topics: Dict) -> Tuple[Dict, Dict]:
     :return: A tuple of dictionaries, one for published topics, and one for subscribed topics.
     :rtype: Tuple[Dict, Dict]
     """
-    subscribe_topics = {}
-    publish_topics = {}
-    for _, topic in topics.items():
-        if PubSubRole(topic.role) is PubSubRole.SUBSCRIPTION:
-            subscribe_topics[topic.name] = topic
-        elif PubSubRole(topic.role) is PubSubRole.PUBLISHER:
-            publish_topics[topic.name] = topic
-        else:  # PubSubRole(topic.role) is PubSubRole.BOTH
-            subscribe_topics[topic.name] = topic
-            publish_topics[topic.name] = topic
+    subscribe_topics: Dict = {}
+    publish_topics: Dict = {}
+    buckets = (subscribe_topics, publish_topics)
+    for topic in topics.values():
+        for index in _get_role_buckets(_PUB_SUB_ROLE_BUCKETS, PubSubRole, topic.role):
+            buckets[index][topic.name] = topic
     return subscribe_topics, publish_topics
 
 
@@ -253,16 +799,14 @@ def _get_services_by_role(services: Dict) -> Tuple[Dict, Dict]:
     :return: A tuple of dictionaries, one for reply services, and one for request services.
     :rtype: Tuple[Dict, Dict]
     """
-    reply_services = {}
-    request_services = {}
-    for _, service in services.items():
-        if ServerClientRole(service.role) is ServerClientRole.CLIENT:
-            request_services[service.name] = service
-        elif ServerClientRole(service.role) is ServerClientRole.SERVER:
-            reply_services[service.name] = service
-        else:  # ServerClientRole(service.role) is ServerClientRole.BOTH
-            request_services[service.name] = service
-            reply_services[service.name] = service
+    reply_services: Dict = {}
+    request_services: Dict = {}
+    buckets = (reply_services, request_services)
+    for service in services.values():
+        for index in _get_role_buckets(
+            _SERVER_CLIENT_ROLE_BUCKETS, ServerClientRole, service.role
+        ):
+            buckets[index][service.name] = service
 
     return reply_services, request_services
 
@@ -277,3 +821,314 @@ def _get_actions_by_role(actions: Dict) -> Tuple[Dict, Dict]:
     :rtype: Tuple[Dict, Dict]
     """
     return _get_services_by_role(actions)  # `nodl.types.Action` also share ServerClientRole enums
+
+
+def _get_common_permissions() -> Iterator[Tuple[str, str, Tuple[str, ...]]]:
+    """
+    Yield the permission type, rule type and allowed names of each common permission.
+
+    :return: An iterator of `(permission_type, rule_type, names)` tuples.
+    :rtype: Iterator[Tuple[str, str, Tuple[str, ...]]]
+    """
+    permission_and_rule_types = {
+        'topic': ('subscribe', 'publish'),
+        'service': ('reply', 'request')}
+
+    for permission_type, rule_types in permission_and_rule_types.items():
+        for rule_type in rule_types:
+            yield permission_type, rule_type, common_item_names(permission_type + 's', rule_type)
+
+
+def _get_interface_permissions(
+    node: Node
+) -> Iterator[Tuple[str, str, Union[Dict, List, Tuple]]]:
+    """
+    Yield the permission type, rule type and allowed names of each permission of a node.
+
+    These are the permissions of the node's own topics, services and actions, which come after
+    the common (default) permissions of a ROS node, see `_get_common_permissions`.
+
+    :param node: The `nodl.Node` object to get permissions of.
+    :type node: nodl.types.Node
+    :return: An iterator of `(permission_type, rule_type, names)` tuples.
+    :rtype: Iterator[Tuple[str, str, Union[Dict, List, Tuple]]]
+    """
+    with measure_phase('classify_interfaces'):
+        interfaces = _classify_interfaces(node)
+
+    # TODO(aprotyas): Parameters? Not specified in access control policy
+    for (permission_type, rule_type), allowed_items in zip(_NODE_PERMISSION_TYPES, interfaces):
+        yield permission_type, rule_type, allowed_items
+
+
+def _add_permissions_to_model(
+    profile: model.Profile, rewrite: '_ExpressionRewriter',
+    permissions: Iterable[Tuple[str, str, Union[Dict, List, Tuple]]]
+) -> None:
+    """Add `(permission_type, rule_type, names)` permissions to a profile model."""
+    stats = get_active_stats()
+    for permission_type, rule_type, allowed_items in permissions:
+        # do not create a permissions tag if not required
+        if allowed_items:
+            added_count = profile.add_expressions(
+                permission_type, rule_type, 'ALLOW', map(rewrite, allowed_items))
+            if stats is not None:
+                stats.count('expressions', added_count)
+                stats.count('duplicates_skipped', len(allowed_items) - added_count)
+
+
+def _classify_interfaces(node: Node) -> Tuple[Tuple[str, ...], ...]:
+    """
+    Bucket the names of all topics, services and actions of a node by rule type in one pass.
+
+    :param node: The `nodl.Node` object to classify the interfaces of.
+    :type node: nodl.types.Node
+    :return: A tuple of name tuples, one per entry of `_NODE_PERMISSION_TYPES` and in its order.
+    :rtype: Tuple[Tuple[str, ...], ...]
+    """
+    buckets: Tuple[List[str], ...] = tuple([] for _ in _NODE_PERMISSION_TYPES)
+    for offset, interfaces, role_buckets, role_type in (
+        (0, node.topics, _PUB_SUB_ROLE_BUCKETS, PubSubRole),
+        (2, node.services, _SERVER_CLIENT_ROLE_BUCKETS, ServerClientRole),
+        # `nodl.types.Action` also share ServerClientRole enums
+        (4, node.actions, _SERVER_CLIENT_ROLE_BUCKETS, ServerClientRole),
+    ):
+        for interface in interfaces.values():
+            for index in _get_role_buckets(role_buckets, role_type, interface.role):
+                buckets[offset + index].append(interface.name)
+    return tuple(tuple(bucket) for bucket in buckets)
+
+
+def _get_role_buckets(
+    role_buckets: Dict[Union[Enum, str], Tuple[int, ...]], role_type: Type[Enum],
+    role: Union[Enum, str]
+) -> Tuple[int, ...]:
+    """
+    Look up the indices of the buckets an interface with a given role belongs to.
+
+    :param role_buckets: Lookup table from roles, and their values, to bucket indices.
+    :type role_buckets: Dict[Union[Enum, str], Tuple[int, ...]]
+    :param role_type: The enum type of the role, used for roles missing from the table.
+    :type role_type: Type[Enum]
+    :param role: The role of the interface, either an enum member or its value.
+    :type role: Union[Enum, str]
+    :return: The indices of the buckets the interface belongs to.
+    :rtype: Tuple[int, ...]
+    """
+    try:
+        return role_buckets[role]
+    except KeyError:
+        # raises a ValueError for invalid roles
+        return role_buckets[role_type(role)]
+
+
+# expressions memoized per rewriter; a node has a few dozen names, so this is rarely reached
+_MAX_MEMOIZED_EXPRESSIONS = 1024
+
+
+class _ExpressionRewriter:
+    """
+    Rewrite the service/action/topic names of a node into policy expressions.
+
+    Prefixes are computed once per node, and rewritten names are memoized, since the same names
+    (e.g. those of the common parameter services) are rewritten for several rule types.
+    """
+
+    __slots__ = ('_private_prefix', '_namespace_prefix', '_expressions')
+
+    def __init__(self, node_name: str, namespace: str = '/') -> None:
+        """
+        Compile a rewriter for a node.
+
+        :param node_name: Name of the node the services/actions/topics belong to.
+        :type node_name: str
+        :param namespace: Namespace of the node, stripped from the names it prefixes.
+        :type namespace: str
+        """
+        self._private_prefix = node_name + '/'
+        self._namespace_prefix = namespace.rstrip('/') + '/'
+        self._expressions: Dict[str, str] = {}
+
+    def __call__(self, expression_name: str) -> str:
+        """
+        Return the policy expression of a service/action/topic name.
+
+        :param expression_name: Name of the service/action/topic, as in the NoDL description.
+        :type expression_name: str
+        :return: The name relative to the node ("~/...") if private to it, relative to the
+            node's namespace if within it, unchanged otherwise.
+        :rtype: str
+        """
+        try:
+            return self._expressions[expression_name]
+        except KeyError:
+            pass
+        if len(self._expressions) >= _MAX_MEMOIZED_EXPRESSIONS:
+            # rewriters are cached by long-running processes, which must not grow without limit
+            self._expressions.clear()
+        if expression_name.startswith(self._private_prefix):
+            expression = '~' + expression_name[len(self._private_prefix) - 1:]
+        elif expression_name.startswith(self._namespace_prefix):
+            expression = expression_name[len(self._namespace_prefix):]
+        else:
+            expression = expression_name
+        self._expressions[expression_name] = expression
+        return expression
+
+
+@functools.lru_cache(maxsize=128)
+def _get_expression_rewriter(node_name: str, namespace: str = '/') -> _ExpressionRewriter:
+    """Return the expression rewriter of a node, compiled once for consecutive uses."""
+    return _ExpressionRewriter(node_name, namespace)
+
+
+def _add_expressions(
+    permissions: etree._Element, node: Node, permission_type: str,
+    expressions: Union[Dict, List, Tuple], existing_expressions: Set[str], namespace: str = '/'
+) -> None:
+    """
+    Append an expression tag to a permissions tag for each name not already present.
+
+    Only expressions missing from `existing_expressions` get an element created, and the set is
+    updated in place so that it keeps mirroring the children of `permissions`.
+
+    :param permissions: LXML Element representing a services/actions/topics tag.
+    :type permissions: etree._Element
+    :param node: A Node object primarily used to extract a node's name.
+    :type node: nodl.types.Node
+    :param permission_type: One of service/action/topic.
+    :type permission_type: str
+    :param expressions: A collection of specific service/action/topic names.
+    :type expressions: Union[Dict, List, Tuple]
+    :param existing_expressions: Expressions already present under `permissions`.
+    :type existing_expressions: Set[str]
+    :param namespace: Namespace of the node, names within which are made relative.
+    :type namespace: str
+    """
+    rewrite = _get_expression_rewriter(node.name, namespace)
+    for expression_name in expressions:
+        expression = rewrite(expression_name)
+        if expression in existing_expressions:
+            continue
+        existing_expressions.add(expression)
+        etree.SubElement(permissions, permission_type).text = expression
+
+
+def _reference_common_profile(element: etree._Element, href: str) -> None:
+    """
+    Replace the common permissions of the profiles under an element by an XInclude of `href`.
+
+    Profiles missing some of the common permissions, e.g. hand-written ones merged into, are left
+    untouched, since including the common profile would grant them more.
+    """
+    referenced = False
+    for profile in element.iter('profile'):
+        rewrite = _get_expression_rewriter(profile.attrib['node'], profile.get('ns', '/'))
+        common_elements = []
+        for permission_type, rule_type, names in _get_common_permissions():
+            expressions = {rewrite(name) for name in names}
+            for permissions in profile.iterfind(f'{permission_type}s[@{rule_type}="ALLOW"]'):
+                if len(permissions.attrib) > 1:
+                    continue
+                for permission in permissions:
+                    if permission.text in expressions:
+                        expressions.discard(permission.text)
+                        common_elements.append(permission)
+            if expressions:
+                break
+        else:
+            for permission in common_elements:
+                permissions = permission.getparent()
+                permissions.remove(permission)
+                if not len(permissions):
+                    profile.remove(permissions)
+            profile.insert(0, etree.Element(
+                f'{{{_XINCLUDE_NAMESPACE}}}include',
+                {'href': href, 'xpointer': 'xpointer(/profile/*)'}, nsmap=_XINCLUDE_NSMAP))
+            referenced = True
+    if referenced:
+        # declare the namespace once rather than on every include
+        etree.cleanup_namespaces(element, top_nsmap=_XINCLUDE_NSMAP)
+
+
+def _has_includes(element: etree._Element) -> bool:
+    """Return whether an element contains XIncludes, e.g. of the common profile."""
+    return next(element.iter(f'{{{_XINCLUDE_NAMESPACE}}}include'), None) is not None
+
+
+def _get_root(policy: Union[etree._Element, etree._ElementTree]) -> etree._Element:
+    return policy.getroot() if isinstance(policy, etree._ElementTree) else policy
+
+
+def _get_enclave_path(node_name: str) -> str:
+    """
+    Return the path of the enclave a node is placed in.
+
+    :param node_name: Name of the node.
+    :type node_name: str
+    :return: Enclave path, i.e. "/<node_name>".
+    :rtype: str
+    """
+    # Every node is assumed to be in its own enclave
+    return f'/{node_name}'
+
+
+@functools.lru_cache(maxsize=None)
+def _get_policy_transform() -> etree.XSLT:
+    """Return the `sros2` policy stylesheet, compiled once."""
+    return etree.XSLT(etree.parse(str(get_policy_template('policy.xsl'))))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_policy_schema() -> etree.XMLSchema:
+    """Return the `sros2` policy schema, compiled once."""
+    return etree.XMLSchema(etree.parse(str(get_policy_schema('policy.xsd'))))
+
+
+def _get_enclave_policy_path(directory: pathlib.Path, enclave_path: str) -> pathlib.Path:
+    """Return the path of the policy file of an enclave, e.g. "<directory>/foo/bar.policy.xml"."""
+    path = get_enclave_directory(directory, enclave_path)
+    return path.with_name(path.name + _POLICY_FILE_EXTENSION)
+
+
+def _write_policy_file(path: pathlib.Path, policy: etree._Element) -> None:
+    """Serialize a transformed policy, and write it to a file atomically."""
+    write_atomically(path, etree.tostring(policy, pretty_print=True))
+
+
+def _validate_policy(policy: etree._ElementTree) -> None:
+    """
+    Validate a policy against the `sros2` policy schema.
+
+    :param policy: LXML ElementTree structure representing a "policy" tag.
+    :type policy: etree._ElementTree
+    :raises RuntimeError: If the policy structure is invalid.
+    """
+    try:
+        _get_policy_schema().assertValid(policy)
+    except etree.DocumentInvalid as e:
+        raise RuntimeError(str(e))
+
+
+def _check_validation_mode(validate: str) -> None:
+    if validate not in VALIDATION_MODES:
+        raise ValueError(
+            f"unknown validation mode '{validate}', expected one of {VALIDATION_MODES}")
+
+
+def _sample_indices(count: int, validate: str) -> range:
+    """
+    Return the indices of the enclaves to validate out of `count` enclaves.
+
+    :param count: Number of enclaves in the policy.
+    :type count: int
+    :param validate: One of `VALIDATION_MODES`.
+    :type validate: str
+    :return: All indices for full validation, none without, and evenly spaced ones otherwise.
+    :rtype: range
+    """
+    if validate == 'full':
+        return range(count)
+    if validate == 'sample':
+        return range(0, count, max(1, math.ceil(count / _VALIDATION_SAMPLE_SIZE)))
+    return range(0)
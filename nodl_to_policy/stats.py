@@ -0,0 +1,205 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Wall time, counters and peak memory of the phases of a conversion.
+
+Conversion functions report their phases, e.g. "parse" or "add_permissions", to the `Stats`
+object collecting them, if any:
+
+    with collect_stats() as stats:
+        print_policy(convert_to_policy(nodl_description))
+    print(stats.format_table())
+
+Phases may be nested, e.g. "get_profile" within "convert", in which case the time and memory of
+the inner phase are included in those of the outer one, and counters are added to the innermost
+phase. Nothing is measured outside of `collect_stats`.
+
+Peak memory is the peak of the memory allocated by Python while a phase runs, as traced by
+`tracemalloc` from Python 3.9 on, which `collect_stats` enables. Memory allocated by libraries
+directly, e.g. by libxml2 for LXML trees, or by worker processes, is not traced, and tracing
+slows conversions down.
+"""
+
+import contextlib
+import json
+import time
+import tracemalloc
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, TextIO
+
+# the stats being collected, if any
+_active_stats: Optional['Stats'] = None
+_NULL_CONTEXT = contextlib.nullcontext()
+# `tracemalloc.reset_peak` is new in Python 3.9
+_CAN_MEASURE_PEAKS = hasattr(tracemalloc, 'reset_peak')
+
+
+class PhaseStats:
+    """What was measured of a phase, over all its occurrences."""
+
+    __slots__ = ('calls', 'wall_time', 'peak_memory', 'counters')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        # seconds
+        self.wall_time = 0.0
+        # peak memory traced while the phase ran, in bytes
+        self.peak_memory: Optional[int] = None
+        # e.g. "expressions" -> number of expressions added
+        self.counters: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the measurements as a dictionary, e.g. to write them as JSON."""
+        return {
+            'calls': self.calls,
+            'wall_time': self.wall_time,
+            'peak_memory': self.peak_memory,
+            'counters': dict(self.counters),
+        }
+
+
+class Stats:
+    """The phases of one or more conversions, by name, in the order they first occurred."""
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, PhaseStats] = {}
+        # counters added to outside of any phase
+        self.counters: Dict[str, int] = {}
+        # the phases being measured, innermost last
+        self._active_phases: List[PhaseStats] = []
+        # peak memory traced during each phase being measured, up to its innermost phase's start
+        self._active_peaks: List[int] = []
+
+    def get_phase(self, name: str) -> PhaseStats:
+        """Return (or create) the measurements of a phase."""
+        phase_stats = self.phases.get(name)
+        if phase_stats is None:
+            phase_stats = self.phases[name] = PhaseStats()
+        return phase_stats
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[PhaseStats]:
+        """
+        Measure the wall time and peak memory of an occurrence of a phase.
+
+        :param name: Name of the phase, e.g. "parse".
+        :type name: str
+        :return: A context manager measuring the phase, yielding its measurements.
+        :rtype: ContextManager[PhaseStats]
+        """
+        phase_stats = self.get_phase(name)
+        tracing = _CAN_MEASURE_PEAKS and tracemalloc.is_tracing()
+        if tracing:
+            # the peak is reset for this phase, so the outer phases keep theirs so far
+            self._update_peaks(tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._active_peaks.append(tracemalloc.get_traced_memory()[0])
+        self._active_phases.append(phase_stats)
+        start = time.perf_counter()
+        try:
+            yield phase_stats
+        finally:
+            phase_stats.wall_time += time.perf_counter() - start
+            self._active_phases.pop()
+            phase_stats.calls += 1
+            if tracing and self._active_peaks:
+                self._update_peaks(tracemalloc.get_traced_memory()[1])
+                peak_memory = self._active_peaks.pop()
+                phase_stats.peak_memory = max(phase_stats.peak_memory or 0, peak_memory)
+
+    def _update_peaks(self, peak_memory: int) -> None:
+        """Raise the peaks of the phases being measured to a peak traced during all of them."""
+        self._active_peaks[:] = [max(peak, peak_memory) for peak in self._active_peaks]
+
+    def count(self, counter: str, value: int = 1) -> None:
+        """
+        Add to a counter of the innermost phase being measured, e.g. of expressions added.
+
+        :param counter: Name of the counter.
+        :type counter: str
+        :param value: Amount to add to the counter.
+        :type value: int
+        """
+        counters = self._active_phases[-1].counters if self._active_phases else self.counters
+        counters[counter] = counters.get(counter, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the measurements of all phases as a dictionary, e.g. to write them as JSON."""
+        return {
+            'phases': {name: stats.to_dict() for name, stats in self.phases.items()},
+            'counters': dict(self.counters),
+        }
+
+    def write_json(self, stream: TextIO) -> None:
+        """Write the measurements of all phases to a text stream as JSON."""
+        json.dump(self.to_dict(), stream, indent=2)
+        stream.write('\n')
+
+    def format_table(self) -> str:
+        """Return the measurements of all phases as a table, one phase per line."""
+        lines = [f'{"phase":<24} {"calls":>8} {"time (s)":>10} {"peak (MiB)":>11}  counters']
+        for name, stats in self.phases.items():
+            peak_memory = '-' if stats.peak_memory is None else \
+                f'{stats.peak_memory / 2 ** 20:.1f}'
+            counters = ' '.join(f'{counter}={value}' for counter, value in stats.counters.items())
+            lines.append(
+                f'{name:<24} {stats.calls:>8} {stats.wall_time:>10.4f} {peak_memory:>11}  '
+                f'{counters}'.rstrip())
+        return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def collect_stats(stats: Optional[Stats] = None) -> Iterator[Stats]:
+    """
+    Collect the stats of the conversions run within a context.
+
+    :param stats: Stats to add to, new ones by default.
+    :type stats: Optional[Stats]
+    :return: A context manager yielding the stats collected.
+    :rtype: ContextManager[Stats]
+    """
+    global _active_stats
+    if stats is None:
+        stats = Stats()
+    previous_stats = _active_stats
+    _active_stats = stats
+    # unless already traced, e.g. by outer stats
+    start_tracing = _CAN_MEASURE_PEAKS and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    try:
+        yield stats
+    finally:
+        _active_stats = previous_stats
+        if start_tracing:
+            tracemalloc.stop()
+
+
+def get_active_stats() -> Optional[Stats]:
+    """Return the stats being collected, if any."""
+    return _active_stats
+
+
+def measure_phase(name: str) -> ContextManager[Any]:
+    """Measure a phase if stats are being collected, see `Stats.phase`."""
+    if _active_stats is None:
+        return _NULL_CONTEXT
+    return _active_stats.phase(name)
+
+
+def add_to_counter(counter: str, value: int = 1) -> None:
+    """Add to a counter if stats are being collected, see `Stats.count`."""
+    if _active_stats is not None:
+        _active_stats.count(counter, value)
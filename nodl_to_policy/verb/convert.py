@@ -13,18 +13,35 @@
 # limitations under the License.
 
 import argparse
+import os
 import pathlib
 import sys
+from typing import Any, List, Optional, Set, Tuple
 
-from argcomplete.completers import FilesCompleter
-import nodl
-from nodl._index import _FILE_EXTENSION as _NODL_FILE_EXTENSION
-from nodl_to_policy.policy import (
-    convert_to_policy,
-    print_policy,
-)
+from nodl_to_policy.cache import get_cache_directory
+from nodl_to_policy.client import DaemonError, request_policy
 from ros2cli.verb import VerbExtension
 
+# `nodl`, `sros2`, `lxml` and `argcomplete` are only imported when needed rather than here, since
+# every verb module is imported for `ros2 nodl_to_policy --help` and on each tab completion
+
+# options the daemon honours, or which do not change its output; any other option set to a
+# non-default value converts in this process, so that new options are never silently ignored
+_DAEMON_OPTIONS = frozenset({
+    'nodl_files', 'all_packages', 'packages', 'jobs', 'validate', 'cache_dir', 'no_nodl_cache',
+})
+
+_FRAGMENTS_DIRECTORY_NAME = 'fragments'
+_NODL_CACHE_DIRECTORY_NAME = 'nodes'
+# same as `nodl._index._FILE_EXTENSION`
+_NODL_FILE_EXTENSION = '.nodl.xml'
+# errors writing policies and permissions, e.g. of validation or of the file system
+_WRITE_ERRORS = (OSError, RuntimeError, ValueError)
+# same as `nodl_to_policy.policy._XINCLUDE_NAMESPACE`
+_XINCLUDE_TAG = '{http://www.w3.org/2003/XInclude}include'
+# same as `nodl_to_policy.policy.VALIDATION_MODES`
+_VALIDATION_MODES = ('full', 'sample', 'none')
+
 
 class ConvertVerb(VerbExtension):
     """Convert NoDL XML documents to ROS 2 Access Control Policies."""
@@ -32,30 +49,558 @@ class ConvertVerb(VerbExtension):
     def add_arguments(self, parser: argparse.ArgumentParser, cli_name: None = None) -> None:
         """Argument addition for the `convert` verb."""
         parser.add_argument(
-            'nodl_file',
-            help='Path of the input NoDL description XML (`.nodl.xml`) file.',
-            type=pathlib.Path
-        ).completer = FilesCompleter(  # type: ignore
-            allowednames=[_NODL_FILE_EXTENSION], directories=False)
+            'nodl_files',
+            nargs='*',
+            metavar='nodl_file',
+            help='Paths of the input NoDL description XML (`.nodl.xml`) files, directories to '
+                 'search for them recursively, or glob patterns. All nodes are merged into a '
+                 'single policy.',
+        ).completer = _nodl_files_completer  # type: ignore
+        packages_group = parser.add_mutually_exclusive_group()
+        packages_group.add_argument(
+            '--all-packages',
+            action='store_true',
+            help='Convert the NoDL files exported by every package in the ament index.',
+        )
+        packages_group.add_argument(
+            '--package',
+            nargs='+',
+            dest='packages',
+            metavar='PACKAGE_NAME',
+            help='Convert the NoDL files exported by the given packages.',
+        )
+        parser.add_argument(
+            '-j', '--jobs',
+            type=_positive_int,
+            default=1,
+            help='Number of processes used to parse NoDL files, and of threads used to write '
+                 '--output-dir files, in parallel (default: 1).',
+        )
+        validation_group = parser.add_mutually_exclusive_group()
+        validation_group.add_argument(
+            '--validate',
+            choices=_VALIDATION_MODES,
+            default='full',
+            help='Validate the policy against the sros2 schema in full, only a sample of its '
+                 'enclaves, or not at all (default: full).',
+        )
+        validation_group.add_argument(
+            '--no-validate',
+            action='store_const',
+            const='none',
+            dest='validate',
+            help='Do not validate the policy, same as --validate=none.',
+        )
+        output_group = parser.add_mutually_exclusive_group()
+        output_group.add_argument(
+            '--stream',
+            action='store_true',
+            help='Write the policy one enclave at a time instead of building it whole in memory. '
+                 'Meant for very large systems.',
+        )
+        output_group.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Cache the enclaves generated from each NoDL file, and only convert the files '
+                 'that changed since a previous run.',
+        )
+        output_group.add_argument(
+            '--diff',
+            type=pathlib.Path,
+            metavar='EXISTING_POLICY',
+            help='Rather than writing the policy, print the rules it adds to (+) or removes '
+                 'from (-) an existing policy file.',
+        )
+        output_group.add_argument(
+            '--output-dir',
+            type=pathlib.Path,
+            metavar='DIRECTORY',
+            help='Rather than writing the policy to the standard output, write the policy of '
+                 'each enclave to DIRECTORY/<enclave path>.policy.xml.',
+        )
+        output_group.add_argument(
+            '--merge',
+            type=pathlib.Path,
+            metavar='EXISTING_POLICY',
+            help='Merge the permissions of the nodes into an existing policy file, reusing its '
+                 'enclaves and profiles.',
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='With --output-dir, keep running and rewrite the policies of the enclaves '
+                 'affected whenever a NoDL file or the common profile changes.',
+        )
+        parser.add_argument(
+            '--in-place',
+            action='store_true',
+            help='With --merge, overwrite the existing policy file rather than writing the merged '
+                 'policy to the standard output.',
+        )
+        parser.add_argument(
+            '--enclave-mapping',
+            type=pathlib.Path,
+            metavar='MAPPING_FILE',
+            help='YAML file assigning nodes to namespaces and (shared) enclaves. By default, '
+                 'every node is in the root namespace and in an enclave of its own.',
+        )
+        parser.add_argument(
+            '--compact',
+            action='store_true',
+            help='Fold the names of each permissions tag into wildcard patterns, e.g. '
+                 '"~/sensors/*", that match no other name of the policy.',
+        )
+        parser.add_argument(
+            '--compact-budget',
+            type=_non_negative_int,
+            default=0,
+            metavar='BUDGET',
+            help='With --compact, also use patterns matching up to BUDGET names of the policy a '
+                 'permissions tag did not allow (default: 0).',
+        )
+        parser.add_argument(
+            '--common-profile',
+            type=pathlib.Path,
+            metavar='FILE',
+            help='Write the permissions common to all ROS nodes to FILE once, and have each '
+                 'profile include it rather than list them. Paths are relative to the written '
+                 'policy files, or to the working directory for the standard output.',
+        )
+        parser.add_argument(
+            '--permissions-dir',
+            type=pathlib.Path,
+            metavar='DIRECTORY',
+            help='Also write the DDS permissions of each enclave, as `ros2 security '
+                 'create_permission` would, to DIRECTORY/<enclave path>/permissions.xml. Meant '
+                 'for the enclaves directory of a keystore; permissions are not signed, so '
+                 'enclaves with signed permissions are refused.',
+        )
+        parser.add_argument(
+            '--overwrite-signed-permissions',
+            action='store_true',
+            help='With --permissions-dir, also write the permissions of enclaves with signed '
+                 'permissions, which must then be signed again.',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print the wall time, counters and peak memory of each conversion phase to the '
+                 'standard error.',
+        )
+        parser.add_argument(
+            '--stats-json',
+            type=pathlib.Path,
+            metavar='FILE',
+            help='Write the wall time, counters and peak memory of each conversion phase to '
+                 'FILE as JSON.',
+        )
+        parser.add_argument(
+            '--no-daemon',
+            action='store_true',
+            help='Convert in this process even if a daemon started by the `serve` verb is '
+                 'running.',
+        )
+        parser.add_argument(
+            '--cache-dir',
+            type=pathlib.Path,
+            default=None,
+            help='Directory of the cache used by --incremental '
+                 f'(default: {get_cache_directory() / _FRAGMENTS_DIRECTORY_NAME}).',
+        )
+        parser.add_argument(
+            '--no-nodl-cache',
+            action='store_true',
+            help='Parse every NoDL file, rather than reuse the nodes of unchanged files cached in '
+                 f'{get_cache_directory() / _NODL_CACHE_DIRECTORY_NAME}.',
+        )
+        self._option_defaults = {
+            action.dest: action.default
+            for action in parser._actions
+            if action.dest not in _DAEMON_OPTIONS and action.default != argparse.SUPPRESS
+        }
 
     def main(self, *, args: argparse.Namespace) -> int:
         """High level logic employed by the `convert` verb."""
-        nodl_file_path = args.nodl_file
-        if not nodl_file_path:
-            print('No files to validate', file=sys.stderr)
+        if not (args.stats or args.stats_json):
+            return self._convert(args)
+
+        from nodl_to_policy.stats import collect_stats
+
+        with collect_stats() as stats:
+            return_code = self._convert(args)
+        if args.stats:
+            print(stats.format_table(), file=sys.stderr)
+        if args.stats_json:
+            with open(args.stats_json, 'w') as f:
+                stats.write_json(f)
+        return return_code
+
+    def _convert(self, args: argparse.Namespace) -> int:
+        """Convert the NoDL files, see `main`."""
+        error = _check_arguments(args)
+        if error:
+            print(error, file=sys.stderr)
             return 1
 
-        if not nodl_file_path.is_file():
-            print(f'{nodl_file_path} is not a file')
+        try:
+            nodl_file_paths = _get_nodl_file_paths(args)
+        except (FileNotFoundError, LookupError) as e:
+            # `LookupError` for `ament_index_python.PackageNotFoundError`
+            print(e.args[0], file=sys.stderr)
+            return 1
+        if not nodl_file_paths:
+            print('No files to validate', file=sys.stderr)
             return 1
 
+        if self._is_daemon_supported(args):
+            try:
+                policy_text = request_policy(nodl_file_paths, validate=args.validate)
+            except DaemonError as e:
+                print(e, file=sys.stderr)
+                return 1
+            if policy_text is not None:
+                sys.stdout.write(policy_text)
+                return 0
+
+        import nodl
+
+        enclave_mapping = None
+        if args.enclave_mapping:
+            from nodl_to_policy.mapping import load_enclave_mapping
+
+            try:
+                enclave_mapping = load_enclave_mapping(args.enclave_mapping)
+            except (OSError, ValueError) as e:
+                print(e, file=sys.stderr)
+                return 1
+
+        if args.watch:
+            return _watch(args, nodl_file_paths, enclave_mapping)
+        try:
+            if args.diff:
+                return _print_policy_diff(args, nodl_file_paths, enclave_mapping)
+            if args.stream:
+                return _stream_policy(args, nodl_file_paths, enclave_mapping)
+            policies = _build_policy(args, nodl_file_paths, enclave_mapping)
+        except nodl.errors.NoDLError as e:
+            print(e, file=sys.stderr)
+            return 1
+        if policies is None:
+            return 1
         try:
-            nodl_description = nodl.parse(path=nodl_file_path)
-        except nodl.errors.InvalidNoDLError as e:
-            print(f'Failed to parse {nodl_file_path}', file=sys.stderr)
+            _write_policy(args, *policies)
+        # e.g. an enclave path of a merged policy which is not a name, or signed permissions
+        except (FileExistsError, ValueError) as e:
             print(e, file=sys.stderr)
             return 1
+        return 0
 
-        print_policy(convert_to_policy(nodl_description))
+    def _is_daemon_supported(self, args: argparse.Namespace) -> bool:
+        """Return whether the daemon can convert, i.e. all other options have their default."""
+        return all(
+            getattr(args, dest, default) == default
+            for dest, default in self._option_defaults.items())
 
-        return 0
+
+def _check_arguments(args: argparse.Namespace) -> Optional[str]:
+    """Return an error message if options are missing, or cannot be combined."""
+    if args.in_place and not args.merge:
+        return '--in-place requires --merge'
+    if args.permissions_dir and (args.stream or args.diff):
+        return '--permissions-dir cannot be combined with --stream or --diff'
+    if args.overwrite_signed_permissions and not args.permissions_dir:
+        return '--overwrite-signed-permissions requires --permissions-dir'
+    if args.compact and (args.stream or args.diff):
+        return '--compact cannot be combined with --stream or --diff'
+    if args.common_profile and (args.diff or args.compact):
+        # compaction folds the common names into patterns, which the profile cannot replace
+        return '--common-profile cannot be combined with --diff or --compact'
+    if args.watch and (not args.output_dir or args.compact):
+        return '--watch requires --output-dir, and cannot be combined with --compact'
+    if args.enclave_mapping and args.incremental:
+        return '--enclave-mapping cannot be combined with --incremental'
+    return None
+
+
+def _stream_policy(
+    args: argparse.Namespace, nodl_file_paths: List[pathlib.Path], enclave_mapping: Any
+) -> int:
+    """Write the policy to the standard output one enclave at a time."""
+    from nodl_to_policy.policy import stream_policy
+
+    nodl_description = _parse_nodl_files(args, nodl_file_paths)
+    common_profile_href = _get_common_profile_href(args)
+    sys.stdout.flush()
+    stream_policy(
+        nodl_description, sys.stdout.buffer, validate=args.validate,
+        enclave_mapping=enclave_mapping, common_profile_href=common_profile_href)
+    return 0
+
+
+def _build_policy(
+    args: argparse.Namespace, nodl_file_paths: List[pathlib.Path], enclave_mapping: Any
+) -> Optional[Tuple[Any, Any]]:
+    """
+    Convert the NoDL files into a policy tree, and the tree to write back with --in-place.
+
+    Return `None` if --merge fails to load.
+    """
+    from nodl_to_policy.policy import convert_to_policy
+
+    policy_file = None
+    if args.incremental:
+        from nodl_to_policy.incremental import convert_nodl_files_incrementally
+
+        cache_directory = args.cache_dir or get_cache_directory() / _FRAGMENTS_DIRECTORY_NAME
+        policy = convert_nodl_files_incrementally(
+            nodl_file_paths, cache_directory, jobs=args.jobs)
+    elif args.merge:
+        from lxml import etree
+        from sros2.policy import load_policy
+
+        from nodl_to_policy.policy import convert_to_model, PolicyBuilder
+        from nodl_to_policy.stats import measure_phase
+
+        nodl_description = _parse_nodl_files(args, nodl_file_paths)
+        with measure_phase('convert'):
+            policy_model = convert_to_model(nodl_description, enclave_mapping)
+        try:
+            with measure_phase('load_policy'):
+                policy = load_policy(str(args.merge))
+                if args.in_place:
+                    # as written, as `load_policy` expands the XIncludes of hand-written policies
+                    policy_file = etree.parse(str(args.merge))
+        except (OSError, RuntimeError, SyntaxError) as e:
+            print(f'Failed to load {args.merge}\n{e}', file=sys.stderr)
+            return None
+        has_includes = \
+            policy_file is not None and policy_file.find(f'.//{_XINCLUDE_TAG}') is not None
+        if has_includes and args.compact:
+            print('--compact cannot be combined with --in-place for a policy with XIncludes',
+                  file=sys.stderr)
+            return None
+        with measure_phase('convert'):
+            builder = PolicyBuilder(policy)
+            if has_includes:
+                # the expressions included are already granted, so are not added again
+                PolicyBuilder(policy_file, expanded_policy=policy).add_model(policy_model)
+            else:
+                policy_file = builder.policy
+            builder.add_model(policy_model)
+            policy = builder.policy
+    else:
+        policy = convert_to_policy(
+            _parse_nodl_files(args, nodl_file_paths), enclave_mapping=enclave_mapping)
+
+    if args.compact:
+        from nodl_to_policy.compaction import compact_policy
+
+        compact_policy(policy, args.compact_budget)
+    return policy, policy_file
+
+
+def _write_policy(args: argparse.Namespace, policy: Any, policy_file: Any) -> None:
+    """Write a policy tree to the outputs selected by the options, and --in-place the file's."""
+    # first, as signed permissions refuse the conversion
+    if args.permissions_dir:
+        from nodl_to_policy.permissions import write_permissions
+
+        write_permissions(
+            policy, args.permissions_dir, validate=args.validate,
+            overwrite_signed=args.overwrite_signed_permissions)
+
+    common_profile_href = _get_common_profile_href(args)
+    if args.in_place:
+        _write_policy_file(
+            policy_file, args.merge, validate=args.validate,
+            common_profile_href=common_profile_href)
+
+    if args.output_dir:
+        from nodl_to_policy.policy import write_enclave_policies
+
+        write_enclave_policies(
+            policy, args.output_dir, validate=args.validate, jobs=args.jobs,
+            common_profile=args.common_profile)
+    elif not args.in_place:
+        from nodl_to_policy.policy import print_policy
+
+        print_policy(policy, validate=args.validate, common_profile_href=common_profile_href)
+
+
+def _get_common_profile_href(args: argparse.Namespace) -> Optional[str]:
+    """Write the common profile of --common-profile, returning its path for the policy file."""
+    if not args.common_profile:
+        return None
+    from nodl_to_policy.policy import write_common_profile
+
+    write_common_profile(args.common_profile)
+    # relative to the policy file written, the working directory for the standard output
+    return os.path.relpath(args.common_profile, args.merge.parent if args.in_place else os.curdir)
+
+
+def _watch(
+    args: argparse.Namespace, nodl_file_paths: List[pathlib.Path], enclave_mapping: Any
+) -> int:
+    """Write the policy of each enclave, then those of the enclaves affected by each change."""
+    import nodl
+
+    from nodl_to_policy.permissions import write_permissions
+    from nodl_to_policy.policy import (
+        remove_enclave_policies,
+        write_common_profile,
+        write_enclave_policies,
+    )
+    from nodl_to_policy.watch import observe, PolicyWatcher
+
+    def write(policy: Any) -> None:
+        if args.common_profile:
+            write_common_profile(args.common_profile)
+        if args.permissions_dir:
+            write_permissions(
+                policy, args.permissions_dir, validate=args.validate,
+                overwrite_signed=args.overwrite_signed_permissions)
+        write_enclave_policies(
+            policy, args.output_dir, validate=args.validate, jobs=args.jobs,
+            common_profile=args.common_profile)
+
+    try:
+        watcher = PolicyWatcher(
+            nodl_file_paths, enclave_mapping, jobs=args.jobs, nodl_cache=_get_nodl_cache(args))
+    except nodl.errors.NoDLError as e:
+        print(e, file=sys.stderr)
+        return 1
+    try:
+        write(watcher.policy())
+    except _WRITE_ERRORS as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    # enclaves not written yet after an error, written along with the next change
+    pending_updates: Set[str] = set()
+    pending_removals: Set[str] = set()
+    try:
+        for changed_paths in observe(watcher.paths):
+            try:
+                updated_enclaves, removed_enclaves = watcher.update(changed_paths)
+            except (nodl.errors.NoDLError, OSError, SyntaxError) as e:
+                # keep watching, the file is likely being edited
+                print(e, file=sys.stderr)
+                continue
+            pending_updates = (pending_updates - set(removed_enclaves)) | set(updated_enclaves)
+            pending_removals = (pending_removals - set(updated_enclaves)) | set(removed_enclaves)
+            try:
+                remove_enclave_policies(args.output_dir, pending_removals)
+                write(watcher.policy(pending_updates))
+            except _WRITE_ERRORS as e:
+                # keep watching, e.g. an invalid policy may be fixed by the next change
+                print(e, file=sys.stderr)
+                continue
+            print(f'Updated {len(pending_updates)} and removed {len(pending_removals)} '
+                  f'enclave(s) after changes to {", ".join(map(str, sorted(changed_paths)))}',
+                  file=sys.stderr)
+            pending_updates.clear()
+            pending_removals.clear()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _get_nodl_file_paths(args: argparse.Namespace) -> List[pathlib.Path]:
+    """Gather the NoDL files given on the command line and those exported by packages."""
+    from nodl_to_policy.description import find_nodl_files
+
+    nodl_file_paths = find_nodl_files(args.nodl_files)
+    if args.all_packages or args.packages:
+        from nodl_to_policy.index import find_package_nodl_files
+
+        # with --all-packages, `args.packages` is `None`, i.e. every package
+        known_paths = {path.resolve() for path in nodl_file_paths}
+        nodl_file_paths.extend(
+            path for path in find_package_nodl_files(args.packages)
+            if path.resolve() not in known_paths)
+    return nodl_file_paths
+
+
+def _get_nodl_cache(args: argparse.Namespace) -> Any:
+    """Return the cache of parsed NoDL files, unless --no-nodl-cache is given."""
+    if args.no_nodl_cache:
+        return None
+    from nodl_to_policy.nodl_cache import NoDLCache
+
+    return NoDLCache(get_cache_directory() / _NODL_CACHE_DIRECTORY_NAME)
+
+
+def _parse_nodl_files(args: argparse.Namespace, nodl_file_paths: List[pathlib.Path]) -> List[Any]:
+    """Parse NoDL files, reusing the cached nodes of unchanged files."""
+    from nodl_to_policy.description import parse_nodl_files
+
+    return parse_nodl_files(nodl_file_paths, jobs=args.jobs, nodl_cache=_get_nodl_cache(args))
+
+
+def _print_policy_diff(
+    args: argparse.Namespace, nodl_file_paths: List[pathlib.Path], enclave_mapping: Any
+) -> int:
+    """Print the rules the NoDL files add to, or remove from, the policy of --diff."""
+    from nodl_to_policy import model
+    from nodl_to_policy.policy import convert_to_model
+    from sros2.policy import load_policy
+
+    existing_policy_path = args.diff
+    nodl_description = _parse_nodl_files(args, nodl_file_paths)
+    try:
+        existing_policy = model.Policy.from_etree(load_policy(str(existing_policy_path)))
+    except (OSError, RuntimeError, SyntaxError) as e:  # lxml parse errors are SyntaxErrors
+        print(f'Failed to load {existing_policy_path}\n{e}', file=sys.stderr)
+        return 1
+
+    additions, removals = model.diff(
+        existing_policy, convert_to_model(nodl_description, enclave_mapping))
+    for sign, rules in (('-', removals), ('+', additions)):
+        for rule in rules:
+            print(sign, _format_rule(rule))
+    return 0
+
+
+def _write_policy_file(
+    policy: Any, path: pathlib.Path, validate: str, common_profile_href: Optional[str]
+) -> None:
+    """Write a policy to a file, replacing it only once the policy is complete and validated."""
+    import io
+
+    from nodl_to_policy.cache import write_atomically
+    from nodl_to_policy.policy import write_policy
+
+    stream = io.StringIO()
+    write_policy(policy, stream, validate=validate, common_profile_href=common_profile_href)
+    write_atomically(path, stream.getvalue().encode())
+
+
+def _format_rule(rule: Tuple[str, ...]) -> str:
+    """Format a rule, e.g. "/talker /talker topic publish=ALLOW chatter"."""
+    enclave_path, ns, node, permission_type, rule_type, rule_expression, expression = rule
+    return f'{enclave_path} {ns.rstrip("/")}/{node} {permission_type} ' \
+        f'{rule_type}={rule_expression} {expression}'
+
+
+def _nodl_files_completer(prefix: str, **kwargs: Any) -> List[str]:
+    """Complete NoDL file and directory paths, importing `argcomplete` only when completing."""
+    from argcomplete.completers import FilesCompleter
+
+    return FilesCompleter(allowednames=[_NODL_FILE_EXTENSION], directories=True)(
+        prefix, **kwargs)
+
+
+def _positive_int(value: str) -> int:
+    """Parse a strictly positive integer command line argument."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive integer')
+    return number
+
+
+def _non_negative_int(value: str) -> int:
+    """Parse a non-negative integer command line argument."""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f'{value} is not a non-negative integer')
+    return number
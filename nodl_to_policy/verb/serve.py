@@ -0,0 +1,45 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import pathlib
+import sys
+
+from nodl_to_policy.client import get_socket_path
+from ros2cli.verb import VerbExtension
+
+
+class ServeVerb(VerbExtension):
+    """Run a daemon answering the requests of the `convert` verb."""
+
+    def add_arguments(self, parser: argparse.ArgumentParser, cli_name: None = None) -> None:
+        """Argument addition for the `serve` verb."""
+        parser.add_argument(
+            '--socket',
+            type=pathlib.Path,
+            default=None,
+            help=f'Path of the Unix socket to listen on (default: {get_socket_path()}).',
+        )
+
+    def main(self, *, args: argparse.Namespace) -> int:
+        """High level logic employed by the `serve` verb."""
+        # imported here, since every verb module is imported for `ros2 nodl_to_policy --help`
+        from nodl_to_policy.daemon import serve
+
+        try:
+            serve(args.socket or get_socket_path())
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return 1
+        return 0
@@ -0,0 +1,310 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Regeneration of a policy as the NoDL files it is generated from change.
+
+`PolicyWatcher` keeps the nodes of each file and the enclaves generated from them in memory, so
+that a change only re-parses the file that changed and regenerates the enclaves of its nodes.
+`observe` reports changes to files with inotify on Linux, and by polling their status elsewhere.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import pathlib
+import select
+import struct
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from lxml import etree
+
+from nodl.types import Node
+import nodl_to_policy.common
+from nodl_to_policy.common.profile import reload_common_profile
+from nodl_to_policy.description import parse_each_nodl_file
+from nodl_to_policy.mapping import assign_node, EnclaveMapping
+from nodl_to_policy.nodl_cache import NoDLCache
+from nodl_to_policy.policy import convert_to_policy, init_policy
+
+
+# inotify(7) constants, see <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+# editors save files in place, or write a new file and move it over the old one
+_IN_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_IN_EVENT_HEADER = struct.Struct('iIII')
+
+# how long to wait for more events after a change, since saving a file may take several writes
+_SETTLE_TIME = 0.05
+_DEFAULT_POLL_INTERVAL = 0.5
+
+
+class PolicyWatcher:
+    """The policy of a set of NoDL files, updated one changed file at a time."""
+
+    def __init__(
+        self, nodl_file_paths: Sequence[pathlib.Path],
+        enclave_mapping: Optional[EnclaveMapping] = None, *, jobs: int = 1,
+        nodl_cache: Optional[NoDLCache] = None
+    ) -> None:
+        """
+        Parse NoDL files, and convert them into a policy.
+
+        :param nodl_file_paths: Paths of the NoDL files to convert.
+        :type nodl_file_paths: Sequence[pathlib.Path]
+        :param enclave_mapping: The enclave and namespace of nodes, see `nodl_to_policy.mapping`.
+        :type enclave_mapping: Optional[nodl_to_policy.mapping.EnclaveMapping]
+        :param jobs: Maximum number of worker processes to parse the files with initially.
+        :type jobs: int
+        :param nodl_cache: Cache of parsed files to reuse initially, see `parse_nodl_files`.
+        :type nodl_cache: Optional[nodl_to_policy.nodl_cache.NoDLCache]
+        :raises nodl.errors.NoDLError: If any of the files is not a valid NoDL description.
+        """
+        self._enclave_mapping = enclave_mapping
+        # file path -> nodes, in input order
+        self._nodes: Dict[pathlib.Path, List[Node]] = dict(
+            zip(nodl_file_paths, parse_each_nodl_file(
+                nodl_file_paths, jobs, nodl_cache=nodl_cache)))
+        # enclave path -> "enclave" tag, in the order `convert_to_policy` would generate them
+        self._enclaves: Dict[str, etree._Element] = {}
+        self._update_enclaves(None)
+
+    @property
+    def paths(self) -> List[pathlib.Path]:
+        """The NoDL files and common profile files the policy is generated from."""
+        return list(self._nodes) + _get_common_profile_paths()
+
+    def policy(self, enclave_paths: Optional[Iterable[str]] = None) -> etree._Element:
+        """
+        Return the policy, or the policy of some of its enclaves.
+
+        The enclaves are moved to the returned policy rather than copied, so only the latest
+        policy returned is complete.
+
+        :param enclave_paths: Paths of the enclaves to return the policy of, all by default.
+        :type enclave_paths: Optional[Iterable[str]]
+        :return: LXML Element representing a completed "policy" tag.
+        :rtype: etree._Element
+        """
+        if enclave_paths is None:
+            enclave_paths = self._enclaves
+        policy = init_policy()
+        policy.find('enclaves').extend(self._enclaves[path] for path in enclave_paths)
+        return policy
+
+    def update(self, changed_paths: Iterable[pathlib.Path]) -> Tuple[List[str], List[str]]:
+        """
+        Re-parse changed NoDL files, and regenerate the enclaves of the nodes they describe.
+
+        If a common profile file changed, the common profile is reloaded and every enclave is
+        regenerated. Nothing is updated if a changed file cannot be parsed.
+
+        :param changed_paths: Paths of the files that changed, among `paths`.
+        :type changed_paths: Iterable[pathlib.Path]
+        :return: The paths of the enclaves regenerated, and of those no longer in the policy.
+        :rtype: Tuple[List[str], List[str]]
+        :raises nodl.errors.NoDLError: If a changed file is not a valid NoDL description.
+        :raises OSError: If a changed file cannot be read.
+        """
+        changed_paths = set(changed_paths)
+        changed_nodl_file_paths = [path for path in self._nodes if path in changed_paths]
+        changed_nodes = dict(zip(
+            changed_nodl_file_paths, parse_each_nodl_file(changed_nodl_file_paths)))
+
+        # `None` for all enclaves
+        affected_enclaves: Optional[Set[str]] = None
+        if changed_paths.isdisjoint(_get_common_profile_paths()):
+            affected_enclaves = set()
+            for path, nodes in changed_nodes.items():
+                # enclaves the file's nodes left, as well as those they are now in
+                affected_enclaves.update(self._get_enclave_paths(self._nodes[path]))
+                affected_enclaves.update(self._get_enclave_paths(nodes))
+        else:
+            reload_common_profile()
+        self._nodes.update(changed_nodes)
+
+        removed_enclaves = self._update_enclaves(affected_enclaves)
+        updated_enclaves = [
+            path for path in self._enclaves
+            if affected_enclaves is None or path in affected_enclaves]
+        return updated_enclaves, removed_enclaves
+
+    def _update_enclaves(self, enclave_paths: Optional[Set[str]]) -> List[str]:
+        """Regenerate some enclaves, or all of them, returning the paths of removed enclaves."""
+        nodes_by_enclave: Dict[str, List[Node]] = {}
+        for nodes in self._nodes.values():
+            for node in nodes:
+                enclave_path = assign_node(node.name, self._enclave_mapping).enclave
+                nodes_by_enclave.setdefault(enclave_path, []).append(node)
+
+        regenerated_nodes = [
+            node
+            for enclave_path, nodes in nodes_by_enclave.items()
+            if enclave_paths is None or enclave_path in enclave_paths
+            for node in nodes
+        ]
+        regenerated_enclaves = {
+            enclave.attrib['path']: enclave
+            for enclave in convert_to_policy(
+                regenerated_nodes, enclave_mapping=self._enclave_mapping).find('enclaves')
+        }
+
+        removed_enclaves = [path for path in self._enclaves if path not in nodes_by_enclave]
+        self._enclaves = {
+            enclave_path: regenerated_enclaves[enclave_path]
+            if enclave_path in regenerated_enclaves else self._enclaves[enclave_path]
+            for enclave_path in nodes_by_enclave
+        }
+        return removed_enclaves
+
+    def _get_enclave_paths(self, nodes: Iterable[Node]) -> Set[str]:
+        return {
+            assign_node(node.name, self._enclave_mapping).enclave for node in nodes}
+
+
+def observe(
+    paths: Iterable[pathlib.Path], poll_interval: Optional[float] = None
+) -> Iterator[Set[pathlib.Path]]:
+    """
+    Wait for files to change, yielding the paths of the files that changed each time.
+
+    Files are watched with inotify on Linux, and their status polled every `poll_interval`
+    seconds otherwise, or if a polling interval is given.
+
+    :param paths: Paths of the files to watch.
+    :type paths: Iterable[pathlib.Path]
+    :param poll_interval: Interval between polls, to poll rather than use inotify.
+    :type poll_interval: Optional[float]
+    :return: An endless iterator of sets of changed paths, each one of `paths`.
+    :rtype: Iterator[Set[pathlib.Path]]
+    """
+    paths = list(paths)
+    if poll_interval is None and sys.platform.startswith('linux'):
+        try:
+            inotify_fd, watch_descriptors = _init_inotify(paths)
+        except OSError:
+            pass
+        else:
+            try:
+                yield from _observe_inotify(inotify_fd, watch_descriptors, paths)
+            finally:
+                os.close(inotify_fd)
+            return
+    yield from _observe_polling(paths, poll_interval or _DEFAULT_POLL_INTERVAL)
+
+
+def _init_inotify(paths: List[pathlib.Path]) -> Tuple[int, Dict[int, pathlib.Path]]:
+    """
+    Create an inotify instance watching the directories of files, and of the files they link to.
+
+    :param paths: Paths of the files to watch.
+    :type paths: List[pathlib.Path]
+    :return: The inotify file descriptor, and the directory of each watch descriptor.
+    :rtype: Tuple[int, Dict[int, pathlib.Path]]
+    :raises OSError: If inotify is not available, or a directory cannot be watched.
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    inotify_fd = libc.inotify_init1(os.O_CLOEXEC)
+    if inotify_fd < 0:
+        raise OSError(ctypes.get_errno(), 'Failed to initialize inotify')
+    watch_descriptors = {}
+    try:
+        # resolved, so that the directories reached through several paths are watched once
+        directories = {path.parent.resolve() for path in paths}
+        # e.g. the files installed by `colcon build --symlink-install` link to the sources edited
+        directories.update(path.resolve().parent for path in paths)
+        for directory in directories:
+            # watch directories rather than files, whose inode changes when they are replaced
+            watch_descriptor = libc.inotify_add_watch(
+                inotify_fd, os.fsencode(directory), _IN_WATCH_MASK)
+            if watch_descriptor < 0:
+                raise OSError(ctypes.get_errno(), f'Failed to watch {directory}')
+            watch_descriptors[watch_descriptor] = directory
+    except OSError:
+        os.close(inotify_fd)
+        raise
+    return inotify_fd, watch_descriptors
+
+
+def _observe_inotify(
+    inotify_fd: int, watch_descriptors: Dict[int, pathlib.Path], paths: List[pathlib.Path]
+) -> Iterator[Set[pathlib.Path]]:
+    """Yield the paths of watched files changed, as reported by an inotify instance."""
+    # path of a watched file, or of the file it links to, in a resolved directory -> watched paths
+    watched_paths: Dict[pathlib.Path, Set[pathlib.Path]] = {}
+    for path in paths:
+        watched_paths.setdefault(path.parent.resolve() / path.name, set()).add(path)
+        watched_paths.setdefault(path.resolve(), set()).add(path)
+    while True:
+        changed_paths: Set[pathlib.Path] = set()
+        timeout: Optional[float] = None
+        while select.select([inotify_fd], [], [], timeout)[0]:
+            buffer = os.read(inotify_fd, 64 * 1024)
+            offset = 0
+            while offset < len(buffer):
+                watch_descriptor, mask, _, name_length = _IN_EVENT_HEADER.unpack_from(
+                    buffer, offset)
+                offset += _IN_EVENT_HEADER.size
+                name = buffer[offset:offset + name_length].rstrip(b'\0')
+                offset += name_length
+                if mask & _IN_Q_OVERFLOW:
+                    # events were dropped, so any file may have changed
+                    changed_paths.update(paths)
+                    continue
+                directory = watch_descriptors.get(watch_descriptor)
+                if directory is not None:
+                    changed_paths.update(watched_paths.get(directory / os.fsdecode(name), ()))
+            # collect the other events of the same save
+            timeout = _SETTLE_TIME
+        if changed_paths:
+            yield changed_paths
+
+
+def _observe_polling(
+    paths: List[pathlib.Path], poll_interval: float
+) -> Iterator[Set[pathlib.Path]]:
+    """Yield the paths of files whose status changed, polling it every `poll_interval`."""
+    statuses = {path: _get_status(path) for path in paths}
+    while True:
+        time.sleep(poll_interval)
+        changed_paths: Set[pathlib.Path] = set()
+        for path, status in statuses.items():
+            new_status = _get_status(path)
+            if new_status != status:
+                statuses[path] = new_status
+                changed_paths.add(path)
+        if changed_paths:
+            yield changed_paths
+
+
+def _get_status(path: pathlib.Path) -> Optional[Tuple[int, int, int]]:
+    """Return what identifies a version of a file, or `None` if it does not exist."""
+    try:
+        status = path.stat()
+    except FileNotFoundError:
+        return None
+    return status.st_ino, status.st_mtime_ns, status.st_size
+
+
+def _get_common_profile_paths() -> List[pathlib.Path]:
+    """Return the paths of the common profile files, see `nodl_to_policy.common.profile`."""
+    common_directory = pathlib.Path(nodl_to_policy.common.__file__).parent
+    return [common_directory / 'node.xml'] + sorted((common_directory / 'node').glob('*.xml'))
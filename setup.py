@@ -55,7 +55,8 @@ setup(
             'nodl_to_policy = nodl_to_policy.command.nodl_to_policy:NoDLToPolicyCommand',
         ],
         'nodl_to_policy.verb': [
-            'convert = nodl_to_policy.verb.convert:ConvertVerb'
+            'convert = nodl_to_policy.verb.convert:ConvertVerb',
+            'serve = nodl_to_policy.verb.serve:ServeVerb',
         ]
     },
     package_data={
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark the phases of policy generation over synthetic NoDL descriptions.
+
+Each phase is timed separately for every requested number of nodes, and the results are
+written as JSON. Given the results of a previous run, phases that got slower than a threshold
+are reported and make the script exit with a non-zero status, e.g.:
+
+    python3 benchmark_policy.py --nodes 100 1000 --output new.json --compare old.json
+"""
+
+import argparse
+import io
+import json
+import pathlib
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from lxml import etree
+import nodl_to_policy.policy as policy
+from synthetic import generate_nodes
+
+
+def measure(function: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Time `repeat` calls of `function`, returning the fastest and median wall times."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings), 'repeat': repeat}
+
+
+def benchmark(node_count: int, repeat: int, **generator_parameters: Any) -> Dict[str, Any]:
+    """Benchmark every phase of policy generation for a description of `node_count` nodes."""
+    nodes = generate_nodes(node_count, **generator_parameters)
+    converted_policy = policy.convert_to_policy(nodes)
+    largest_node = max(nodes, key=lambda node: len(node.topics))
+    topic_names = list(largest_node.topics)
+    node_names = [node.name for node in nodes]
+
+    def add_permissions():
+        profile = etree.Element('profile', ns='/', node=largest_node.name)
+        policy.add_permissions(profile, largest_node, 'topic', 'publish', topic_names)
+
+    def get_profile():
+        for node_name in node_names:
+            policy.get_profile(converted_policy, node_name)
+
+    def policy_builder_get_profile():
+        builder = policy.PolicyBuilder()
+        for node_name in node_names:
+            builder.get_profile(node_name)
+
+    return {
+        'convert_to_policy': measure(lambda: policy.convert_to_policy(nodes), repeat),
+        'add_permissions': measure(add_permissions, repeat),
+        'get_profile': measure(get_profile, repeat),
+        'PolicyBuilder.get_profile': measure(policy_builder_get_profile, repeat),
+        'print_policy': measure(
+            lambda: policy.write_policy(converted_policy, io.StringIO()), repeat),
+        'print_policy(validate=none)': measure(
+            lambda: policy.write_policy(converted_policy, io.StringIO(), validate='none'),
+            repeat),
+        'stream_policy': measure(lambda: policy.stream_policy(nodes, io.BytesIO()), repeat),
+    }
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> List[str]:
+    """Return a description of every phase more than `threshold` times slower than baseline."""
+    regressions = []
+    for node_count, phases in results['results'].items():
+        baseline_phases = baseline.get('results', {}).get(node_count, {})
+        for phase, timing in phases.items():
+            baseline_timing = baseline_phases.get(phase)
+            if baseline_timing and timing['min'] > threshold * baseline_timing['min']:
+                regressions.append(
+                    f'{phase} with {node_count} nodes: {timing["min"]:.6f}s, '
+                    f'was {baseline_timing["min"]:.6f}s')
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--nodes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--topics-per-node', type=int, default=10)
+    parser.add_argument('--services-per-node', type=int, default=5)
+    parser.add_argument('--actions-per-node', type=int, default=2)
+    parser.add_argument('--both-ratio', type=float, default=0.1)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--output', type=pathlib.Path, help='Path of the JSON file to write results to.')
+    parser.add_argument(
+        '--compare', type=pathlib.Path, help='Path of the JSON results of a previous run.')
+    parser.add_argument(
+        '--threshold', type=float, default=1.5,
+        help='Slowdown ratio over the previous run reported as a regression (default: 1.5).')
+    args = parser.parse_args(argv)
+
+    generator_parameters = {
+        'topics_per_node': args.topics_per_node,
+        'services_per_node': args.services_per_node,
+        'actions_per_node': args.actions_per_node,
+        'both_ratio': args.both_ratio,
+        'duplicate_ratio': args.duplicate_ratio,
+        'seed': args.seed,
+    }
+    results: Dict[str, Any] = {
+        'python': platform.python_version(),
+        'lxml': '.'.join(str(part) for part in etree.LXML_VERSION),
+        'parameters': generator_parameters,
+        'results': {
+            str(node_count): benchmark(node_count, args.repeat, **generator_parameters)
+            for node_count in args.nodes
+        },
+    }
+
+    for node_count, phases in results['results'].items():
+        for phase, timing in phases.items():
+            print(f'{node_count:>8} nodes  {phase:<30} {timing["min"]:.6f}s')
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + '\n')
+
+    if args.compare:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.threshold)
+        for regression in regressions:
+            print(f'regression: {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Generators of synthetic NoDL descriptions, to benchmark policy generation."""
+
+import random
+from typing import List
+
+from nodl.types import (
+    Action,
+    Node,
+    PubSubRole,
+    ServerClientRole,
+    Service,
+    Topic,
+)
+
+
+def generate_nodes(
+    node_count: int = 100, *, topics_per_node: int = 10, services_per_node: int = 5,
+    actions_per_node: int = 2, both_ratio: float = 0.1, duplicate_ratio: float = 0.1,
+    seed: int = 0
+) -> List[Node]:
+    """
+    Generate a NoDL description of `node_count` nodes with the given interface counts.
+
+    Interfaces are given the `BOTH` role with probability `both_ratio`, and are otherwise evenly
+    split between the two other roles. Every fourth interface name is private to its node,
+    e.g. "node_3/topic_4", which policies express relative to the node ("~/topic_4").
+    With probability `duplicate_ratio`, an interface instead reuses another public name of the
+    same node with a leading slash, which yields the same policy expression and is hence skipped
+    as a duplicate by `add_permissions`. Private names are never reused that way, since
+    "/node_3/topic_4" is relative to the namespace ("node_3/topic_4") rather than to the node.
+
+    :param node_count: Number of nodes to generate.
+    :param topics_per_node: Number of topics of each node.
+    :param services_per_node: Number of services of each node.
+    :param actions_per_node: Number of actions of each node.
+    :param both_ratio: Ratio of interfaces with the `BOTH` role, in [0, 1].
+    :param duplicate_ratio: Ratio of interfaces whose policy expression is a duplicate, in [0, 1].
+    :param seed: Seed of the random generator, so that descriptions are reproducible.
+    :return: The list of generated `nodl.Node` objects.
+    """
+    rng = random.Random(seed)
+
+    def names(node_name: str, kind: str, count: int) -> List[str]:
+        generated: List[str] = []
+        for index in range(count):
+            public_names = [name for name in generated if '/' not in name]
+            if public_names and rng.random() < duplicate_ratio:
+                generated.append('/' + rng.choice(public_names))
+                continue
+            if index % 4 == 3:
+                generated.append(f'{node_name}/{kind}_{index}')
+            else:
+                generated.append(f'{kind}_{index}')
+        return generated
+
+    def role(single_roles, both_role):
+        if rng.random() < both_ratio:
+            return both_role
+        return rng.choice(single_roles)
+
+    nodes = []
+    for node_index in range(node_count):
+        node_name = f'node_{node_index}'
+        nodes.append(Node(
+            name=node_name,
+            executable=f'executable_{node_index}',
+            topics=[
+                Topic(
+                    name=name, message_type='std_msgs/msg/String',
+                    role=role((PubSubRole.PUBLISHER, PubSubRole.SUBSCRIPTION), PubSubRole.BOTH))
+                for name in names(node_name, 'topic', topics_per_node)
+            ],
+            services=[
+                Service(
+                    name=name, service_type='std_srvs/srv/Empty',
+                    role=role(
+                        (ServerClientRole.SERVER, ServerClientRole.CLIENT),
+                        ServerClientRole.BOTH))
+                for name in names(node_name, 'service', services_per_node)
+            ],
+            actions=[
+                Action(
+                    name=name, action_type='example_interfaces/action/Fibonacci',
+                    role=role(
+                        (ServerClientRole.SERVER, ServerClientRole.CLIENT),
+                        ServerClientRole.BOTH))
+                for name in names(node_name, 'action', actions_per_node)
+            ],
+        ))
+    return nodes
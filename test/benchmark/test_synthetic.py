@@ -0,0 +1,85 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import benchmark_policy
+import nodl
+import nodl_to_policy.policy as policy
+from synthetic import generate_nodes
+
+
+def test_generate_nodes():
+    """Test that generated descriptions have the requested shape, reproducibly."""
+    nodes = generate_nodes(
+        20, topics_per_node=8, services_per_node=4, actions_per_node=2, both_ratio=1.0,
+        duplicate_ratio=0.0)
+
+    assert [node.name for node in nodes] == [f'node_{index}' for index in range(20)]
+    assert all(len(node.topics) == 8 for node in nodes)
+    assert all(len(node.services) == 4 for node in nodes)
+    assert all(len(node.actions) == 2 for node in nodes)
+    assert all(
+        topic.role is nodl.types.PubSubRole.BOTH
+        for node in nodes for topic in node.topics.values())
+    assert 'node_0/topic_3' in nodes[0].topics
+
+    assert generate_nodes(5, seed=1) == generate_nodes(5, seed=1)
+
+
+def test_generate_nodes_duplicates():
+    """Test that the duplicate ratio controls the number of duplicate expressions."""
+    unique_nodes = generate_nodes(10, topics_per_node=50, duplicate_ratio=0.0)
+    duplicate_nodes = generate_nodes(10, topics_per_node=50, duplicate_ratio=0.5)
+
+    def duplicates(nodes):
+        return sum(
+            topic_name.startswith('/') for node in nodes for topic_name in node.topics)
+
+    assert duplicates(unique_nodes) == 0
+    assert duplicates(duplicate_nodes) > 0
+
+    def topic_expressions(nodes):
+        converted_policy = policy.convert_to_policy(nodes)
+        return [
+            len(set(converted_policy.xpath(
+                f'//profile[@node="{node.name}"]//topic/text()')))
+            for node in nodes
+        ]
+
+    common_count, = topic_expressions(generate_nodes(1, topics_per_node=0))
+    # every duplicate name yields the policy expression of another name of its node
+    assert topic_expressions(duplicate_nodes) == [
+        common_count + sum(not topic_name.startswith('/') for topic_name in node.topics)
+        for node in duplicate_nodes
+    ]
+
+
+def test_benchmark_main(tmp_path):
+    """Smoke test the benchmark script, and its comparison against previous results."""
+    output_path = tmp_path / 'results.json'
+    argv = ['--nodes', '2', '5', '--repeat', '1', '--output', str(output_path)]
+    assert not benchmark_policy.main(argv)
+
+    results = json.loads(output_path.read_text())
+    assert set(results['results']) == {'2', '5'}
+    assert 'convert_to_policy' in results['results']['5']
+
+    # pretend that the previous run was a lot faster
+    for phases in results['results'].values():
+        for timing in phases.values():
+            timing['min'] /= 1e6
+    baseline_path = tmp_path / 'baseline.json'
+    baseline_path.write_text(json.dumps(results))
+    assert benchmark_policy.main(argv + ['--compare', str(baseline_path)])
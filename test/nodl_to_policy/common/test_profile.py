@@ -155,3 +155,50 @@ def test__get_items_by_role(mocker, simple_profile):
 
     assert len(common_profile._get_items_by_role('topics', 'publish')) == 1
     assert common_profile._get_items_by_role('topics', 'publish')[0].text == 'foo'
+
+
+@pytest.fixture
+def clean_common_profile():
+    common_profile.invalidate_common_profile()
+    yield
+    common_profile.invalidate_common_profile()
+
+
+def test_common_items_parsed_once(mocker, clean_common_profile):
+    """Test that `common_items` only parses the common profile on the first call."""
+    get_profile_mock = mocker.patch(
+        'nodl_to_policy.common.profile._get_profile',
+        wraps=common_profile._get_profile)
+
+    first_items = common_profile.common_items()
+    assert common_profile.common_items() is first_items
+    assert common_profile.common_item_names('topics', 'publish') == ('rosout', '/parameter_events')
+    assert get_profile_mock.call_count == 1
+
+
+def test_common_items_buckets(clean_common_profile):
+    """Test that `common_items` exposes every common role as an immutable tuple of names."""
+    items = common_profile.common_items()
+    assert set(items) == set(common_profile.COMMON_ROLES)
+    assert items[('topics', 'subscribe')] == ('/clock', '/parameter_events')
+    assert all(isinstance(names, tuple) for names in items.values())
+    with pytest.raises(TypeError):
+        items[('topics', 'publish')] = ()  # type: ignore
+
+    assert common_profile.common_item_names('actions', 'call') == ()
+
+
+def test_invalidate_common_profile(mocker, clean_common_profile):
+    """Test that invalidating or reloading the common profile parses it again."""
+    get_profile_mock = mocker.patch(
+        'nodl_to_policy.common.profile._get_profile',
+        wraps=common_profile._get_profile)
+
+    common_profile.common_items()
+    common_profile.invalidate_common_profile()
+    common_profile.common_items()
+    assert get_profile_mock.call_count == 2
+
+    common_profile.reload_common_profile()
+    common_profile.common_items()
+    assert get_profile_mock.call_count == 3
@@ -0,0 +1,61 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from pathlib import Path
+import stat
+
+import nodl_to_policy.cache as cache
+import pytest
+
+
+def test_get_cache_directory(monkeypatch, tmp_path):
+    """Test that the cache directory honours `XDG_CACHE_HOME`."""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    assert cache.get_cache_directory() == tmp_path / 'nodl_to_policy'
+
+    monkeypatch.delenv('XDG_CACHE_HOME')
+    assert cache.get_cache_directory() == Path.home() / '.cache' / 'nodl_to_policy'
+
+
+def test_write_atomically(mocker, tmp_path):
+    """Test that files are replaced as a whole, and left untouched if writing fails."""
+    path = tmp_path / 'sub' / 'file.txt'
+    cache.write_atomically(path, b'first')
+    cache.write_atomically(path, b'second')
+    assert path.read_bytes() == b'second'
+
+    mocker.patch('nodl_to_policy.cache.os.replace', side_effect=OSError)
+    with pytest.raises(OSError):
+        cache.write_atomically(path, b'third')
+    assert path.read_bytes() == b'second'
+    assert [child.name for child in path.parent.iterdir()] == ['file.txt']
+
+
+@pytest.fixture
+def umask():
+    previous_umask = os.umask(0o022)
+    yield 0o022
+    os.umask(previous_umask)
+
+
+def test_write_atomically_mode(tmp_path, umask):
+    """Test that replaced files keep their mode, and that new files follow the umask."""
+    path = tmp_path / 'file.txt'
+    cache.write_atomically(path, b'first')
+    assert stat.S_IMODE(path.stat().st_mode) == 0o666 & ~umask
+
+    path.chmod(0o640)
+    cache.write_atomically(path, b'second')
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
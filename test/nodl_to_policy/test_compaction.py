@@ -0,0 +1,142 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+
+from lxml import etree
+import nodl
+from nodl_to_policy.compaction import compact_policy
+import nodl_to_policy.policy as policy
+import pytest
+
+
+_TEST_POLICY = """
+<policy version="0.2.0">
+  <enclaves>
+    <enclave path="/robot/sensing">
+      <profiles>
+        <profile ns="/robot" node="sensing">
+          <topics publish="ALLOW">
+            <topic>~/sensors/imu</topic>
+            <topic>status</topic>
+            <topic>~/sensors/lidar</topic>
+            <topic>~/sensors/camera/image</topic>
+            <topic>~/debug/a</topic>
+            <topic>~/debug/b</topic>
+          </topics>
+          <topics subscribe="DENY">
+            <topic>~/sensors/imu</topic>
+            <topic>~/sensors/lidar</topic>
+          </topics>
+        </profile>
+      </profiles>
+    </enclave>
+    <enclave path="/robot/monitor">
+      <profiles>
+        <profile ns="/robot" node="monitor">
+          <topics subscribe="ALLOW">
+            <topic>sensing/debug/c</topic>
+            <topic>sensing/odometry</topic>
+            <topic>/robot/diagnostics</topic>
+            <topic>sensing/sensors/*</topic>
+          </topics>
+        </profile>
+      </profiles>
+    </enclave>
+  </enclaves>
+</policy>
+"""
+
+
+def _get_expressions(test_policy, xpath):
+    return [element.text for element in test_policy.find(xpath)]
+
+
+def test_compact_policy():
+    """Test that names are folded into patterns matching no other name of the policy."""
+    test_policy = etree.fromstring(_TEST_POLICY)
+    assert compact_policy(test_policy) == 2
+    assert _get_expressions(test_policy, './/profile[@node="sensing"]/topics[@publish]') == [
+        '~/sensors/*', 'status', '~/debug/a', '~/debug/b']
+    # denied names and existing patterns are left untouched
+    assert _get_expressions(test_policy, './/profile[@node="sensing"]/topics[@subscribe]') == [
+        '~/sensors/imu', '~/sensors/lidar']
+    assert _get_expressions(test_policy, './/profile[@node="monitor"]/topics') == [
+        'sensing/debug/c', 'sensing/odometry', '/robot/diagnostics', 'sensing/sensors/*']
+
+
+def test_compact_policy_budget():
+    """Test that patterns may allow up to `budget` names the permissions tag did not allow."""
+    test_policy = etree.fromstring(_TEST_POLICY)
+    assert compact_policy(test_policy, budget=1) == 3
+    assert _get_expressions(test_policy, './/profile[@node="sensing"]/topics[@publish]') == [
+        '~/sensors/*', 'status', '~/debug/*']
+
+    test_policy = etree.fromstring(_TEST_POLICY)
+    assert compact_policy(test_policy, budget=2) == 4
+    assert _get_expressions(test_policy, './/profile[@node="sensing"]/topics[@publish]') == [
+        '~/*', 'status']
+
+    with pytest.raises(ValueError):
+        compact_policy(test_policy, budget=-1)
+
+
+def test_compact_policy_valid(test_nodl_path):
+    """Test that a compacted policy is still valid, and compacting it again is a no-op."""
+    test_policy = policy.convert_to_policy(nodl.parse(test_nodl_path))
+    assert compact_policy(test_policy)
+    policy.write_policy(test_policy, io.StringIO())
+    assert not compact_policy(test_policy)
+
+
+def test_compact_policy_includes():
+    """Test that XIncludes, e.g. of the common profile, are left untouched."""
+    test_policy = etree.fromstring(_TEST_POLICY)
+    include = etree.SubElement(
+        test_policy.find('.//profile[@node="monitor"]'),
+        '{http://www.w3.org/2003/XInclude}include',
+        {'href': 'common/node.xml', 'xpointer': 'xpointer(/profile/*)'})
+    assert compact_policy(test_policy) == 2
+    assert include.getparent() is not None
+
+
+def test_compact_policy_actions():
+    """Test that patterns do not match the topics and services of the policy's actions."""
+    test_policy = etree.fromstring("""
+<policy version="0.2.0">
+  <enclaves>
+    <enclave path="/node">
+      <profiles>
+        <profile ns="/" node="node">
+          <topics publish="ALLOW">
+            <topic>~/a</topic>
+            <topic>~/b</topic>
+          </topics>
+          <services reply="ALLOW">
+            <service>~/c</service>
+            <service>~/d</service>
+          </services>
+          <actions call="ALLOW">
+            <action>~/act</action>
+          </actions>
+        </profile>
+      </profiles>
+    </enclave>
+  </enclaves>
+</policy>
+""")
+    assert compact_policy(test_policy) == 0
+    assert compact_policy(test_policy, budget=2) == 1
+    assert _get_expressions(test_policy, './/topics') == ['~/*']
+    assert _get_expressions(test_policy, './/services') == ['~/c', '~/d']
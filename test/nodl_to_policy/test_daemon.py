@@ -0,0 +1,156 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import socket
+import stat
+import threading
+
+import nodl
+import nodl_to_policy.client as client
+import nodl_to_policy.daemon as daemon
+import nodl_to_policy.policy as policy
+import pytest
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return tmp_path / 'daemon.sock'
+
+
+@pytest.fixture
+def server(socket_path):
+    with daemon.PolicyServer(socket_path) as server:
+        server.warm_up()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        yield server
+        server.shutdown()
+        thread.join()
+
+
+def _expected_policy(test_nodl_path, validate='full'):
+    stream = io.StringIO()
+    policy.write_policy(
+        policy.convert_to_policy(nodl.parse(test_nodl_path)), stream, validate=validate)
+    return stream.getvalue()
+
+
+def test_get_socket_path(monkeypatch, tmp_path):
+    """Test that the socket lives in the runtime directory if there is one."""
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    assert client.get_socket_path() == tmp_path / 'nodl_to_policy.sock'
+
+    monkeypatch.delenv('XDG_RUNTIME_DIR')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    assert client.get_socket_path() == \
+        tmp_path / 'cache' / 'nodl_to_policy' / 'nodl_to_policy.sock'
+
+
+def test_request_policy_no_daemon(socket_path):
+    """Test that requests return `None` when no daemon is listening."""
+    assert client.request_policy([], socket_path=socket_path) is None
+
+
+def test_request_policy(server, socket_path, test_nodl_path):
+    """Test that the daemon writes the same policy as a conversion in process."""
+    assert stat.S_IMODE(socket_path.stat().st_mode) == 0o600
+
+    for validate in policy.VALIDATION_MODES:
+        assert client.request_policy(
+            [test_nodl_path], validate=validate, socket_path=socket_path
+        ) == _expected_policy(test_nodl_path, validate)
+
+
+def test_request_policy_cached(mocker, server, socket_path, test_nodl_path, tmp_path):
+    """Test that NoDL files are only parsed again after they changed."""
+    nodl_path = tmp_path / 'test.nodl.xml'
+    nodl_path.write_text(test_nodl_path.read_text())
+    parse_spy = mocker.spy(daemon, 'parse_nodl_files')
+
+    expected_policy = client.request_policy([nodl_path], socket_path=socket_path)
+    assert client.request_policy([nodl_path], socket_path=socket_path) == expected_policy
+    assert parse_spy.call_count == 1
+
+    nodl_path.write_text(test_nodl_path.read_text().replace('node_2', 'node_3'))
+    changed_policy = client.request_policy([nodl_path], socket_path=socket_path)
+    assert parse_spy.call_count == 2
+    assert '<enclave path="/node_3">' in changed_policy
+
+
+def test_request_policy_errors(server, socket_path, test_nodl_invalid_path, tmp_path):
+    """Test that conversion errors are reported to the client."""
+    with pytest.raises(client.DaemonError):
+        client.request_policy([test_nodl_invalid_path], socket_path=socket_path)
+
+    with pytest.raises(client.DaemonError):
+        client.request_policy([tmp_path / 'missing.nodl.xml'], socket_path=socket_path)
+
+    with pytest.raises(client.DaemonError, match='Unknown command'):
+        client._send_request({'command': 'unknown'}, socket_path)
+
+
+def test_request_policy_other_version(server, socket_path):
+    """Test that a daemon speaking another protocol version is ignored."""
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with connection:
+        connection.connect(str(socket_path))
+        connection.sendall(json.dumps({'version': 0, 'command': 'convert'}).encode() + b'\n')
+        response = json.loads(connection.makefile('rb').readline())
+    assert 'error' in response
+
+    response = {'version': client.PROTOCOL_VERSION + 1, 'policy': ''}
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(server, 'respond', lambda request: dict(response))
+        monkeypatch.setattr(daemon, 'PROTOCOL_VERSION', client.PROTOCOL_VERSION + 1)
+        assert client.request_policy([], socket_path=socket_path) is None
+
+
+def test_server_socket(socket_path):
+    """Test that stale sockets are replaced, and that sockets in use are not."""
+    stale_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale_socket.bind(str(socket_path))
+    stale_socket.close()
+
+    with daemon.PolicyServer(socket_path):
+        with pytest.raises(RuntimeError, match='already listening'):
+            daemon.PolicyServer(socket_path)
+    assert not socket_path.exists()
+
+
+def test_request_policy_timeout(socket_path):
+    """Test that a daemon not responding in time is skipped, and never blocks the client."""
+    listening_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with listening_socket:
+        listening_socket.bind(str(socket_path))
+        # accepted by the kernel, but never answered
+        listening_socket.listen(1)
+        assert client.request_policy([], socket_path=socket_path, timeout=0.1) is None
+
+
+def test_request_policy_broken_socket(socket_path):
+    """Test that a path which is not a socket is skipped."""
+    socket_path.write_text('')
+    assert client.request_policy([], socket_path=socket_path) is None
+
+
+def test_server_idle_client(server, socket_path, test_nodl_path, mocker):
+    """Test that a client not sending its request does not block the next ones."""
+    mocker.patch.object(daemon._RequestHandler, 'timeout', 0.1)
+    idle_connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with idle_connection:
+        idle_connection.connect(str(socket_path))
+        assert client.request_policy([test_nodl_path], socket_path=socket_path, timeout=5) == \
+            _expected_policy(test_nodl_path)
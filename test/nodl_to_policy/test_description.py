@@ -0,0 +1,66 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import nodl
+import nodl._index
+import nodl_to_policy.description as description
+import pytest
+
+
+@pytest.fixture
+def nodl_files(tmp_path, test_nodl_path):
+    """Write NoDL files describing differently named nodes."""
+    paths = []
+    for index in range(4):
+        path = tmp_path / f'file_{index}.nodl.xml'
+        path.write_text(
+            test_nodl_path.read_text().replace('node_', f'file_{index}_node_'))
+        paths.append(path)
+    return paths
+
+
+def test_constants():
+    # duplicated to avoid importing `nodl` to find NoDL files
+    assert description._NODL_FILE_EXTENSION == nodl._index._FILE_EXTENSION
+
+
+def test_find_nodl_files(tmp_path, nodl_files):
+    """Test that `find_nodl_files` expands directories and patterns without duplicates."""
+    (tmp_path / 'not_nodl.xml').write_text('<interface/>')
+
+    assert description.find_nodl_files([str(tmp_path)]) == nodl_files
+    assert description.find_nodl_files(
+        [str(nodl_files[2]), str(tmp_path / 'file_*.nodl.xml')]
+    ) == [nodl_files[2], nodl_files[0], nodl_files[1], nodl_files[3]]
+
+    with pytest.raises(FileNotFoundError):
+        description.find_nodl_files([str(tmp_path / 'missing.nodl.xml')])
+
+
+def test_parse_nodl_files_in_order(nodl_files):
+    """Test that parsing in worker processes merges nodes in input order."""
+    sequential_nodes = description.parse_nodl_files(nodl_files)
+    parallel_nodes = description.parse_nodl_files(nodl_files, jobs=3)
+
+    assert [node.name for node in sequential_nodes] == [
+        f'file_{index}_node_{number}' for index in range(4) for number in (1, 2)]
+    assert parallel_nodes == sequential_nodes
+
+
+def test_parse_nodl_files_invalid(nodl_files, empty_nodl_path):
+    """Test that parse errors name the offending file, also from worker processes."""
+    for jobs in (1, 2):
+        with pytest.raises(nodl.errors.NoDLError) as e:
+            description.parse_nodl_files([nodl_files[0], empty_nodl_path], jobs=jobs)
+        assert str(empty_nodl_path) in str(e.value)
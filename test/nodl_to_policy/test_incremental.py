@@ -0,0 +1,115 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import nodl
+import nodl_to_policy.description as description
+import nodl_to_policy.incremental as incremental
+import nodl_to_policy.policy as policy
+import pytest
+
+
+@pytest.fixture
+def nodl_files(tmp_path, test_nodl_path):
+    """Write NoDL files, two of which describe a node with the same name."""
+    paths = []
+    for index in range(3):
+        path = tmp_path / f'file_{index}.nodl.xml'
+        path.write_text(
+            test_nodl_path.read_text().replace('node_2', f'file_{index}_node'))
+        paths.append(path)
+    # the same content under another name
+    (tmp_path / 'copy.nodl.xml').write_text(paths[0].read_text())
+    paths.append(tmp_path / 'copy.nodl.xml')
+    return paths
+
+
+@pytest.fixture
+def cache_directory(tmp_path):
+    return tmp_path / 'cache'
+
+
+def test_convert_nodl_files_incrementally(helpers, nodl_files, cache_directory):
+    """Test that cold and warm incremental conversions match a full conversion."""
+    expected_policy = policy.convert_to_policy(description.parse_nodl_files(nodl_files))
+
+    cold_policy = incremental.convert_nodl_files_incrementally(nodl_files, cache_directory)
+    assert helpers.xml_trees_equal(cold_policy, expected_policy)
+
+    warm_policy = incremental.convert_nodl_files_incrementally(nodl_files, cache_directory)
+    assert helpers.xml_trees_equal(warm_policy, expected_policy)
+
+
+def test_convert_nodl_files_incrementally_changed(
+    mocker, helpers, nodl_files, cache_directory
+):
+    """Test that only files whose content changed are parsed again."""
+    incremental.convert_nodl_files_incrementally(nodl_files, cache_directory)
+    parse_mock = mocker.patch('nodl.parse', wraps=nodl.parse)
+
+    incremental.convert_nodl_files_incrementally(nodl_files, cache_directory)
+    assert not parse_mock.call_count
+
+    nodl_files[1].write_text(nodl_files[1].read_text().replace('chatter', 'gossip'))
+    changed_policy = incremental.convert_nodl_files_incrementally(nodl_files, cache_directory)
+    assert [call.kwargs['path'] for call in parse_mock.call_args_list] == [nodl_files[1]]
+
+    expected_policy = policy.convert_to_policy(description.parse_nodl_files(nodl_files))
+    assert helpers.xml_trees_equal(changed_policy, expected_policy)
+
+
+def test_convert_nodl_files_incrementally_corrupt_cache(
+    helpers, nodl_files, cache_directory
+):
+    """Test that unreadable fragments are regenerated."""
+    incremental.convert_nodl_files_incrementally(nodl_files, cache_directory)
+    for fragment_path in cache_directory.rglob('*.enclaves.xml'):
+        fragment_path.write_text('<enclaves')
+
+    expected_policy = policy.convert_to_policy(description.parse_nodl_files(nodl_files))
+    assert helpers.xml_trees_equal(
+        incremental.convert_nodl_files_incrementally(nodl_files, cache_directory),
+        expected_policy)
+
+
+def test_convert_nodl_files_incrementally_invalid(nodl_files, empty_nodl_path, cache_directory):
+    """Test that invalid files are reported, and not cached."""
+    for _ in range(2):
+        with pytest.raises(nodl.errors.NoDLError):
+            incremental.convert_nodl_files_incrementally(
+                [nodl_files[0], empty_nodl_path], cache_directory)
+
+
+def test_convert_nodl_files_incrementally_evict(helpers, nodl_files, cache_directory):
+    """Test that the least recently used fragments are removed once the cache is too large."""
+    incremental.convert_nodl_files_incrementally(nodl_files[:1], cache_directory)
+    first_fragment_path = next(cache_directory.rglob('*.enclaves.xml'))
+    os.utime(str(first_fragment_path), ns=(0, 0))
+    fragment_size = first_fragment_path.stat().st_size
+
+    incremental.convert_nodl_files_incrementally(
+        nodl_files[1:3], cache_directory, max_size=2 * fragment_size)
+    fragment_paths = list(cache_directory.rglob('*.enclaves.xml'))
+    assert len(fragment_paths) == 2
+    assert first_fragment_path not in fragment_paths
+
+
+def test_convert_nodl_files_incrementally_unwritable_cache(helpers, nodl_files, tmp_path):
+    """Test that files are converted as usual if the cache directory cannot be used."""
+    (tmp_path / 'file').write_text('')
+    expected_policy = policy.convert_to_policy(description.parse_nodl_files(nodl_files))
+    assert helpers.xml_trees_equal(
+        incremental.convert_nodl_files_incrementally(nodl_files, tmp_path / 'file' / 'cache'),
+        expected_policy)
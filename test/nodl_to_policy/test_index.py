@@ -0,0 +1,106 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import ament_index_python
+import nodl_to_policy.index as index
+import pytest
+
+
+def _install_package(prefix, package_name, nodl_files=()):
+    """Register a package in the ament index of `prefix`, with NoDL files in its share."""
+    resource_directory = prefix / 'share' / 'ament_index' / 'resource_index' / 'packages'
+    resource_directory.mkdir(parents=True, exist_ok=True)
+    (resource_directory / package_name).write_text('')
+    share_directory = prefix / 'share' / package_name
+    share_directory.mkdir(parents=True, exist_ok=True)
+    (share_directory / 'package.xml').write_text('<package/>')
+    for nodl_file in nodl_files:
+        (share_directory / nodl_file).write_text('<interface version="1"/>')
+    return share_directory
+
+
+@pytest.fixture
+def prefixes(monkeypatch, tmp_path):
+    """Set up an underlay and an overlay prefix with a few packages."""
+    underlay = tmp_path / 'underlay'
+    overlay = tmp_path / 'overlay'
+    _install_package(underlay, 'pkg_a', ['a.nodl.xml'])
+    _install_package(underlay, 'pkg_b')
+    _install_package(overlay, 'pkg_c', ['c_2.nodl.xml', 'c_1.nodl.xml'])
+    monkeypatch.setenv('AMENT_PREFIX_PATH', os.pathsep.join([str(overlay), str(underlay)]))
+    return overlay, underlay
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return tmp_path / 'cache' / 'nodl_files.json'
+
+
+def test_find_package_nodl_files(prefixes, cache_path):
+    """Test that every package's NoDL files are found, or only those of requested packages."""
+    overlay, underlay = prefixes
+    assert index.find_package_nodl_files(cache_path=cache_path) == [
+        underlay / 'share' / 'pkg_a' / 'a.nodl.xml',
+        overlay / 'share' / 'pkg_c' / 'c_1.nodl.xml',
+        overlay / 'share' / 'pkg_c' / 'c_2.nodl.xml',
+    ]
+    assert index.find_package_nodl_files(['pkg_b'], cache_path=cache_path) == []
+    assert index.find_package_nodl_files(['pkg_c', 'pkg_a'], cache_path=cache_path) == [
+        overlay / 'share' / 'pkg_c' / 'c_1.nodl.xml',
+        overlay / 'share' / 'pkg_c' / 'c_2.nodl.xml',
+        underlay / 'share' / 'pkg_a' / 'a.nodl.xml',
+    ]
+
+    with pytest.raises(ament_index_python.PackageNotFoundError):
+        index.find_package_nodl_files(['missing'], cache_path=cache_path)
+
+
+def test_find_package_nodl_files_cached(mocker, prefixes, cache_path):
+    """Test that the index is only crawled again when prefixes or share directories change."""
+    overlay, _ = prefixes
+    crawl_mock = mocker.patch('nodl_to_policy.index._crawl_index', wraps=index._crawl_index)
+
+    first_files = index.find_package_nodl_files(cache_path=cache_path)
+    assert index.find_package_nodl_files(cache_path=cache_path) == first_files
+    assert crawl_mock.call_count == 1
+
+    # adding a NoDL file to an installed package invalidates the cache
+    (overlay / 'share' / 'pkg_c' / 'c_3.nodl.xml').write_text('<interface version="1"/>')
+    os.utime(overlay / 'share' / 'pkg_c', ns=(0, 1))
+    assert len(index.find_package_nodl_files(cache_path=cache_path)) == len(first_files) + 1
+    assert crawl_mock.call_count == 2
+
+    # so does installing a new package
+    _install_package(overlay, 'pkg_d', ['d.nodl.xml'])
+    os.utime(overlay / 'share' / 'ament_index' / 'resource_index' / 'packages', ns=(0, 1))
+    assert index.find_package_nodl_files(['pkg_d'], cache_path=cache_path) == [
+        overlay / 'share' / 'pkg_d' / 'd.nodl.xml']
+    assert crawl_mock.call_count == 3
+
+
+def test_find_package_nodl_files_corrupt_cache(prefixes, cache_path):
+    """Test that an unreadable cache is rebuilt rather than trusted."""
+    cache_path.parent.mkdir(parents=True)
+    cache_path.write_text('{not json')
+    assert len(index.find_package_nodl_files(cache_path=cache_path)) == 3
+    assert len(index.find_package_nodl_files(cache_path=cache_path)) == 3
+
+
+def test_find_package_nodl_files_unwritable_cache(prefixes, tmp_path):
+    """Test that files are found even if the cache cannot be written."""
+    (tmp_path / 'file').write_text('')
+    cache_path = tmp_path / 'file' / 'nodl_files.json'
+    assert len(index.find_package_nodl_files(cache_path=cache_path)) == 3
@@ -0,0 +1,103 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from nodl_to_policy.mapping import (
+    assign_node,
+    get_enclave_directory,
+    get_node_assignment,
+    load_enclave_mapping,
+    NodeAssignment,
+    resolve_enclave_mapping,
+)
+import pytest
+
+
+def test_resolve_enclave_mapping():
+    """Test that shared enclaves and namespaces are resolved into one assignment per node."""
+    assert resolve_enclave_mapping({
+        'enclaves': {'/robot/perception': ['camera_driver', 'detector']},
+        'nodes': {
+            'camera_driver': {'namespace': '/robot'},
+            'detector': {'namespace': '/robot', 'enclave': '/robot/perception'},
+            'planner': {'namespace': '/robot'},
+            'logger': None,
+        },
+    }) == {
+        'camera_driver': NodeAssignment('/robot/perception', '/robot'),
+        'detector': NodeAssignment('/robot/perception', '/robot'),
+        'planner': NodeAssignment('/robot/planner', '/robot'),
+        'logger': NodeAssignment('/logger', '/'),
+    }
+    assert resolve_enclave_mapping({}) == {}
+
+
+@pytest.mark.parametrize('document', [
+    [],
+    {'unknown': {}},
+    {'enclaves': {'/a': ['node'], '/b': ['node']}},
+    {'enclaves': {'/a': ['node']}, 'nodes': {'node': {'enclave': '/b'}}},
+    {'enclaves': {'relative': ['node']}},
+    {'nodes': {'node': {'namespace': 'relative'}}},
+    {'nodes': {'node': {'unknown': '/'}}},
+    {'nodes': {'node': '/namespace'}},
+    {'enclaves': {'/': ['node']}},
+    {'enclaves': {'/../../etc/x': ['node']}},
+    {'enclaves': {'/robot//perception': ['node']}},
+    {'enclaves': {'/robot/': ['node']}},
+    {'enclaves': {'/robot': 'camera_driver'}},
+    {'enclaves': {'/robot': [['camera_driver']]}},
+    {'enclaves': {'/robot': ['..']}},
+    {'enclaves': ['/robot']},
+    {'nodes': ['camera_driver']},
+    {'nodes': {'node': {'namespace': '/robot/.'}}},
+    {'nodes': {'node': {'enclave': '/'}}},
+    {'nodes': {'node/other': {}}},
+])
+def test_resolve_enclave_mapping_invalid(document):
+    with pytest.raises(ValueError):
+        resolve_enclave_mapping(document)
+
+
+def test_load_enclave_mapping(tmp_path):
+    mapping_path = tmp_path / 'mapping.yaml'
+    mapping_path.write_text('enclaves:\n  /shared: [node_1, node_2]\n')
+    assert load_enclave_mapping(mapping_path) == {
+        'node_1': NodeAssignment('/shared', '/'), 'node_2': NodeAssignment('/shared', '/')}
+
+    mapping_path.write_text('')
+    assert load_enclave_mapping(mapping_path) == {}
+
+    mapping_path.write_text('enclaves: [')
+    with pytest.raises(ValueError):
+        load_enclave_mapping(mapping_path)
+
+
+def test_get_node_assignment():
+    assert get_node_assignment('node') == NodeAssignment('/node', '/')
+    assert get_node_assignment('node', namespace='/ns') == NodeAssignment('/ns/node', '/ns')
+    assert get_node_assignment('node', '/enclave', '/ns') == NodeAssignment('/enclave', '/ns')
+
+
+def test_get_enclave_directory(tmp_path):
+    assert get_enclave_directory(tmp_path, '/foo/bar') == tmp_path / 'foo' / 'bar'
+    for enclave_path in ('/', '/../../etc/x', '/foo/./bar', 'foo', ''):
+        with pytest.raises(ValueError):
+            get_enclave_directory(tmp_path, enclave_path)
+
+
+def test_assign_node():
+    enclave_mapping = {'node': NodeAssignment('/enclave', '/ns')}
+    assert assign_node('node', enclave_mapping) == NodeAssignment('/enclave', '/ns')
+    assert assign_node('other', enclave_mapping) == NodeAssignment('/other', '/')
+    assert assign_node('node') == NodeAssignment('/node', '/')
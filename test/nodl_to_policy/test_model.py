@@ -0,0 +1,131 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import nodl_to_policy.model as model
+import pytest
+import sros2
+
+
+@pytest.fixture
+def test_policy_model():
+    policy = model.Policy()
+    profile = policy.get_profile('/foo', '/', 'foo')
+    profile.add_expressions('topic', 'publish', 'ALLOW', ['chatter', 'rosout', 'chatter'])
+    profile.add_expressions('service', 'reply', 'ALLOW', ['~/get_parameters'])
+    policy.get_profile('/bar', '/', 'bar').add_expressions(
+        'topic', 'subscribe', 'ALLOW', ['chatter'])
+    return policy
+
+
+def test_policy_lookups(test_policy_model):
+    """Test that enclaves, profiles and permissions are only created once."""
+    assert list(test_policy_model.enclaves) == ['/foo', '/bar']
+    profile = test_policy_model.get_profile('/foo', '/', 'foo')
+    assert test_policy_model.get_enclave('/foo').get_profile('/', 'foo') is profile
+    assert list(profile.get_permissions('topic', 'publish', 'ALLOW')) == ['chatter', 'rosout']
+    assert len(profile.permissions) == 2
+
+
+def test_profile_interns_expressions():
+    """Test that equal expressions of different profiles share a single string."""
+    policy = model.Policy()
+    expressions = [''.join(['~/', 'get_parameters']) for _ in range(2)]
+    assert expressions[0] is not expressions[1]
+    for node, expression in zip(('foo', 'bar'), expressions):
+        policy.get_profile(f'/{node}', '/', node).add_expressions(
+            'service', 'reply', 'ALLOW', [expression])
+
+    first, second = (rule[-1] for rule in policy.rules())
+    assert first is second
+
+
+def test_policy_rules(test_policy_model):
+    """Test that rules are flattened into tuples, in insertion order."""
+    assert list(test_policy_model.rules()) == [
+        ('/foo', '/', 'foo', 'topic', 'publish', 'ALLOW', 'chatter'),
+        ('/foo', '/', 'foo', 'topic', 'publish', 'ALLOW', 'rosout'),
+        ('/foo', '/', 'foo', 'service', 'reply', 'ALLOW', '~/get_parameters'),
+        ('/bar', '/', 'bar', 'topic', 'subscribe', 'ALLOW', 'chatter'),
+    ]
+
+
+def test_policy_merge(test_policy_model):
+    """Test that merging policies adds missing rules only."""
+    other_policy = model.Policy()
+    other_policy.get_profile('/foo', '/', 'foo').add_expressions(
+        'topic', 'publish', 'ALLOW', ['rosout', 'gossip'])
+    other_policy.get_profile('/baz', '/', 'baz').add_expressions(
+        'action', 'call', 'ALLOW', ['fibonacci'])
+
+    expected_rules = list(test_policy_model.rules())
+    test_policy_model.merge(other_policy)
+
+    assert set(test_policy_model.rules()) == set(expected_rules) | set(other_policy.rules())
+    assert len(list(test_policy_model.rules())) == len(expected_rules) + 2
+    assert len(list(other_policy.rules())) == 3
+
+
+def test_policy_add_enclave(test_policy_model):
+    """Test that new enclaves are taken over, and others merged into the existing ones."""
+    new_enclave = model.Enclave('/baz')
+    test_policy_model.add_enclave(new_enclave)
+    assert test_policy_model.enclaves['/baz'] is new_enclave
+
+    existing_enclave = model.Enclave('/foo')
+    existing_enclave.get_profile('/', 'foo').add_expressions(
+        'topic', 'publish', 'ALLOW', ['rosout', 'gossip'])
+    test_policy_model.add_enclave(existing_enclave)
+    assert test_policy_model.enclaves['/foo'] is not existing_enclave
+    assert list(test_policy_model.get_profile('/foo', '/', 'foo').get_permissions(
+        'topic', 'publish', 'ALLOW')) == ['chatter', 'rosout', 'gossip']
+
+
+def test_policy_to_etree(test_policy_model):
+    """Test that the LXML representation of a policy is well-formed."""
+    policy = test_policy_model.to_etree()
+    assert policy.tag == 'policy'
+    assert policy.attrib['version'] == sros2.policy.POLICY_VERSION
+    assert [enclave.attrib['path'] for enclave in policy.find('enclaves')] == ['/foo', '/bar']
+
+    profile = policy.find('enclaves/enclave[@path="/foo"]/profiles/profile')
+    assert profile.attrib == {'ns': '/', 'node': 'foo'}
+    assert [permissions.tag for permissions in profile] == ['topics', 'services']
+    assert profile[0].attrib == {'publish': 'ALLOW'}
+    assert [topic.text for topic in profile[0]] == ['chatter', 'rosout']
+
+
+def test_policy_from_etree(helpers, test_policy_tree):
+    """Test that converting a policy tree to a model and back is lossless."""
+    policy = model.Policy.from_etree(test_policy_tree)
+    assert len(policy.enclaves) == 2
+    assert helpers.xml_trees_equal(policy.to_etree(), test_policy_tree)
+
+
+def test_diff(test_policy_model):
+    """Test that `diff` returns the rules added and removed, in policy order."""
+    new_policy = model.Policy()
+    new_policy.merge(test_policy_model)
+    assert model.diff(test_policy_model, new_policy) == ([], [])
+
+    del new_policy.get_profile('/foo', '/', 'foo').permissions[('topic', 'publish', 'ALLOW')]
+    new_policy.get_profile('/baz', '/', 'baz').add_expressions(
+        'action', 'call', 'ALLOW', ['fibonacci'])
+
+    additions, removals = model.diff(test_policy_model, new_policy)
+    assert additions == [('/baz', '/', 'baz', 'action', 'call', 'ALLOW', 'fibonacci')]
+    assert removals == [
+        ('/foo', '/', 'foo', 'topic', 'publish', 'ALLOW', 'chatter'),
+        ('/foo', '/', 'foo', 'topic', 'publish', 'ALLOW', 'rosout'),
+    ]
+    assert model.diff(new_policy, test_policy_model) == (removals, additions)
@@ -0,0 +1,127 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pathlib
+import shutil
+
+import nodl
+import nodl_to_policy.description as description
+from nodl_to_policy.nodl_cache import NoDLCache
+import pytest
+
+
+@pytest.fixture
+def nodl_cache(tmp_path):
+    return NoDLCache(tmp_path / 'cache')
+
+
+def test_nodl_cache_digest(nodl_cache, tmp_path, test_nodl_path):
+    """Test that files are keyed by content, and not by path."""
+    copy_path = tmp_path / 'copy.nodl.xml'
+    copy_path.write_bytes(test_nodl_path.read_bytes())
+    assert nodl_cache.get_digest(copy_path) == nodl_cache.get_digest(test_nodl_path)
+
+    copy_path.write_text(test_nodl_path.read_text().replace('node_1', 'node_3'))
+    assert nodl_cache.get_digest(copy_path) != nodl_cache.get_digest(test_nodl_path)
+
+
+def test_nodl_cache_load(nodl_cache, test_nodl_path):
+    """Test that stored nodes are loaded back, and that broken entries are ignored."""
+    nodes = nodl.parse(test_nodl_path)
+    digest = nodl_cache.get_digest(test_nodl_path)
+    assert nodl_cache.load(digest) is None
+
+    nodl_cache.store(digest, nodes)
+    assert nodl_cache.load(digest) == nodes
+    assert (nodl_cache.directory.stat().st_mode & 0o777) == 0o700
+
+    nodl_cache._get_entry_path(digest).write_bytes(b'not a pickle')
+    assert nodl_cache.load(digest) is None
+
+
+def test_nodl_cache_private(mocker, nodl_cache, test_nodl_path):
+    """Test that entries are not loaded from a directory others may have written to."""
+    nodes = nodl.parse(test_nodl_path)
+    digest = nodl_cache.get_digest(test_nodl_path)
+    nodl_cache.store(digest, nodes)
+
+    nodl_cache.directory.chmod(0o755)
+    assert nodl_cache.load(digest) is None
+    nodl_cache.directory.chmod(0o700)
+    assert nodl_cache.load(digest) == nodes
+
+    mocker.patch('os.getuid', return_value=os.getuid() + 1)
+    assert nodl_cache.load(digest) is None
+
+
+def test_nodl_cache_unwritable(mocker, tmp_path, test_nodl_path):
+    """Test that files are parsed as usual if the cache directory cannot be used."""
+    (tmp_path / 'file').write_text('')
+    nodl_cache = NoDLCache(tmp_path / 'file' / 'cache')
+    parse = mocker.spy(nodl, 'parse')
+
+    nodes = description.parse_nodl_files([test_nodl_path], nodl_cache=nodl_cache)
+    assert nodes == nodl.parse(test_nodl_path)
+    assert parse.call_count == 2
+    assert nodl_cache.evict() == 0
+
+
+def test_nodl_cache_parser_digest(monkeypatch, tmp_path, test_nodl_path):
+    """Test that entries are invalidated when the installed `nodl` package changes."""
+    package_directory = tmp_path / 'nodl'
+    shutil.copytree(str(pathlib.Path(nodl.__file__).parent), str(package_directory))
+    monkeypatch.setattr(nodl, '__file__', str(package_directory / '__init__.py'))
+    nodl_cache = NoDLCache(tmp_path / 'cache')
+    digest = nodl_cache.get_digest(test_nodl_path)
+    nodl_cache.store(digest, nodl.parse(test_nodl_path))
+
+    with open(str(package_directory / '__init__.py'), 'a') as f:
+        f.write('\n# patched\n')
+    nodl_cache = NoDLCache(tmp_path / 'cache')
+    assert nodl_cache.get_digest(test_nodl_path) != digest
+
+
+def test_nodl_cache_evict(nodl_cache, test_nodl_path):
+    """Test that the least recently used entries are removed first."""
+    nodes = nodl.parse(test_nodl_path)
+    for index, digest in enumerate(('aa1', 'bb2', 'cc3')):
+        nodl_cache.store(digest, nodes)
+        os.utime(str(nodl_cache._get_entry_path(digest)), ns=(index, index))
+    entry_size = nodl_cache._get_entry_path('aa1').stat().st_size
+
+    nodl_cache.load('aa1')
+    nodl_cache.max_size = 2 * entry_size
+    assert nodl_cache.evict() == 1
+    assert nodl_cache.load('bb2') is None
+    assert nodl_cache.load('aa1') == nodl_cache.load('cc3') == nodes
+
+    nodl_cache.max_size = 0
+    assert nodl_cache.evict() == 2
+
+
+def test_parse_nodl_files_cached(mocker, nodl_cache, tmp_path, test_nodl_path):
+    """Test that cached files are not parsed again, and that identical files are parsed once."""
+    copy_path = tmp_path / 'copy.nodl.xml'
+    copy_path.write_bytes(test_nodl_path.read_bytes())
+    parse = mocker.spy(nodl, 'parse')
+
+    nodl_file_paths = [test_nodl_path, copy_path]
+    nodes = description.parse_nodl_files(nodl_file_paths, nodl_cache=nodl_cache)
+    assert parse.call_count == 1
+    assert nodes == description.parse_nodl_files(nodl_file_paths)
+
+    parse.reset_mock()
+    assert description.parse_nodl_files(nodl_file_paths, nodl_cache=nodl_cache, jobs=2) == nodes
+    parse.assert_not_called()
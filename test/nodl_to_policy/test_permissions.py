@@ -0,0 +1,144 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import datetime
+
+from lxml import etree
+import nodl
+import nodl_to_policy.permissions as permissions
+import nodl_to_policy.policy as policy
+import pytest
+import sros2
+
+
+@pytest.fixture
+def test_policy(test_nodl_path):
+    return policy.convert_to_policy(nodl.parse(test_nodl_path))
+
+
+def _create_permission(enclave_policy, **parameters):
+    """Transform a single enclave policy, as `ros2 security create_permission` does."""
+    permissions_xsl = etree.XSLT(etree.parse(
+        str(sros2.policy.get_transport_template('dds', 'permissions.xsl'))))
+    return permissions_xsl(enclave_policy, **{
+        name: etree.XSLT.strparam(value) for name, value in parameters.items()})
+
+
+def test_create_permissions(helpers, test_policy):
+    """Test that each enclave is transformed as `sros2` transforms single enclave policies."""
+    expected_policy = copy.deepcopy(test_policy)
+    not_valid_before = datetime.datetime(2021, 1, 1)
+    not_valid_after = datetime.datetime(2031, 1, 1)
+
+    test_permissions = list(permissions.create_permissions(
+        test_policy, not_valid_before=not_valid_before, not_valid_after=not_valid_after,
+        allow_ros_discovery_topic=False))
+
+    assert [enclave_path for enclave_path, _ in test_permissions] == ['/node_1', '/node_2']
+    for enclave, (_, test_enclave_permissions) in zip(
+        expected_policy.iterfind('enclaves/enclave'), test_permissions
+    ):
+        enclave_policy = policy.init_policy()
+        enclave_policy.find('enclaves').append(copy.deepcopy(enclave))
+        expected_permissions = _create_permission(
+            enclave_policy, not_valid_before='2021-01-01T00:00:00',
+            not_valid_after='2031-01-01T00:00:00')
+        assert helpers.xml_trees_equal(
+            test_enclave_permissions.getroot(), expected_permissions.getroot())
+    # the policy is left untouched
+    assert helpers.xml_trees_equal(test_policy, expected_policy)
+
+
+def test_create_permissions_domain_id(monkeypatch, test_policy):
+    """Test that the domain ID defaults to `$ROS_DOMAIN_ID`."""
+    def domain_ids(**kwargs):
+        return {
+            domain_id.text
+            for _, enclave_permissions in permissions.create_permissions(test_policy, **kwargs)
+            for domain_id in enclave_permissions.iterfind('permissions/grant/*/domains/id')}
+
+    monkeypatch.delenv('ROS_DOMAIN_ID', raising=False)
+    assert domain_ids() == {'0'}
+    monkeypatch.setenv('ROS_DOMAIN_ID', '42')
+    assert domain_ids() == {'42'}
+    assert domain_ids(domain_id='7') == {'7'}
+
+
+def test_create_permissions_ros_discovery_topic(mocker, monkeypatch, test_policy):
+    """Test that "ros_discovery_info" is allowed for the RMW implementations relying on it."""
+    def topics(**kwargs):
+        return {
+            topic.text
+            for _, enclave_permissions in permissions.create_permissions(test_policy, **kwargs)
+            for topic in enclave_permissions.iterfind('.//topic')}
+
+    mocker.patch.dict('sys.modules', {'rclpy': None, 'rclpy.utilities': None})
+    monkeypatch.setenv('RMW_IMPLEMENTATION', 'rmw_fastrtps_cpp')
+    assert 'ros_discovery_info' in topics()
+    monkeypatch.setenv('RMW_IMPLEMENTATION', 'rmw_unknown')
+    assert 'ros_discovery_info' not in topics()
+    assert 'ros_discovery_info' in topics(allow_ros_discovery_topic=True)
+
+
+def test_create_permissions_compiled_once(test_policy):
+    """Test that the permissions stylesheet and schema are only compiled once."""
+    permissions._get_permissions_transform.cache_clear()
+    permissions._get_permissions_schema.cache_clear()
+
+    for _ in range(2):
+        assert len(list(permissions.create_permissions(test_policy))) == 2
+    assert permissions._get_permissions_transform.cache_info().misses == 1
+    assert permissions._get_permissions_schema.cache_info().misses == 1
+
+
+def test_create_permissions_invalid(test_policy):
+    """Test that invalid permissions raise, unless validation is skipped."""
+    with pytest.raises(RuntimeError):
+        list(permissions.create_permissions(test_policy, domain_id='invalid'))
+
+    assert len(list(permissions.create_permissions(
+        test_policy, domain_id='invalid', validate='none'))) == 2
+    with pytest.raises(ValueError):
+        list(permissions.create_permissions(test_policy, validate='invalid'))
+
+
+def test_write_permissions(test_policy, tmp_path):
+    """Test that permissions are laid out as in a keystore's enclaves directory."""
+    paths = permissions.write_permissions(test_policy, tmp_path)
+
+    assert paths == [
+        tmp_path / 'node_1' / 'permissions.xml', tmp_path / 'node_2' / 'permissions.xml']
+    for path in paths:
+        assert etree.parse(str(path)).getroot().tag == 'dds'
+
+
+def test_write_permissions_signed(test_policy, tmp_path):
+    """Test that enclaves with signed permissions are refused, unless overwriting them."""
+    signed_path = tmp_path / 'node_2' / 'permissions.p7s'
+    signed_path.parent.mkdir()
+    signed_path.write_text('signed')
+    with pytest.raises(FileExistsError):
+        permissions.write_permissions(test_policy, tmp_path)
+    assert not (tmp_path / 'node_1').exists()
+
+    assert len(permissions.write_permissions(test_policy, tmp_path, overwrite_signed=True)) == 2
+
+
+def test_write_permissions_outside(test_policy, tmp_path):
+    """Test that no file is written outside of the directory."""
+    test_policy.find('enclaves/enclave').set('path', '/../../etc/x')
+    with pytest.raises(ValueError):
+        permissions.write_permissions(test_policy, tmp_path / 'enclaves')
+    assert not list(tmp_path.iterdir())
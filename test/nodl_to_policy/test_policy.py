@@ -12,9 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
+import io
+import os
+
 from lxml import etree
 import nodl
 import nodl._parsing
+from nodl_to_policy.mapping import NodeAssignment
+import nodl_to_policy.model
 import nodl_to_policy.policy as policy
 import pytest
 import sros2
@@ -188,6 +194,22 @@ def test_add_permissions_exists(test_policy_tree):
     assert 'item' in [item.text for item in test_permission_items]
 
 
+def test_add_permissions_duplicates():
+    """Test that duplicate expressions, in the input or already in the tree, are skipped."""
+    test_empty_profile = etree.Element('profile', attrib={'ns': '/', 'node': 'foo'})
+    test_node = nodl.types.Node(name='foo', executable='prog')
+    for expressions in (['item', '/item', 'foo/bar'], ['item', '~/bar', 'other']):
+        policy.add_permissions(
+            profile=test_empty_profile,
+            node=test_node,
+            permission_type='topic',
+            rule_type='publish',
+            expressions=expressions)
+
+    test_permissions = test_empty_profile.find(path='topics[@publish="ALLOW"]')
+    assert [item.text for item in test_permissions] == ['item', '~/bar', 'other']
+
+
 def test_add_common_permissions_minimal(helpers, common_profile_tree):
     """Test addition of common permissions to an empty profile tree."""
     test_empty_profile = etree.Element('profile', attrib={'ns': '/', 'node': 'foo'})
@@ -213,6 +235,165 @@ def test_add_common_permissions_exists(helpers, test_policy_tree):
     )
 
 
+def test_policy_builder_get_profile(helpers):
+    """Test that `PolicyBuilder.get_profile` creates the same tags as `get_profile`, once."""
+    builder = policy.PolicyBuilder()
+    test_profile = builder.get_profile('foo')
+    assert builder.get_profile('foo') is test_profile
+    assert builder.get_enclave('/foo') is test_profile.getparent().getparent()
+
+    expected_policy = policy.init_policy()
+    policy.get_profile(expected_policy, node_name='foo')
+    assert helpers.xml_trees_equal(builder.policy, expected_policy)
+
+
+def test_policy_builder_get_permissions():
+    """Test that `PolicyBuilder.get_permissions` indexes permissions tags per profile."""
+    builder = policy.PolicyBuilder()
+    foo_profile = builder.get_profile('foo')
+    bar_profile = builder.get_profile('bar')
+
+    test_permissions = builder.get_permissions(foo_profile, 'topic', 'publish', 'ALLOW')
+    assert builder.get_permissions(foo_profile, 'topic', 'publish', 'ALLOW') is test_permissions
+    assert builder.get_permissions(foo_profile, 'topic', 'subscribe', 'ALLOW') is not \
+        test_permissions
+    assert builder.get_permissions(bar_profile, 'topic', 'publish', 'ALLOW') is not \
+        test_permissions
+    assert len(foo_profile) == 2
+    assert test_permissions.tag == 'topics'
+    assert test_permissions.attrib['publish'] == 'ALLOW'
+
+
+def test_policy_builder_add_permissions_duplicates():
+    """Test that `PolicyBuilder.add_permissions` skips expressions already added."""
+    builder = policy.PolicyBuilder()
+    test_node = nodl.types.Node(name='foo', executable='prog')
+    test_profile = builder.get_profile('foo')
+    builder.add_permissions(test_profile, test_node, 'topic', 'publish', ['item', '/item'])
+    builder.add_permissions(test_profile, test_node, 'topic', 'publish', ('foo/bar', 'item'))
+
+    test_permissions = builder.get_permissions(test_profile, 'topic', 'publish', 'ALLOW')
+    assert [item.text for item in test_permissions] == ['item', '~/bar']
+
+
+def test_policy_builder_add_node(helpers, test_nodl_path):
+    """Test that `PolicyBuilder.add_node` yields the same profile as the module functions."""
+    test_node = nodl.parse(test_nodl_path)[1]
+    builder = policy.PolicyBuilder()
+    builder.add_node(test_node)
+    builder.add_node(test_node)  # adding a node twice does not duplicate its permissions
+
+    expected_policy = policy.init_policy()
+    expected_profile = policy.get_profile(expected_policy, test_node.name)
+    policy.add_common_permissions(expected_profile, test_node)
+    subscribe_topics, publish_topics = policy._get_topics_by_role(test_node.topics)
+    reply_services, request_services = policy._get_services_by_role(test_node.services)
+    reply_actions, request_actions = policy._get_actions_by_role(test_node.actions)
+    for permission_type, rule_type, expressions in (
+        ('topic', 'subscribe', subscribe_topics),
+        ('topic', 'publish', publish_topics),
+        ('service', 'reply', reply_services),
+        ('service', 'request', request_services),
+        ('action', 'execute', reply_actions),
+        ('action', 'call', request_actions),
+    ):
+        policy.add_permissions(
+            expected_profile, test_node, permission_type, rule_type, expressions)
+
+    assert helpers.xml_trees_equal(builder.policy, expected_policy)
+
+
+def test_policy_builder_add_enclave(helpers, test_nodl_path):
+    """Test that `PolicyBuilder.add_enclave` moves new enclaves and merges existing ones."""
+    test_nodes = nodl.parse(test_nodl_path)
+    expected_policy = policy.convert_to_policy(test_nodes + test_nodes)
+
+    builder = policy.PolicyBuilder()
+    builder.add_node(test_nodes[0])
+    for enclave in list(policy.convert_to_policy(test_nodes).find('enclaves')):
+        builder.add_enclave(enclave)
+    assert helpers.xml_trees_equal(builder.policy, expected_policy)
+
+    # enclaves added as is are indexed as well
+    node_2_profile = builder.get_profile('node_2')
+    assert builder.get_enclave('/node_2').find('profiles/profile') is node_2_profile
+    builder.add_node(test_nodes[1])
+    assert helpers.xml_trees_equal(builder.policy, expected_policy)
+
+
+def test_policy_builder_existing_policy(helpers, test_nodl_path):
+    """Test that a builder reuses the tags of an existing policy."""
+    test_nodes = nodl.parse(test_nodl_path)
+    existing_policy = policy.convert_to_policy(test_nodes)
+    expected_policy = copy.deepcopy(existing_policy)
+
+    builder = policy.PolicyBuilder(etree.ElementTree(existing_policy))
+    assert builder.policy is existing_policy
+    for test_node in test_nodes:
+        builder.add_node(test_node)
+    assert helpers.xml_trees_equal(builder.policy, expected_policy)
+
+
+def test_policy_builder_existing_policy_combined_rules():
+    """Test that permissions tags of several rules are not added to, but count as present."""
+    existing_policy = etree.fromstring(
+        '<policy version="0.2.0"><enclaves><enclave path="/foo"><profiles>'
+        '<profile ns="/" node="foo">'
+        '<topics publish="ALLOW" subscribe="ALLOW"><topic>bar</topic></topics>'
+        '</profile></profiles></enclave></enclaves></policy>')
+    builder = policy.PolicyBuilder(existing_policy)
+    profile = builder.get_profile('foo')
+
+    builder.add_permissions(profile, nodl.types.Node(name='foo', executable='foo'), 'topic',
+                            'publish', ['bar', 'baz'])
+    combined_permissions, permissions = profile
+    assert [topic.text for topic in combined_permissions] == ['bar']
+    assert permissions.attrib == {'publish': 'ALLOW'}
+    assert [topic.text for topic in permissions] == ['baz']
+
+
+def test_convert_to_policy_existing_policy(helpers, mocker, test_nodl_path, tmp_path):
+    """Test that nodes are merged into an existing policy tree or file."""
+    test_nodes = nodl.parse(test_nodl_path)
+    expected_policy = policy.convert_to_policy(test_nodes)
+    get_profile_spy = mocker.spy(policy, 'get_profile')
+
+    existing_policy = policy.convert_to_policy(test_nodes[:1])
+    merged_policy = policy.convert_to_policy(test_nodes[1:], policy=existing_policy)
+    assert merged_policy is existing_policy
+    assert helpers.xml_trees_equal(merged_policy, expected_policy)
+    # profiles are looked up in the index built once, not searched for with XPath
+    assert not get_profile_spy.called
+
+    existing_policy_path = tmp_path / 'existing.policy.xml'
+    existing_policy_path.write_bytes(etree.tostring(policy.convert_to_policy(test_nodes[:1])))
+    for path in (existing_policy_path, str(existing_policy_path)):
+        merged_policy = policy.convert_to_policy(test_nodes[1:], policy=path)
+        assert helpers.xml_trees_equal(merged_policy, expected_policy)
+
+
+def test_convert_to_model(helpers, test_nodl_path):
+    """Test that `convert_to_model` returns the model of the `convert_to_policy` tree."""
+    test_nodes = nodl.parse(test_nodl_path)
+    test_model = policy.convert_to_model(test_nodes)
+
+    assert isinstance(test_model, nodl_to_policy.model.Policy)
+    assert helpers.xml_trees_equal(test_model.to_etree(), policy.convert_to_policy(test_nodes))
+
+
+def test_add_node_to_model(helpers, test_nodl_path):
+    """Test that nodes added to a policy model convert to the same tree as `PolicyBuilder`."""
+    test_nodes = nodl.parse(test_nodl_path)
+    test_model = nodl_to_policy.model.Policy()
+    builder = policy.PolicyBuilder()
+    for test_node in test_nodes + test_nodes:
+        test_profile = policy.add_node_to_model(test_model, test_node)
+        builder.add_node(test_node)
+        assert test_profile.node == test_node.name
+
+    assert helpers.xml_trees_equal(test_model.to_etree(), builder.policy)
+
+
 def test_convert_to_policy_invalid(empty_nodl_path):
     """Test NoDL conversion with an invalid path."""
     with pytest.raises(nodl.errors.NoDLError) as _:
@@ -232,6 +413,34 @@ def test_convert_to_policy(helpers, test_nodl_path, test_policy_tree):
     assert helpers.xml_trees_equal(test_converted_policy, test_policy_tree)
 
 
+def test_convert_to_policy_enclave_mapping(helpers, test_nodl_path):
+    """Test that nodes are placed in the namespaces and enclaves of an enclave mapping."""
+    test_nodes = nodl.parse(test_nodl_path)
+    enclave_mapping = {
+        'node_1': NodeAssignment('/shared', '/foo'),
+        'node_2': NodeAssignment('/shared', '/foo'),
+    }
+    test_policy = policy.convert_to_policy(test_nodes, enclave_mapping=enclave_mapping)
+
+    enclaves = test_policy.findall('enclaves/enclave')
+    assert [enclave.get('path') for enclave in enclaves] == ['/shared']
+    profiles = enclaves[0].findall('profiles/profile')
+    assert [(profile.get('ns'), profile.get('node')) for profile in profiles] == [
+        ('/foo', 'node_1'), ('/foo', 'node_2')]
+    # names within the namespace of a node are relative to it
+    topics = [topic.text for topic in profiles[1].iterfind('topics/topic')]
+    assert 'bar' in topics and '/foo/bar' not in topics
+
+    # building on an existing policy yields the same profiles
+    builder_policy = policy.convert_to_policy(
+        test_nodes, policy=policy.init_policy(), enclave_mapping=enclave_mapping)
+    assert helpers.xml_trees_equal(builder_policy, test_policy)
+
+    stream = io.BytesIO()
+    policy.stream_policy(test_nodes, stream, enclave_mapping=enclave_mapping)
+    assert helpers.xml_trees_equal(etree.fromstring(stream.getvalue()), test_policy)
+
+
 def test_print_policy(capfd, test_policy_tree):
     """
     Test the policy printing functionality.
@@ -245,6 +454,140 @@ def test_print_policy(capfd, test_policy_tree):
     assert out == etree.tostring(test_policy_tree, pretty_print=True).decode()
 
 
+def test_stream_policy(test_nodl_path):
+    """Test that a streamed policy is the same as a pretty printed converted policy."""
+    test_nodes = nodl.parse(test_nodl_path)
+    # nodes sharing an enclave are written as a single enclave
+    test_nodes = test_nodes + test_nodes[:1]
+    stream = io.BytesIO()
+    policy.stream_policy(test_nodes, stream)
+
+    assert stream.getvalue() == etree.tostring(
+        policy.convert_to_policy(test_nodes), pretty_print=True)
+
+
+def test_stream_policy_empty():
+    """Test that streaming an empty description yields an empty policy."""
+    stream = io.BytesIO()
+    policy.stream_policy([], stream)
+
+    streamed_policy = etree.fromstring(stream.getvalue())
+    assert streamed_policy.attrib['version'] == sros2.policy.POLICY_VERSION
+    assert len(streamed_policy.find('enclaves')) == 0
+
+
+@pytest.fixture
+def invalid_policy_tree(test_policy_tree):
+    """Return the test policy with 30 more enclaves, one of which has an unknown attribute."""
+    enclaves = test_policy_tree.find('enclaves')
+    for index in range(30):
+        enclave = copy.deepcopy(enclaves[0])
+        enclave.attrib['path'] = f'/extra_{index:02}'
+        enclaves.append(enclave)
+    # '/extra_01' is the 4th enclave, or the 2nd once sorted by path; neither is sampled
+    enclaves[3].attrib['unknown'] = 'attribute'
+    return test_policy_tree
+
+
+def test_write_policy(test_policy_tree):
+    """Test that every validation mode writes the same, transformed policy."""
+    outputs = []
+    for validate in policy.VALIDATION_MODES:
+        stream = io.StringIO()
+        policy.write_policy(test_policy_tree, stream, validate=validate)
+        outputs.append(stream.getvalue())
+
+    assert outputs[0] == etree.tostring(test_policy_tree, pretty_print=True).decode()
+    assert all(output == outputs[0] for output in outputs)
+
+    with pytest.raises(ValueError):
+        policy.write_policy(test_policy_tree, io.StringIO(), validate='some')
+
+
+def test_write_policy_invalid(invalid_policy_tree):
+    """Test that invalid policies are only rejected when invalid enclaves are validated."""
+    with pytest.raises(RuntimeError):
+        policy.write_policy(invalid_policy_tree, io.StringIO(), validate='full')
+
+    # with 32 enclaves, only every 4th one is validated
+    policy.write_policy(invalid_policy_tree, io.StringIO(), validate='sample')
+    policy.write_policy(invalid_policy_tree, io.StringIO(), validate='none')
+
+
+def _expand_policy(policy_text, base_path):
+    """Parse a policy and expand its includes, as `sros2.policy.load_policy` does."""
+    expanded_policy = etree.fromstring(policy_text, base_url=str(base_path))
+    expanded_policy.getroottree().xinclude()
+    return expanded_policy
+
+
+def test_write_policy_common_profile_href(test_nodl_path, tmp_path):
+    """Test that profiles include the common profile rather than list common permissions."""
+    test_policy = policy.convert_to_policy(nodl.parse(test_nodl_path))
+    # a hand-written profile missing some common permissions is left untouched
+    hand_written_profile = policy.get_profile(test_policy, 'hand_written')
+    etree.SubElement(
+        policy.get_permissions(hand_written_profile, 'topic', 'publish', 'ALLOW'),
+        'topic').text = 'rosout'
+
+    policy.write_common_profile(tmp_path / 'common' / 'node.xml')
+    stream = io.StringIO()
+    policy.write_policy(test_policy, stream, common_profile_href='common/node.xml')
+
+    written_policy = etree.fromstring(stream.getvalue())
+    includes = written_policy.findall('.//{http://www.w3.org/2003/XInclude}include')
+    assert [include.getparent().get('node') for include in includes] == ['node_1', 'node_2']
+    assert written_policy.find('.//profile[@node="node_1"]/topics/topic').text == 'chatter'
+    assert written_policy.find('.//profile[@node="hand_written"]/topics/topic').text == 'rosout'
+
+    expanded_policy = _expand_policy(stream.getvalue(), tmp_path / 'test.policy.xml')
+    for node_name in ('node_1', 'node_2'):
+        profile = expanded_policy.find(f'.//profile[@node="{node_name}"]')
+        services = {service.text for service in profile.iterfind('services/service')}
+        assert '~/get_parameters' in services
+        topics = {topic.text for topic in profile.iterfind('topics/topic')}
+        assert {'rosout', '/clock', '/parameter_events'} <= topics
+
+
+def test_stream_policy_common_profile_href(test_nodl_path):
+    """Test that streamed profiles include the common profile as written ones do."""
+    test_nodes = nodl.parse(test_nodl_path)
+    stream = io.BytesIO()
+    policy.stream_policy(test_nodes, stream, common_profile_href='node.xml')
+
+    streamed_policy = etree.fromstring(stream.getvalue())
+    includes = streamed_policy.findall('.//{http://www.w3.org/2003/XInclude}include')
+    assert [include.get('href') for include in includes] == ['node.xml', 'node.xml']
+    assert streamed_policy.find('.//profile[@node="node_1"]/topics/topic').text == 'chatter'
+
+
+def test_write_policy_compiles_schema_once(mocker, test_policy_tree):
+    """Test that the policy stylesheet and schema are only compiled once."""
+    policy._get_policy_transform.cache_clear()
+    policy._get_policy_schema.cache_clear()
+    schema_mock = mocker.patch('nodl_to_policy.policy.etree.XMLSchema', wraps=etree.XMLSchema)
+    transform_mock = mocker.patch('nodl_to_policy.policy.etree.XSLT', wraps=etree.XSLT)
+
+    for _ in range(3):
+        policy.write_policy(test_policy_tree, io.StringIO())
+
+    assert schema_mock.call_count == 1
+    assert transform_mock.call_count == 1
+    policy._get_policy_transform.cache_clear()
+    policy._get_policy_schema.cache_clear()
+
+
+def test_stream_policy_validate(mocker, test_nodl_path):
+    """Test that streamed enclaves are validated according to the validation mode."""
+    validate_mock = mocker.patch('nodl_to_policy.policy._validate_policy')
+    test_nodes = nodl.parse(test_nodl_path)
+
+    for validate, call_count in (('none', 0), ('sample', 2), ('full', 2)):
+        validate_mock.reset_mock()
+        policy.stream_policy(test_nodes, io.BytesIO(), validate=validate)
+        assert validate_mock.call_count == call_count
+
+
 def test__get_topics_by_role_no_topics():
     """Test that `_get_topics_by_role` returns empty lists for an empty input."""
     # empty dict of topics should return two empty dicts
@@ -328,3 +671,155 @@ def test__get_actions_by_role(mocker):
     policy._get_actions_by_role({})
     assert get_services_mock.call_count == 1
     assert not get_services_mock.call_args.args[0]
+
+
+def test__classify_interfaces(test_nodl_path):
+    """Test that `_classify_interfaces` buckets names like the `_get_*_by_role` helpers."""
+    for test_node in nodl.parse(test_nodl_path):
+        test_buckets = policy._classify_interfaces(test_node)
+        expected_buckets = (
+            policy._get_topics_by_role(test_node.topics)
+            + policy._get_services_by_role(test_node.services)
+            + policy._get_actions_by_role(test_node.actions))
+
+        assert len(test_buckets) == len(policy._NODE_PERMISSION_TYPES)
+        assert test_buckets == tuple(tuple(expected) for expected in expected_buckets)
+
+
+def test__classify_interfaces_role_values():
+    """Test that `_classify_interfaces` accepts role values as well as role enums."""
+    test_node = nodl.types.Node(
+        name='foo', executable='foo',
+        topics=[
+            nodl.types.Topic(name='bar', message_type='bartype', role='both'),
+            nodl.types.Topic(
+                name='baz', message_type='baztype', role=nodl.types.PubSubRole.PUBLISHER),
+        ],
+        services=[nodl.types.Service(name='fizz', service_type='fizztype', role='client')],
+        actions=[nodl.types.Action(name='buzz', action_type='buzztype', role='server')])
+
+    assert policy._classify_interfaces(test_node) == (
+        ('bar',), ('bar', 'baz'), (), ('fizz',), ('buzz',), ())
+
+
+def test__classify_interfaces_invalid_role():
+    """Test that `_classify_interfaces` raises for an invalid role."""
+    test_node = nodl.types.Node(
+        name='foo', executable='foo',
+        topics=[nodl.types.Topic(name='bar', message_type='bartype', role='invalid')])
+
+    with pytest.raises(ValueError):
+        policy._classify_interfaces(test_node)
+
+
+def test__expression_rewriter():
+    """Test that `_ExpressionRewriter` rewrites private, absolute and relative names."""
+    rewrite = policy._ExpressionRewriter('foo')
+    assert rewrite('foo/bar') == '~/bar'
+    assert rewrite('/bar') == 'bar'
+    assert rewrite('/foo/bar') == 'foo/bar'
+    assert rewrite('bar') == 'bar'
+    assert rewrite('~/bar') == '~/bar'
+    assert rewrite('foobar') == 'foobar'
+
+
+def test__expression_rewriter_namespace():
+    """Test that `_ExpressionRewriter` makes names within the node's namespace relative."""
+    rewrite = policy._ExpressionRewriter('foo', '/ns/')
+    assert rewrite('foo/bar') == '~/bar'
+    assert rewrite('/ns/bar') == 'bar'
+    assert rewrite('/other/bar') == '/other/bar'
+    assert rewrite('bar') == 'bar'
+
+
+def test__expression_rewriter_memoized():
+    """Test that rewriters are compiled once per node and memoize rewritten names."""
+    policy._get_expression_rewriter.cache_clear()
+    rewrite = policy._get_expression_rewriter('foo')
+    assert policy._get_expression_rewriter('foo') is rewrite
+    assert policy._get_expression_rewriter('bar') is not rewrite
+
+    assert rewrite(''.join(['/', 'bar'])) is rewrite('/bar')
+
+
+def test__expression_rewriter_bounded(mocker):
+    """Test that the names memoized by a rewriter are bounded."""
+    mocker.patch.object(policy, '_MAX_MEMOIZED_EXPRESSIONS', 4)
+    rewrite = policy._ExpressionRewriter('foo')
+    for index in range(10):
+        assert rewrite(f'foo/name_{index}') == f'~/name_{index}'
+    assert len(rewrite._expressions) <= 4
+
+
+def test_write_enclave_policies(helpers, test_nodl_path, tmp_path):
+    """Test that each enclave is written to a policy file of its own."""
+    test_policy = policy.convert_to_policy(nodl.parse(test_nodl_path))
+    stream = io.StringIO()
+    policy.write_policy(test_policy, stream)
+    expected_enclaves = etree.fromstring(stream.getvalue()).find('enclaves')
+
+    paths = policy.write_enclave_policies(test_policy, tmp_path / 'policies', jobs=2)
+
+    assert paths == [
+        tmp_path / 'policies' / 'node_1.policy.xml', tmp_path / 'policies' / 'node_2.policy.xml']
+    for path, expected_enclave in zip(paths, expected_enclaves):
+        enclave_policy = etree.parse(str(path)).getroot()
+        assert enclave_policy.attrib == {'version': sros2.policy.POLICY_VERSION}
+        assert len(enclave_policy.find('enclaves')) == 1
+        assert helpers.xml_trees_equal(
+            enclave_policy.find('enclaves/enclave'), expected_enclave)
+    # the generated policy is left untouched
+    assert len(test_policy.find('enclaves')) == 2
+
+
+def test_write_enclave_policies_invalid(invalid_policy_tree, tmp_path):
+    """Test that no file is written if the policy of an enclave is invalid."""
+    with pytest.raises(RuntimeError):
+        policy.write_enclave_policies(invalid_policy_tree, tmp_path)
+    assert not list(tmp_path.iterdir())
+
+    with pytest.raises(ValueError):
+        policy.write_enclave_policies(invalid_policy_tree, tmp_path, validate='invalid')
+
+
+def test_write_enclave_policies_mode(test_nodl_path, tmp_path):
+    """Test that policy files and the common profile are readable by others, as by `open`."""
+    test_policy = policy.convert_to_policy(nodl.parse(test_nodl_path))
+    common_profile = tmp_path / 'node.xml'
+    previous_umask = os.umask(0o022)
+    try:
+        policy.write_common_profile(common_profile)
+        paths = policy.write_enclave_policies(
+            test_policy, tmp_path / 'policies', common_profile=common_profile)
+    finally:
+        os.umask(previous_umask)
+    for path in paths + [common_profile]:
+        assert path.stat().st_mode & 0o777 == 0o644
+
+
+def test_write_enclave_policies_outside(test_nodl_path, tmp_path):
+    """Test that no file is written outside of the directory, nor for the root enclave."""
+    test_policy = policy.convert_to_policy(nodl.parse(test_nodl_path))
+    for enclave_path in ('/../../etc/x', '/'):
+        test_policy.find('enclaves/enclave').set('path', enclave_path)
+        with pytest.raises(ValueError):
+            policy.write_enclave_policies(test_policy, tmp_path / 'policies')
+    assert not list(tmp_path.iterdir())
+
+
+def test_write_enclave_policies_common_profile(test_nodl_path, tmp_path):
+    """Test that enclave policies include the common profile relative to their own path."""
+    test_policy = policy.convert_to_policy(
+        nodl.parse(test_nodl_path),
+        enclave_mapping={'node_1': NodeAssignment('/robot/node_1', '/robot')})
+    common_profile = tmp_path / 'node.xml'
+    policy.write_common_profile(common_profile)
+
+    paths = policy.write_enclave_policies(
+        test_policy, tmp_path / 'policies', common_profile=common_profile)
+
+    for path, href in zip(paths, ('../../node.xml', '../node.xml')):
+        include = etree.parse(str(path)).find('.//{http://www.w3.org/2003/XInclude}include')
+        assert include.get('href') == href
+        expanded_policy = _expand_policy(path.read_bytes(), path)
+        assert expanded_policy.find('.//services/service[.="~/get_parameters"]') is not None
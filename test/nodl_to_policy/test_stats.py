@@ -0,0 +1,105 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+
+import nodl
+from nodl_to_policy import stats
+import nodl_to_policy.policy as policy
+import pytest
+
+
+def test_stats_phase():
+    """Test that nested phases are measured, and counters added to the innermost phase."""
+    test_stats = stats.Stats()
+    test_stats.count('outside')
+    with test_stats.phase('outer') as outer_stats:
+        for _ in range(2):
+            with test_stats.phase('inner'):
+                test_stats.count('items', 3)
+        test_stats.count('items')
+
+    assert list(test_stats.phases) == ['outer', 'inner']
+    inner_stats = test_stats.phases['inner']
+    assert (outer_stats.calls, inner_stats.calls) == (1, 2)
+    assert outer_stats.wall_time >= inner_stats.wall_time > 0
+    assert (outer_stats.counters, inner_stats.counters) == ({'items': 1}, {'items': 6})
+    assert test_stats.counters == {'outside': 1}
+
+    stream = io.StringIO()
+    test_stats.write_json(stream)
+    assert json.loads(stream.getvalue()) == test_stats.to_dict()
+    assert test_stats.to_dict()['phases']['inner']['counters'] == {'items': 6}
+    table = test_stats.format_table().splitlines()
+    assert [line.split()[0] for line in table[1:]] == ['outer', 'inner']
+    assert table[2].endswith('items=6')
+
+
+def test_collect_stats():
+    """Test that phases are only measured within `collect_stats`."""
+    with stats.measure_phase('ignored'):
+        stats.add_to_counter('ignored')
+    assert stats.get_active_stats() is None
+
+    with stats.collect_stats() as outer_stats:
+        with stats.collect_stats() as inner_stats:
+            with stats.measure_phase('inner'):
+                stats.add_to_counter('items')
+        assert stats.get_active_stats() is outer_stats
+    assert stats.get_active_stats() is None
+    assert not outer_stats.phases
+    assert inner_stats.phases['inner'].counters == {'items': 1}
+
+
+@pytest.mark.skipif(not stats._CAN_MEASURE_PEAKS, reason='requires Python 3.9')
+def test_collect_stats_peak_memory():
+    """Test that the peak memory of each phase is its own, and included in outer phases."""
+    with stats.collect_stats() as test_stats:
+        with stats.measure_phase('outer'):
+            with stats.measure_phase('large'):
+                large = bytearray(8 * 2 ** 20)
+                del large
+            with stats.measure_phase('small'):
+                small = bytearray(2 ** 20)
+                del small
+
+    phases = test_stats.phases
+    assert phases['large'].peak_memory >= 8 * 2 ** 20
+    assert 2 ** 20 <= phases['small'].peak_memory < 8 * 2 ** 20
+    assert phases['outer'].peak_memory >= phases['large'].peak_memory
+
+
+def test_convert_to_policy_stats(test_nodl_path):
+    """Test that the phases of a conversion are reported to the stats passed to it."""
+    test_nodes = nodl.parse(test_nodl_path)
+    test_stats = stats.Stats()
+    test_policy = policy.convert_to_policy(test_nodes + test_nodes[:1], stats=test_stats)
+    assert stats.get_active_stats() is None
+
+    assert {
+        'convert', 'get_profile', 'add_common_permissions', 'add_permissions',
+        'classify_interfaces', 'build_tree',
+    } <= set(test_stats.phases)
+    assert test_stats.phases['get_profile'].calls == 3
+    added_expressions = sum(
+        test_stats.phases[phase].counters['expressions']
+        for phase in ('add_common_permissions', 'add_permissions'))
+    assert added_expressions == len(test_policy.findall('.//profile/*/*'))
+    # the permissions of the node added twice are all skipped the second time
+    assert test_stats.phases['add_common_permissions'].counters['duplicates_skipped'] == 16
+
+    with stats.collect_stats() as write_stats:
+        policy.write_policy(test_policy, io.StringIO())
+    assert list(write_stats.phases) == ['transform', 'validate', 'serialize']
@@ -0,0 +1,124 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+
+import nodl
+from nodl_to_policy import watch
+import nodl_to_policy.policy as policy
+import pytest
+
+
+_NODE_3 = '<interface version="1"><node name="{}" executable="third" /></interface>'
+
+
+@pytest.fixture
+def nodl_file_paths(tmp_path, test_nodl_path):
+    nodl_file_paths = [tmp_path / 'a.nodl.xml', tmp_path / 'b.nodl.xml']
+    nodl_file_paths[0].write_text(test_nodl_path.read_text())
+    nodl_file_paths[1].write_text(_NODE_3.format('node_3'))
+    return nodl_file_paths
+
+
+def _convert(nodl_file_paths):
+    return policy.convert_to_policy(
+        [node for path in nodl_file_paths for node in nodl.parse(path)])
+
+
+def test_policy_watcher(helpers, nodl_file_paths):
+    """Test that only the enclaves of the nodes of changed files are regenerated."""
+    watcher = watch.PolicyWatcher(nodl_file_paths)
+    assert helpers.xml_trees_equal(watcher.policy(), _convert(nodl_file_paths))
+    assert set(nodl_file_paths) <= set(watcher.paths)
+
+    nodl_file_paths[1].write_text(_NODE_3.format('node_4'))
+    assert watcher.update(nodl_file_paths[1:]) == (['/node_4'], ['/node_3'])
+    assert helpers.xml_trees_equal(watcher.policy(), _convert(nodl_file_paths))
+    assert [enclave.get('path') for enclave in watcher.policy(['/node_4']).find('enclaves')] == [
+        '/node_4']
+
+
+def test_policy_watcher_invalid(helpers, nodl_file_paths, empty_nodl_path):
+    """Test that nothing is updated if a changed file cannot be parsed."""
+    watcher = watch.PolicyWatcher(nodl_file_paths)
+    expected_policy = _convert(nodl_file_paths)
+
+    nodl_file_paths[1].write_text(empty_nodl_path.read_text())
+    with pytest.raises(nodl.errors.NoDLError):
+        watcher.update(nodl_file_paths[1:])
+    assert helpers.xml_trees_equal(watcher.policy(), expected_policy)
+
+
+def test_policy_watcher_common_profile(mocker, nodl_file_paths):
+    """Test that all enclaves are regenerated when the common profile changes."""
+    reload_common_profile = mocker.spy(watch, 'reload_common_profile')
+    watcher = watch.PolicyWatcher(nodl_file_paths)
+    common_profile_path = watcher.paths[len(nodl_file_paths)]
+
+    assert watcher.update([common_profile_path]) == (['/node_1', '/node_2', '/node_3'], [])
+    reload_common_profile.assert_called_once()
+
+
+@pytest.mark.parametrize('poll_interval', [None, 0.01])
+def test_observe(nodl_file_paths, poll_interval):
+    """Test that changed files are reported, whether replaced or written in place."""
+    changes = watch.observe(nodl_file_paths, poll_interval)
+
+    def edit():
+        nodl_file_paths[0].write_text('')
+        replacement_path = nodl_file_paths[1].with_suffix('.tmp')
+        replacement_path.write_text(_NODE_3.format('node_4'))
+        replacement_path.replace(nodl_file_paths[1])
+
+    timer = threading.Timer(0.1, edit)
+    timer.start()
+    try:
+        changed_paths = next(changes)
+        if len(changed_paths) < 2:
+            changed_paths |= next(changes)
+    finally:
+        timer.join()
+        changes.close()
+    assert changed_paths == set(nodl_file_paths)
+
+
+@pytest.mark.parametrize('poll_interval', [None, 0.01])
+def test_observe_symlinks(nodl_file_paths, poll_interval, tmp_path):
+    """Test that files changed through a link to them are reported, e.g. installed symlinks."""
+    link_path = tmp_path / 'install' / 'a.nodl.xml'
+    link_path.parent.mkdir()
+    link_path.symlink_to(nodl_file_paths[0])
+    changes = watch.observe([link_path], poll_interval)
+
+    timer = threading.Timer(0.1, nodl_file_paths[0].write_text, ('',))
+    timer.start()
+    try:
+        changed_paths = next(changes)
+    finally:
+        timer.join()
+        changes.close()
+    assert changed_paths == {link_path}
+
+
+def test_observe_inotify_overflow(nodl_file_paths):
+    """Test that all files are reported changed if inotify dropped events."""
+    read_fd, write_fd = os.pipe()
+    try:
+        os.write(write_fd, watch._IN_EVENT_HEADER.pack(-1, watch._IN_Q_OVERFLOW, 0, 0))
+        changes = watch._observe_inotify(read_fd, {}, nodl_file_paths)
+        assert next(changes) == set(nodl_file_paths)
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
@@ -13,12 +13,24 @@
 # limitations under the License.
 
 import argparse
+import json
 
+import ament_index_python
+from lxml import etree
 import nodl
+import nodl._index
+import nodl_to_policy.policy
 from nodl_to_policy.verb import convert
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def isolate_user_directories(monkeypatch, tmp_path):
+    """Keep a daemon the user may be running, and the user's caches, out of the tests."""
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+
+
 @pytest.fixture
 def verb() -> convert.ConvertVerb:
     return convert.ConvertVerb()
@@ -31,16 +43,22 @@ def parser(verb):
     return parser
 
 
+def test_constants():
+    # duplicated to avoid importing `nodl` and `nodl_to_policy.policy` with the verb
+    assert convert._NODL_FILE_EXTENSION == nodl._index._FILE_EXTENSION
+    assert convert._VALIDATION_MODES == nodl_to_policy.policy.VALIDATION_MODES
+
+
 def test_accepts_valid_nodl_path(mocker, parser, test_nodl_path, verb):
-    mocker.patch('nodl_to_policy.verb.convert.convert_to_policy')
-    mocker.patch('nodl_to_policy.verb.convert.print_policy')
+    mocker.patch('nodl_to_policy.policy.convert_to_policy')
+    mocker.patch('nodl_to_policy.policy.print_policy')
 
     args = parser.parse_args([str(test_nodl_path)])
     assert not verb.main(args=args)
 
 
 def test_fails_no_nodl_file(mocker, parser, tmp_path, verb):
-    mocker.patch('nodl_to_policy.verb.convert.pathlib.Path.cwd', return_value=tmp_path)
+    mocker.patch('nodl_to_policy.description.pathlib.Path.cwd', return_value=tmp_path)
 
     args = parser.parse_args([''])
     assert verb.main(args=args)
@@ -63,9 +81,489 @@ def test_accepts_valid_nodl(mocker, parser, test_nodl_path, verb):
 def test_fails_invalid_nodl(mocker, parser, test_nodl_invalid_path, verb):
     # Check that the NoDL parser throws with an invalid NoDL file
     mocker.patch(
-        'nodl_to_policy.verb.convert.nodl.parse',
+        'nodl.parse',
         side_effect=nodl.errors.InvalidNoDLError(mocker.MagicMock()),
     )
     args = parser.parse_args([str(test_nodl_invalid_path)])
 
     assert verb.main(args=args)
+
+
+@pytest.fixture
+def nodl_workspace(tmp_path, test_nodl_path):
+    """Lay out a workspace with NoDL files in two packages."""
+    for package_name in ('pkg_a', 'pkg_b'):
+        package_share = tmp_path / package_name / 'share'
+        package_share.mkdir(parents=True)
+        (package_share / f'{package_name}.nodl.xml').write_text(test_nodl_path.read_text())
+        (package_share / 'package.xml').write_text('<package/>')
+    return tmp_path
+
+
+def test_accepts_multiple_nodl_files(mocker, parser, nodl_workspace, verb):
+    convert_mock = mocker.patch('nodl_to_policy.policy.convert_to_policy')
+    mocker.patch('nodl_to_policy.policy.print_policy')
+
+    nodl_files = sorted(nodl_workspace.rglob('*.nodl.xml'))
+    args = parser.parse_args([str(path) for path in nodl_files])
+    assert not verb.main(args=args)
+
+    # nodes from every file are merged into a single conversion
+    assert convert_mock.call_count == 1
+    assert [node.name for node in convert_mock.call_args.args[0]] == [
+        'node_1', 'node_2', 'node_1', 'node_2']
+
+
+def test_accepts_directories_and_globs(mocker, parser, nodl_workspace, verb):
+    parse_mock = mocker.patch('nodl.parse', return_value=[])
+    mocker.patch('nodl_to_policy.policy.convert_to_policy')
+    mocker.patch('nodl_to_policy.policy.print_policy')
+
+    # both files have the same content, which the cache would only parse once
+    args = parser.parse_args([
+        '--no-nodl-cache',
+        str(nodl_workspace / 'pkg_b'),
+        str(nodl_workspace / '*' / 'share' / '*.nodl.xml'),
+    ])
+    assert not verb.main(args=args)
+
+    # files matched more than once are only parsed once, in input order
+    assert [call.kwargs['path'].name for call in parse_mock.call_args_list] == [
+        'pkg_b.nodl.xml', 'pkg_a.nodl.xml']
+
+
+def test_fails_unmatched_glob(parser, tmp_path, verb):
+    args = parser.parse_args([str(tmp_path / '*.nodl.xml')])
+    assert verb.main(args=args)
+
+
+def test_convert_multiple_files(capfd, parser, nodl_workspace, verb):
+    args = parser.parse_args([str(nodl_workspace)])
+    assert not verb.main(args=args)
+
+    out, _ = capfd.readouterr()
+    assert out.count('<enclave path="/node_1">') == 1
+    assert out.count('<enclave path="/node_2">') == 1
+
+
+def test_jobs_argument(mocker, parser, nodl_workspace, verb):
+    parse_mock = mocker.patch(
+        'nodl_to_policy.description.parse_nodl_files', return_value=[])
+    mocker.patch('nodl_to_policy.policy.convert_to_policy')
+    mocker.patch('nodl_to_policy.policy.print_policy')
+
+    args = parser.parse_args(['--jobs', '4', str(nodl_workspace)])
+    assert not verb.main(args=args)
+    assert parse_mock.call_args.kwargs['jobs'] == 4
+
+    with pytest.raises(SystemExit):
+        parser.parse_args(['--jobs', '0', str(nodl_workspace)])
+
+
+def test_accepts_packages(mocker, parser, nodl_workspace, verb):
+    nodl_files = sorted(nodl_workspace.rglob('*.nodl.xml'))
+    find_mock = mocker.patch(
+        'nodl_to_policy.index.find_package_nodl_files', return_value=nodl_files)
+    parse_mock = mocker.patch(
+        'nodl_to_policy.description.parse_nodl_files', return_value=[])
+    mocker.patch('nodl_to_policy.policy.convert_to_policy')
+    mocker.patch('nodl_to_policy.policy.print_policy')
+
+    args = parser.parse_args(['--all-packages'])
+    assert not verb.main(args=args)
+    assert find_mock.call_args.args == (None,)
+    assert parse_mock.call_args.args[0] == nodl_files
+
+    # files both given explicitly and exported by a package are only converted once
+    args = parser.parse_args([str(nodl_files[1]), '--package', 'pkg_a', 'pkg_b'])
+    assert not verb.main(args=args)
+    assert find_mock.call_args.args == (['pkg_a', 'pkg_b'],)
+    assert parse_mock.call_args.args[0] == [nodl_files[1], nodl_files[0]]
+
+
+def test_fails_unknown_package(mocker, parser, verb):
+    mocker.patch(
+        'nodl_to_policy.index.find_package_nodl_files',
+        side_effect=ament_index_python.PackageNotFoundError("package 'foo' not found"))
+
+    args = parser.parse_args(['--package', 'foo'])
+    assert verb.main(args=args)
+
+
+def test_fails_no_inputs(parser, verb):
+    args = parser.parse_args([])
+    assert verb.main(args=args)
+
+
+def test_incremental(mocker, capfd, parser, nodl_workspace, tmp_path, verb):
+    cache_directory = tmp_path / 'cache'
+    args = parser.parse_args([str(nodl_workspace)])
+    assert not verb.main(args=args)
+    expected_out, _ = capfd.readouterr()
+
+    args = parser.parse_args(
+        ['--incremental', '--cache-dir', str(cache_directory), str(nodl_workspace)])
+    for _ in range(2):
+        assert not verb.main(args=args)
+        out, _ = capfd.readouterr()
+        assert out == expected_out
+    assert any(cache_directory.iterdir())
+
+
+def test_stream(capfd, parser, nodl_workspace, verb):
+    args = parser.parse_args([str(nodl_workspace)])
+    assert not verb.main(args=args)
+    expected_out, _ = capfd.readouterr()
+
+    args = parser.parse_args(['--stream', str(nodl_workspace)])
+    assert not verb.main(args=args)
+    out, _ = capfd.readouterr()
+    assert etree.fromstring(out.encode()) is not None
+    assert out.count('<enclave ') == expected_out.count('<enclave ')
+
+    with pytest.raises(SystemExit):
+        parser.parse_args(['--stream', '--incremental', str(nodl_workspace)])
+
+
+def test_validate_argument(mocker, parser, test_nodl_path, verb):
+    print_mock = mocker.patch('nodl_to_policy.policy.print_policy')
+
+    for argv, validate in (
+        ([], 'full'),
+        (['--validate', 'sample'], 'sample'),
+        (['--no-validate'], 'none'),
+    ):
+        args = parser.parse_args(argv + [str(test_nodl_path)])
+        assert not verb.main(args=args)
+        assert print_mock.call_args.kwargs['validate'] == validate
+
+    with pytest.raises(SystemExit):
+        parser.parse_args(['--validate', 'sample', '--no-validate', str(test_nodl_path)])
+
+
+def test_daemon(mocker, capfd, parser, test_nodl_path, verb):
+    request_mock = mocker.patch(
+        'nodl_to_policy.verb.convert.request_policy', return_value='<policy/>\n')
+    convert_mock = mocker.patch('nodl_to_policy.policy.convert_to_policy')
+
+    args = parser.parse_args(['--validate', 'sample', str(test_nodl_path)])
+    assert not verb.main(args=args)
+    assert request_mock.call_args.args[0] == [test_nodl_path]
+    assert request_mock.call_args.kwargs['validate'] == 'sample'
+    assert not convert_mock.called
+    out, _ = capfd.readouterr()
+    assert out == '<policy/>\n'
+
+    request_mock.side_effect = convert.DaemonError('Failed to parse')
+    assert verb.main(args=args)
+    _, err = capfd.readouterr()
+    assert 'Failed to parse' in err
+
+
+def test_no_daemon(mocker, parser, test_nodl_path, tmp_path, verb):
+    request_mock = mocker.patch('nodl_to_policy.verb.convert.request_policy')
+    mocker.patch('nodl_to_policy.policy.print_policy')
+
+    for argv in (['--no-daemon'], ['--stream'], ['--incremental', '--cache-dir', str(tmp_path)]):
+        args = parser.parse_args(argv + [str(test_nodl_path)])
+        assert not verb.main(args=args)
+    assert not request_mock.called
+
+    # only options the daemon supports are listed, any other option converts in process
+    for argv in (['--compact'], ['--stats'], ['--common-profile', 'common.xml'], ['--no-daemon']):
+        assert not verb._is_daemon_supported(parser.parse_args(argv + [str(test_nodl_path)]))
+    assert verb._is_daemon_supported(parser.parse_args(
+        ['-j', '2', '--validate', 'sample', '--no-nodl-cache', str(test_nodl_path)]))
+
+    # without a running daemon, files are converted in process
+    request_mock.return_value = None
+    print_mock = mocker.patch('nodl_to_policy.policy.print_policy')
+    assert not verb.main(args=parser.parse_args([str(test_nodl_path)]))
+    assert request_mock.called
+    assert print_mock.called
+
+
+def test_diff(capfd, parser, test_nodl_path, tmp_path, verb):
+    existing_policy_path = tmp_path / 'existing.policy.xml'
+    assert not verb.main(args=parser.parse_args([str(test_nodl_path)]))
+    out, _ = capfd.readouterr()
+    existing_policy_path.write_text(out)
+
+    args = parser.parse_args(['--diff', str(existing_policy_path), str(test_nodl_path)])
+    assert not verb.main(args=args)
+    out, _ = capfd.readouterr()
+    assert not out
+
+    nodl_path = tmp_path / 'changed.nodl.xml'
+    nodl_path.write_text(test_nodl_path.read_text().replace('node_2', 'node_3'))
+    args = parser.parse_args(['--diff', str(existing_policy_path), str(nodl_path)])
+    assert not verb.main(args=args)
+    out, _ = capfd.readouterr()
+    lines = out.splitlines()
+    assert lines
+    assert all(line.startswith('- /node_2 /node_2 ') for line in lines if line[0] == '-')
+    assert all(line.startswith('+ /node_3 /node_3 ') for line in lines if line[0] == '+')
+    assert '- /node_2 /node_2 service reply=ALLOW ~/get_parameters' in lines
+    assert '+ /node_3 /node_3 service reply=ALLOW ~/get_parameters' in lines
+    assert len([line for line in lines if line[0] == '-']) == \
+        len([line for line in lines if line[0] == '+'])
+
+
+def test_diff_missing_policy(capfd, parser, test_nodl_path, tmp_path, verb):
+    args = parser.parse_args(['--diff', str(tmp_path / 'missing.policy.xml'), str(test_nodl_path)])
+    assert verb.main(args=args)
+    _, err = capfd.readouterr()
+    assert 'missing.policy.xml' in err
+
+
+def test_merge(capfd, parser, nodl_workspace, test_nodl_path, tmp_path, verb):
+    assert not verb.main(args=parser.parse_args([str(nodl_workspace)]))
+    expected_out, _ = capfd.readouterr()
+
+    existing_policy_path = tmp_path / 'existing.policy.xml'
+    existing_policy_path.write_text(expected_out)
+    args = parser.parse_args(['--merge', str(existing_policy_path), str(test_nodl_path)])
+    assert not verb.main(args=args)
+    out, _ = capfd.readouterr()
+    assert out == expected_out
+
+    nodl_path = tmp_path / 'other.nodl.xml'
+    nodl_path.write_text(test_nodl_path.read_text().replace('node_2', 'node_3'))
+    existing_policy_path.chmod(0o644)
+    args = parser.parse_args(
+        ['--merge', str(existing_policy_path), '--in-place', str(nodl_path)])
+    assert not verb.main(args=args)
+    out, _ = capfd.readouterr()
+    assert not out
+    merged_policy = existing_policy_path.read_text()
+    for node_name in ('node_1', 'node_2', 'node_3'):
+        assert merged_policy.count(f'<enclave path="/{node_name}">') == 1
+    # other users and tools can still read the policy
+    assert existing_policy_path.stat().st_mode & 0o777 == 0o644
+
+
+def test_merge_in_place_includes(capfd, monkeypatch, parser, test_nodl_path, tmp_path, verb):
+    monkeypatch.chdir(tmp_path)
+    common_profile = tmp_path / 'common' / 'node.xml'
+    args = parser.parse_args(['--common-profile', str(common_profile), str(test_nodl_path)])
+    assert not verb.main(args=args)
+    out, _ = capfd.readouterr()
+    existing_policy_path = tmp_path / 'existing.policy.xml'
+    existing_policy_path.write_text(out)
+
+    nodl_path = tmp_path / 'other.nodl.xml'
+    nodl_path.write_text(test_nodl_path.read_text().replace('node_2', 'node_3'))
+    args = parser.parse_args(
+        ['--merge', str(existing_policy_path), '--in-place', str(test_nodl_path), str(nodl_path)])
+    assert not verb.main(args=args)
+    merged_policy = etree.parse(str(existing_policy_path))
+    includes = merged_policy.findall('.//{http://www.w3.org/2003/XInclude}include')
+    assert [include.get('href') for include in includes] == ['common/node.xml'] * 2
+    for node_name in ('node_1', 'node_2', 'node_3'):
+        assert len(merged_policy.findall(f'.//enclave[@path="/{node_name}"]')) == 1
+    # the included expressions are not added to the profiles including them
+    profiles = {
+        profile.get('node'): etree.tostring(profile).decode()
+        for profile in merged_policy.iterfind('.//profile')}
+    assert '~/get_parameters' not in profiles['node_1']
+    assert '~/get_parameters' in profiles['node_3']
+
+    merged_policy.xinclude()
+    assert all(
+        '~/get_parameters' in etree.tostring(profile).decode()
+        for profile in merged_policy.iterfind('.//profile'))
+
+    args = parser.parse_args(
+        ['--merge', str(existing_policy_path), '--in-place', '--compact', str(test_nodl_path)])
+    assert verb.main(args=args)
+    _, err = capfd.readouterr()
+    assert 'XIncludes' in err
+
+
+def test_merge_fails(capfd, parser, test_nodl_path, tmp_path, verb):
+    args = parser.parse_args(['--in-place', str(test_nodl_path)])
+    assert verb.main(args=args)
+
+    args = parser.parse_args(
+        ['--merge', str(tmp_path / 'missing.policy.xml'), str(test_nodl_path)])
+    assert verb.main(args=args)
+    _, err = capfd.readouterr()
+    assert 'missing.policy.xml' in err
+
+    with pytest.raises(SystemExit):
+        parser.parse_args(['--merge', 'foo.policy.xml', '--stream', str(test_nodl_path)])
+
+
+def test_permissions_dir(capfd, parser, test_nodl_path, tmp_path, verb):
+    args = parser.parse_args(['--permissions-dir', str(tmp_path), str(test_nodl_path)])
+    assert not verb.main(args=args)
+    out, _ = capfd.readouterr()
+    assert etree.fromstring(out.encode()).tag == 'policy'
+    for node_name in ('node_1', 'node_2'):
+        assert etree.parse(str(tmp_path / node_name / 'permissions.xml')).getroot().tag == 'dds'
+
+    for argv in (['--stream'], ['--diff', str(tmp_path / 'existing.policy.xml')]):
+        args = parser.parse_args(
+            argv + ['--permissions-dir', str(tmp_path), str(test_nodl_path)])
+        assert verb.main(args=args)
+
+    (tmp_path / 'node_1' / 'permissions.p7s').write_text('signed')
+    args = parser.parse_args(['--permissions-dir', str(tmp_path), str(test_nodl_path)])
+    assert verb.main(args=args)
+    _, err = capfd.readouterr()
+    assert 'permissions.p7s' in err
+    args = parser.parse_args([
+        '--permissions-dir', str(tmp_path), '--overwrite-signed-permissions',
+        str(test_nodl_path)])
+    assert not verb.main(args=args)
+
+
+def test_output_dir(capfd, parser, nodl_workspace, tmp_path, verb):
+    output_dir = tmp_path / 'policies'
+    args = parser.parse_args(['--output-dir', str(output_dir), '-j', '2', str(nodl_workspace)])
+    assert not verb.main(args=args)
+    out, _ = capfd.readouterr()
+    assert not out
+    assert sorted(path.name for path in output_dir.iterdir()) == [
+        'node_1.policy.xml', 'node_2.policy.xml']
+
+    with pytest.raises(SystemExit):
+        parser.parse_args(['--output-dir', str(output_dir), '--stream', str(nodl_workspace)])
+
+
+def test_enclave_mapping(capfd, parser, test_nodl_path, tmp_path, verb):
+    mapping_path = tmp_path / 'mapping.yaml'
+    mapping_path.write_text('enclaves:\n  /shared: [node_1, node_2]\n')
+    args = parser.parse_args(['--enclave-mapping', str(mapping_path), str(test_nodl_path)])
+    assert not verb.main(args=args)
+    out, _ = capfd.readouterr()
+    enclaves = etree.fromstring(out.encode()).findall('enclaves/enclave')
+    assert [enclave.get('path') for enclave in enclaves] == ['/shared']
+
+    args = parser.parse_args(
+        ['--enclave-mapping', str(mapping_path), '--incremental', str(test_nodl_path)])
+    assert verb.main(args=args)
+
+    mapping_path.write_text('enclaves: {/shared: [node_1], /other: [node_1]}\n')
+    args = parser.parse_args(['--enclave-mapping', str(mapping_path), str(test_nodl_path)])
+    assert verb.main(args=args)
+    _, err = capfd.readouterr()
+    assert 'node_1' in err
+
+
+def test_compact(capfd, parser, test_nodl_path, verb):
+    args = parser.parse_args(['--compact', str(test_nodl_path)])
+    assert not verb.main(args=args)
+    out, _ = capfd.readouterr()
+    services = etree.fromstring(out.encode()).findall('.//services/service')
+    assert '~/*' in [service.text for service in services]
+
+    args = parser.parse_args(['--compact', '--stream', str(test_nodl_path)])
+    assert verb.main(args=args)
+    with pytest.raises(SystemExit):
+        parser.parse_args(['--compact', '--compact-budget', '-1', str(test_nodl_path)])
+
+
+def test_common_profile(capfd, monkeypatch, parser, test_nodl_path, tmp_path, verb):
+    monkeypatch.chdir(tmp_path)
+    common_profile = tmp_path / 'common' / 'node.xml'
+    args = parser.parse_args(['--common-profile', str(common_profile), str(test_nodl_path)])
+    assert not verb.main(args=args)
+    out, _ = capfd.readouterr()
+    includes = etree.fromstring(out.encode()).findall(
+        './/{http://www.w3.org/2003/XInclude}include')
+    assert [include.get('href') for include in includes] == ['common/node.xml'] * 2
+    assert etree.parse(str(common_profile)).getroot().tag == 'profile'
+
+    args = parser.parse_args([
+        '--common-profile', str(common_profile), '--diff', str(tmp_path / 'existing.policy.xml'),
+        str(test_nodl_path)])
+    assert verb.main(args=args)
+
+    # the common names would be folded into patterns rather than included
+    args = parser.parse_args(
+        ['--common-profile', str(common_profile), '--compact', str(test_nodl_path)])
+    assert verb.main(args=args)
+    _, err = capfd.readouterr()
+    assert '--compact' in err
+
+
+def test_watch(mocker, parser, test_nodl_path, tmp_path, verb):
+    nodl_path = tmp_path / 'test.nodl.xml'
+    nodl_path.write_text(test_nodl_path.read_text())
+    output_dir = tmp_path / 'policies'
+
+    def observe(paths):
+        assert nodl_path in paths
+        nodl_path.write_text(test_nodl_path.read_text().replace('node_2', 'node_3'))
+        yield {nodl_path}
+
+    mocker.patch('nodl_to_policy.watch.observe', side_effect=observe)
+    args = parser.parse_args(['--output-dir', str(output_dir), '--watch', str(nodl_path)])
+    assert not verb.main(args=args)
+    assert sorted(path.name for path in output_dir.iterdir()) == [
+        'node_1.policy.xml', 'node_3.policy.xml']
+
+    args = parser.parse_args(['--watch', str(nodl_path)])
+    assert verb.main(args=args)
+
+
+def test_watch_write_errors(capfd, mocker, parser, test_nodl_path, tmp_path, verb):
+    nodl_path = tmp_path / 'test.nodl.xml'
+    nodl_path.write_text(test_nodl_path.read_text())
+    output_dir = tmp_path / 'policies'
+
+    def observe(paths):
+        nodl_path.write_text(test_nodl_path.read_text().replace('node_2', 'node_3'))
+        yield {nodl_path}
+        nodl_path.write_text(test_nodl_path.read_text().replace('node_2', 'node_4'))
+        yield {nodl_path}
+
+    mocker.patch('nodl_to_policy.watch.observe', side_effect=observe)
+    write_enclave_policies = nodl_to_policy.policy.write_enclave_policies
+    results = [None, RuntimeError('invalid policy'), None]
+
+    def write_or_fail(*args, **kwargs):
+        error = results.pop(0)
+        if error is not None:
+            raise error
+        return write_enclave_policies(*args, **kwargs)
+
+    mocker.patch('nodl_to_policy.policy.write_enclave_policies', side_effect=write_or_fail)
+    args = parser.parse_args(['--output-dir', str(output_dir), '--watch', str(nodl_path)])
+    assert not verb.main(args=args)
+    _, err = capfd.readouterr()
+    assert 'invalid policy' in err
+    # the enclaves of the failed update are written along with the next one
+    assert sorted(path.name for path in output_dir.iterdir()) == [
+        'node_1.policy.xml', 'node_4.policy.xml']
+
+
+def test_stats(capfd, parser, test_nodl_path, tmp_path, verb):
+    stats_path = tmp_path / 'stats.json'
+    args = parser.parse_args(['--stats', '--stats-json', str(stats_path), str(test_nodl_path)])
+    assert not verb.main(args=args)
+    out, err = capfd.readouterr()
+    assert etree.fromstring(out.encode()).tag == 'policy'
+    assert 'get_profile' in err
+
+    stats = json.loads(stats_path.read_text())
+    assert stats['phases']['parse']['counters'] == {'cache_hits': 0, 'files': 1, 'nodes': 2}
+    assert {'convert', 'validate', 'serialize'} <= set(stats['phases'])
+
+
+def test_nodl_cache(capfd, mocker, parser, test_nodl_path, tmp_path, verb):
+    parse = mocker.spy(nodl, 'parse')
+    args = parser.parse_args(['--no-daemon', str(test_nodl_path)])
+    assert not verb.main(args=args)
+    assert parse.call_count == 1
+    assert any((tmp_path / 'cache' / 'nodl_to_policy' / 'nodes').iterdir())
+    out, _ = capfd.readouterr()
+
+    assert not verb.main(args=args)
+    assert parse.call_count == 1
+    assert capfd.readouterr().out == out
+
+    args = parser.parse_args(['--no-daemon', '--no-nodl-cache', str(test_nodl_path)])
+    assert not verb.main(args=args)
+    assert parse.call_count == 2
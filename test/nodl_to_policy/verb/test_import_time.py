@@ -0,0 +1,82 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+# Cumulative import time budget of a verb module, in microseconds
+IMPORT_TIME_BUDGET_US = 100000
+
+HEAVY_MODULES = ('argcomplete', 'lxml', 'nodl', 'sros2')
+
+VERB_MODULES = ('nodl_to_policy.verb.convert', 'nodl_to_policy.verb.serve')
+
+
+def _import_in_subprocess(module_name):
+    """Import a module in a fresh interpreter, returning its `-X importtime` report."""
+    # `ros2cli` is already imported by the time verbs are, and is not accounted for
+    return subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import ros2cli.verb; import {module_name}'],
+        env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)},
+        stderr=subprocess.PIPE, check=True, universal_newlines=True,
+    ).stderr
+
+
+def _parse_import_times(report):
+    """Map the name of each module imported to its cumulative import time."""
+    import_times = {}
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module_name = line[len('import time:'):].split('|')
+        import_times[module_name.strip()] = int(cumulative)
+    return import_times
+
+
+@pytest.mark.parametrize('module_name', VERB_MODULES)
+def test_verb_import_time(module_name):
+    """Test that verb modules neither import heavy modules nor exceed the time budget."""
+    import_times = _parse_import_times(_import_in_subprocess(module_name))
+
+    heavy_imports = sorted(
+        name for name in import_times if name.split('.')[0] in HEAVY_MODULES)
+    assert not heavy_imports
+    assert import_times[module_name] < IMPORT_TIME_BUDGET_US
+
+
+def test_daemon_request_imports(tmp_path):
+    """Test that converting through a daemon does not import `nodl`, `lxml` or the ament index."""
+    nodl_path = tmp_path / 'test.nodl.xml'
+    nodl_path.write_text('<interface version="1"/>')
+    script = (
+        'import argparse, sys\n'
+        'from nodl_to_policy.verb import convert\n'
+        "convert.request_policy = lambda *args, **kwargs: '<policy/>'\n"
+        'verb = convert.ConvertVerb()\n'
+        'parser = argparse.ArgumentParser()\n'
+        'verb.add_arguments(parser)\n'
+        f'assert not verb.main(args=parser.parse_args([{str(nodl_path)!r}]))\n'
+        "print(' '.join(sorted(name for name in sys.modules if name.split('.')[0] in "
+        f'{HEAVY_MODULES + ("ament_index_python",)!r})), file=sys.stderr)\n'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)},
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, universal_newlines=True)
+    assert result.stdout == '<policy/>'
+    assert not result.stderr.strip()
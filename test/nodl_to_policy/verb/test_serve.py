@@ -0,0 +1,48 @@
+# Copyright 2021 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+
+from nodl_to_policy.verb import serve
+import pytest
+
+
+@pytest.fixture
+def verb() -> serve.ServeVerb:
+    return serve.ServeVerb()
+
+
+@pytest.fixture
+def parser(verb):
+    parser = argparse.ArgumentParser()
+    verb.add_arguments(parser)
+    return parser
+
+
+def test_serve(mocker, monkeypatch, parser, tmp_path, verb):
+    serve_mock = mocker.patch('nodl_to_policy.daemon.serve')
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+
+    assert not verb.main(args=parser.parse_args([]))
+    assert serve_mock.call_args.args[0] == tmp_path / 'nodl_to_policy.sock'
+
+    assert not verb.main(args=parser.parse_args(['--socket', str(tmp_path / 'other.sock')]))
+    assert serve_mock.call_args.args[0] == tmp_path / 'other.sock'
+
+
+def test_serve_already_running(mocker, parser, tmp_path, verb):
+    mocker.patch(
+        'nodl_to_policy.daemon.serve', side_effect=RuntimeError('already listening'))
+
+    assert verb.main(args=parser.parse_args(['--socket', str(tmp_path / 'daemon.sock')]))